@@ -7,6 +7,17 @@ class ActionDQN:
         self.fee_rate = fee_rate
         self.action_map = {0: 'WAIT', 1: 'LONG', 2: 'SHORT', 3: 'CLOSE'}
 
+        # Bảng tra cho step_batch: [action_id, current_pos + 1] (giống hệt logic if/else ở step)
+        #                            pos=-1  pos=0  pos=1
+        self.new_pos_table = np.array([[-1, 0, 1],    # WAIT
+                                       [1, 1, 1],     # LONG
+                                       [-1, -1, -1],  # SHORT
+                                       [0, 0, 0]])    # CLOSE
+        self.fee_mult_table = np.array([[0, 0, 0],
+                                        [2, 1, 0],
+                                        [0, 1, 2],
+                                        [1, 0, 1]])
+
     def step(self, action_id, current_pos, current_price):
         new_pos = current_pos
         fee = 0.0
@@ -50,4 +61,14 @@ class ActionDQN:
         return new_pos, fee, executed
 
     def get_action_name(self, action_id):
-        return self.action_map.get(action_id, "UNKNOWN")
\ No newline at end of file
+        return self.action_map.get(action_id, "UNKNOWN")
+
+    def step_batch(self, action_ids, current_pos):
+        # Phiên bản vector hóa của step() cho N env cùng lúc (dùng trong BatchedTradingVecEnv)
+        col = current_pos.astype(np.int64) + 1
+        new_pos = self.new_pos_table[action_ids, col]
+        fee_mult = self.fee_mult_table[action_ids, col]
+        fee = fee_mult * self.fee_rate
+        executed = fee_mult > 0
+        return new_pos, fee, executed
+
@@ -4,9 +4,10 @@ import numpy as np
 class ActionPPO:
 
 
-    def __init__(self, fee_rate=0.0004, threshold=0.1):
+    def __init__(self, fee_rate=0.0004, threshold=0.1, min_delta=0.1):
         self.fee_rate = fee_rate
         self.threshold = threshold  # Vùng đệm để tránh nhiễu quanh 0
+        self.min_delta = min_delta  # Thay đổi tỷ trọng nhỏ hơn mức này -> giữ nguyên (HOLD)
 
     def step(self, action_val, current_pos_pct, current_price):
 
@@ -15,7 +16,7 @@ class ActionPPO:
             target_pct = 0.0
 
         delta = target_pct - current_pos_pct  # lượng giao dịch
-        if abs(delta) < 0.1:
+        if abs(delta) < self.min_delta:
             return current_pos_pct, 0.0, 'HOLD'
 
         fee_pct = abs(delta) * self.fee_rate # Phí giao dịch
@@ -24,3 +25,19 @@ class ActionPPO:
 
         return target_pct, fee_pct, trade_type
 
+    def step_batch(self, action_vals, current_pos_pcts):
+        # Phiên bản vector hóa của step() cho N env cùng lúc (dùng trong BatchedTradingVecEnv)
+        target_pct = np.clip(action_vals, -1.0, 1.0)
+        target_pct = np.where(np.abs(target_pct) < self.threshold, 0.0, target_pct)
+
+        delta = target_pct - current_pos_pcts
+        traded = np.abs(delta) >= self.min_delta  # False -> HOLD
+
+        new_pos = np.where(traded, target_pct, current_pos_pcts)
+        fee_pct = np.where(traded, np.abs(delta) * self.fee_rate, 0.0)
+
+        # Mã giao dịch: 0 HOLD, 1 BUY, -1 SELL
+        trade_type = np.where(traded, np.sign(delta), 0.0).astype(np.int8)
+
+        return new_pos, fee_pct, trade_type
+
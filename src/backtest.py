@@ -0,0 +1,210 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from env import BitcoinTradingEnv
+from data.columnar import is_dataset
+
+BLOWN_PENALTY = -100.0  # Giống env: cháy tài khoản (< 50% vốn) -> reward -100 và kết thúc
+
+
+class Backtester:
+    """
+    Chạy lại đúng logic của BitcoinTradingEnv cho cả chuỗi action (từ model hoặc từ luật) bằng mảng:
+    vị thế -> phí -> PnL -> net worth -> reward, không step từng nến qua gym.
+
+    actions: (T,) cho 1 chuỗi hoặc (B, T) cho B chuỗi chạy cùng lúc; action thứ t ứng với bước
+    current_step = start + t của env (start = 0: bắt đầu từ reset). Phần sau khi cháy tài khoản bị bỏ (env sẽ reset).
+    Vị thế, phí, số bước và reward khớp env; net worth tính bằng tích lũy nên chỉ lệch ở mức
+    làm tròn float (~1e-12 tương đối).
+    """
+
+    def __init__(self, close, trend, action_handler, reward_handler, model_type='PPO', initial_balance=10000,
+                 periods_per_year=24 * 365):
+        self.close = np.asarray(close, dtype=np.float64)
+        self.trend = np.asarray(trend)
+        self.action_handler = action_handler
+        self.reward_handler = reward_handler
+        self.model_type = model_type
+        self.initial_balance = initial_balance
+        self.periods_per_year = periods_per_year
+        self.max_steps = len(self.close) - 1  # Env kết thúc khi current_step >= len - 1
+
+        # Biến động giá mỗi bước (bước 0: giá trước = giá hiện tại)
+        prev = np.concatenate((self.close[:1], self.close[:-1]))
+        self.price_change_pct = (self.close - prev) / prev
+        self.prev_close = prev
+
+    @classmethod
+    def from_env(cls, env, **kwargs):
+        # Dùng chung mảng giá/trend và handler với env (cùng cấu hình phí, reward)
+        return cls(env._close, env._trend, env.action_handler, env.reward_handler,
+                   model_type=env.model_type, initial_balance=env.initial_balance, **kwargs)
+
+    def _positions(self, actions):
+        # Vị thế sau mỗi bước (B, T+1), cột 0 = vị thế lúc reset
+        B, T = actions.shape
+        pos = np.zeros((B, T + 1))
+
+        if self.model_type == 'DQN':
+            # WAIT giữ nguyên, LONG/SHORT/CLOSE đặt thẳng vị thế -> vị thế = action khác WAIT gần nhất
+            target = self.action_handler.new_pos_table[:, 1][actions]
+            last = np.where(actions != 0, np.arange(T), -1)
+            np.maximum.accumulate(last, axis=1, out=last)
+            pos[:, 1:] = np.where(last >= 0, np.take_along_axis(target, np.maximum(last, 0), axis=1), 0)
+            return pos
+
+        # PPO: vùng chết quanh 0 + chỉ đổi khi lệch >= min_delta (hysteresis) -> phụ thuộc vị thế trước,
+        # chạy 1 lượt theo thời gian, vector hóa theo B chuỗi. Tính bằng float32 như ActionPPO.step
+        # (action float32 -> delta float32), để so ngưỡng giống hệt env.
+        pos = pos.astype(np.float32)
+        target = np.clip(actions.astype(np.float32), -1.0, 1.0)
+        target[np.abs(target) < self.action_handler.threshold] = 0.0
+        min_delta = np.float32(self.action_handler.min_delta)
+        if B == 1:
+            p = np.float32(0.0)
+            row = pos[0]
+            for t, x in enumerate(target[0]):
+                if abs(x - p) >= min_delta:
+                    p = x
+                row[t + 1] = p
+        else:
+            p = np.zeros(B, dtype=np.float32)
+            for t in range(T):
+                x = target[:, t]
+                p = np.where(np.abs(x - p) >= min_delta, x, p)
+                pos[:, t + 1] = p
+        return pos
+
+    def _fees(self, actions, old_pos, new_pos):
+        if self.model_type == 'DQN':
+            return self.action_handler.fee_mult_table[actions, old_pos.astype(np.int64) + 1] * self.action_handler.fee_rate
+        return (np.abs(new_pos - old_pos) * np.float32(self.action_handler.fee_rate)).astype(np.float64)
+
+    def run(self, actions, start=0):
+        actions = np.asarray(actions)
+        if self.model_type == 'PPO' and actions.ndim >= 2 and actions.shape[-1] == 1:
+            actions = actions[..., 0]  # (T, 1) như action space của PPO
+        actions = np.atleast_2d(actions)
+        if self.model_type == 'DQN':
+            actions = actions.astype(np.int64)
+        B, T = actions.shape
+        if start + T > self.max_steps:
+            raise ValueError(f"Chuỗi action dài {T} từ bước {start} vượt số bước tối đa của dữ liệu ({self.max_steps})")
+        window = slice(start, start + T)
+
+        pos = self._positions(actions)
+        old_pos, new_pos = pos[:, :-1], pos[:, 1:]
+        fee = self._fees(actions, old_pos, new_pos)
+        pos_reward = new_pos  # PPO: giữ float32 như pos_tracker của env khi tính reward
+        old_pos, new_pos = old_pos.astype(np.float64), new_pos.astype(np.float64)
+
+        # Net worth: trừ phí rồi cộng PnL của vị thế cũ theo biến động giá của bước
+        pct = self.price_change_pct[window]
+        factor = (1.0 - fee) * (1.0 + old_pos * pct)
+        net_worth = self.initial_balance * np.cumprod(factor, axis=1)
+        nw_before = np.concatenate((np.full((B, 1), float(self.initial_balance)), net_worth[:, :-1]), axis=1)
+        fee_cost = nw_before * fee
+
+        # Dừng sớm khi cháy tài khoản (giống env); các bước sau đó không tính
+        blown = net_worth < self.initial_balance * 0.5
+        steps = np.where(blown.any(axis=1), blown.argmax(axis=1) + 1, T)
+        valid = np.arange(T) < steps[:, None]
+
+        max_net_worth = np.maximum(np.maximum.accumulate(net_worth, axis=1), self.initial_balance)
+        reward = self.reward_handler.calculate_batch(
+            net_worth=net_worth,
+            max_net_worth=max_net_worth,
+            current_price=self.close[window],
+            past_price=self.prev_close[window],
+            position=pos_reward,
+            trend_flag=self.trend[window]
+        )
+        reward = np.where(blown, BLOWN_PENALTY, reward)
+
+        result = {
+            'position': new_pos,
+            'fee': fee,
+            'net_worth': net_worth,
+            'reward': reward,
+            'steps': steps,
+            'valid': valid,
+        }
+        result['stats'] = self._stats(result, fee_cost, nw_before, max_net_worth, blown)
+        return result
+
+    def _stats(self, result, fee_cost, nw_before, max_net_worth, blown):
+        valid = result['valid']
+        steps = result['steps']
+        rows = np.arange(len(steps))
+        final = result['net_worth'][rows, steps - 1]
+
+        bar_ret = np.where(valid, result['net_worth'] / nw_before - 1.0, np.nan)
+        mean = np.nanmean(bar_ret, axis=1)
+        std = np.nanstd(bar_ret, axis=1, ddof=1) if bar_ret.shape[1] > 1 else np.zeros(len(steps))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = np.where(std > 0, mean / std * np.sqrt(self.periods_per_year), 0.0)
+
+        drawdown = np.where(valid, (max_net_worth - result['net_worth']) / max_net_worth, 0.0)
+        fee = np.where(valid, result['fee'], 0.0)
+
+        return pd.DataFrame({
+            'steps': steps,
+            'final_net_worth': final,
+            'total_return': final / self.initial_balance - 1.0,
+            'sharpe': sharpe,
+            'max_drawdown': drawdown.max(axis=1),
+            'turnover': fee.sum(axis=1) / self.action_handler.fee_rate,  # Tổng |thay đổi vị thế| (đơn vị vốn)
+            'n_trades': (fee > 0).sum(axis=1),
+            'fee_drag': np.where(valid, fee_cost, 0.0).sum(axis=1) / self.initial_balance,
+            'total_reward': np.where(valid, result['reward'], 0.0).sum(axis=1),
+            'blown': blown.any(axis=1),
+        })
+
+
+def data_kwargs(cfg):
+    # Dữ liệu trong config cho env (dataset dạng cột nếu có, không thì CSV) - giống train.py
+    dataset = cfg['paths'].get('dataset')
+    if dataset and is_dataset(dataset):
+        return {'dataset': dataset}
+    df_full = pd.read_csv(cfg['paths']['data_full'])
+    df_state = pd.read_csv(cfg['paths']['data_state'])
+    min_len = min(len(df_full), len(df_state))
+    return {'df_full': df_full.iloc[:min_len], 'df_state': df_state.iloc[:min_len]}
+
+
+def load_env(cfg, model_type=None, data=None):
+    return BitcoinTradingEnv(model_type=model_type or cfg['model_type'],
+                             initial_balance=cfg['env']['initial_balance'],
+                             fee_rate=cfg['env']['fee_rate'],
+                             **(data or data_kwargs(cfg)))
+
+
+def rule_actions(env, rule):
+    # Một vài chuỗi action theo luật để so sánh nhanh với model
+    T = env._last_step
+    if rule == 'hold':
+        return np.full(T, 1.0) if env.model_type == 'PPO' else np.where(np.arange(T) == 0, 1, 0)
+    if rule == 'trend':
+        # Long khi giá trên SMA200, đứng ngoài khi dưới
+        up = env._trend[:T] == 1.0
+        return up.astype(np.float64) if env.model_type == 'PPO' else np.where(up, 1, 3)
+    raise ValueError(f"Luật không hỗ trợ: {rule}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest vector hóa theo đúng logic env")
+    parser.add_argument("--actions", default=None, help="File .npy chứa action (T,) hoặc (B, T)")
+    parser.add_argument("--rule", default="trend", choices=["trend", "hold"], help="Dùng khi không có --actions")
+    parser.add_argument("--model-type", default=None, choices=["PPO", "DQN"])
+    args = parser.parse_args()
+
+    with open('../config.yaml', 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f)
+
+    env = load_env(cfg, args.model_type)
+    actions = np.load(args.actions) if args.actions else rule_actions(env, args.rule)
+    result = Backtester.from_env(env).run(actions)
+    print(result['stats'].to_string())
@@ -1,10 +1,15 @@
 from binance.um_futures import UMFutures  # <--- THAY ĐỔI: Dùng UMFutures thay vì CMFutures
 from binance.error import ClientError
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from decimal import Decimal, ROUND_DOWN
 from dotenv import load_dotenv
 import os
 import yaml
 from logging_tool import setup_logging
+from data.rate_limit import shared_scheduler, klines_weight, PRIORITY_ORDER, PRIORITY_LIVE
+from metrics import METRICS
 load_dotenv()
 with open("../config.yaml", "r", encoding="utf-8") as f:
     cfg = yaml.load(f, Loader=yaml.FullLoader)
@@ -16,6 +21,9 @@ SYMBOL = cfg["symbol"]
 LEVERAGE = cfg["leverage"]
 WINDOW_SIZE = cfg["env"]["window_size"]
 MAX_CAPITAL_USAGE = cfg["max_capital_usage"]
+FEE_RATE = cfg["env"]["fee_rate"]
+RECONCILE_SECONDS = cfg.get("live", {}).get("reconcile_seconds", 600)
+FILTERS_TTL = 24 * 3600  # Tải lại bộ lọc lệnh (exchangeInfo) mỗi ngày
 
 # MAINNET:
 # BASE_URL = "https://fapi.binance.com"
@@ -25,33 +33,299 @@ BASE_URL = "https://testnet.binancefuture.com"
 
 logger = setup_logging()
 
+# Weight theo endpoint của các hàm UMFutures bot dùng (theo tài liệu Binance); lệnh tính vào giới hạn số lệnh
+CLIENT_WEIGHTS = {
+    "klines": lambda kw: klines_weight(kw.get("limit", 500)),
+    "ticker_price": lambda kw: 1 if kw.get("symbol") else 2,
+    "account": 5,
+    "get_position_risk": 5,
+    "exchange_info": 1,
+    "change_leverage": 1,
+    "new_listen_key": 1,
+    "renew_listen_key": 1,
+    "time": 1,
+    "new_order": 0,
+}
+
+
+class ScheduledClient:
+    """
+    Bọc UMFutures: mọi lời gọi đi qua RequestScheduler dùng chung (weight, ưu tiên lệnh > dữ liệu,
+    đồng bộ header X-MBX-*, chặn khi 429/418, thử lại request dữ liệu). Kết quả giống hệt UMFutures.
+    """
+
+    def __init__(self, client, scheduler=None):
+        self.client = client
+        self.scheduler = scheduler or shared_scheduler()
+
+    def __getattr__(self, name):
+        fn = getattr(self.client, name)
+        if not callable(fn):
+            return fn
+        weight = CLIENT_WEIGHTS.get(name, 1)
+        is_order = name == "new_order"
+
+        def call(*args, **kwargs):
+            # Độ trễ mỗi endpoint (gồm chờ ngân sách weight + retry) và lỗi cuối cùng -> METRICS
+            start = time.perf_counter()
+            try:
+                result = self.scheduler.call(lambda: fn(*args, **kwargs),
+                                             weight=weight(kwargs) if callable(weight) else weight,
+                                             priority=PRIORITY_ORDER if is_order else PRIORITY_LIVE,
+                                             is_order=is_order)
+            except Exception as e:
+                METRICS.inc("api_errors_total", endpoint=name,
+                            status=getattr(e, "status_code", None) or type(e).__name__)
+                raise
+            finally:
+                METRICS.observe("api_request_ms", (time.perf_counter() - start) * 1000, endpoint=name)
+            if isinstance(result, dict) and "limit_usage" in result:
+                self.scheduler.update(result["limit_usage"])
+                return result["data"]
+            return result
+        return call
+
+
+def make_client(base_url=BASE_URL, pool_size=10):
+    # UMFutures qua scheduler dùng chung; pool_size: số kết nối keep-alive tối đa tới sàn (các executor dùng chung)
+    client = UMFutures(key=API_KEY, secret=API_SECRET, base_url=base_url,
+                       show_limit_usage=True)  # Trả kèm header weight cho scheduler
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    client.session.mount("https://", adapter)
+    client.session.mount("http://", adapter)
+    return ScheduledClient(client)
+
+
+class PositionLedger:
+    # Sổ vị thế cục bộ: cập nhật ngay từ kết quả khớp lệnh, không phải hỏi lại sàn
+    def __init__(self):
+        self.position_amt = 0.0
+        self.entry_price = 0.0
+        self.realized_pnl = 0.0
+        self.fees = 0.0
+
+    def reset(self, position_amt, entry_price):
+        self.position_amt = position_amt
+        self.entry_price = entry_price if position_amt != 0 else 0.0
+
+    def apply_fill(self, side, qty, price, fee_rate=FEE_RATE):
+        # Trả về thay đổi số dư ví (PnL đã chốt - phí)
+        signed_qty = qty if side == "BUY" else -qty
+        pos = self.position_amt
+        realized = 0.0
+
+        if pos == 0 or (pos > 0) == (signed_qty > 0):
+            # Mở mới / nhồi thêm -> giá vào lệnh trung bình
+            new_pos = pos + signed_qty
+            self.entry_price = (abs(pos) * self.entry_price + qty * price) / abs(new_pos)
+        else:
+            # Giảm / đóng / đảo chiều
+            closed_qty = min(qty, abs(pos))
+            realized = closed_qty * (price - self.entry_price) * (1 if pos > 0 else -1)
+            new_pos = pos + signed_qty
+            if abs(new_pos) < 1e-9:
+                new_pos = 0.0
+                self.entry_price = 0.0
+            elif (new_pos > 0) != (pos > 0):
+                self.entry_price = price  # Đảo chiều: phần dư mở ở giá khớp
+
+        fee = qty * price * fee_rate
+        self.position_amt = round(new_pos, 8)
+        self.realized_pnl += realized
+        self.fees += fee
+        return realized - fee
+
+    def unrealized_pnl(self, price):
+        return self.position_amt * (price - self.entry_price)
+
+
+class SymbolFilters:
+    # Bộ lọc khối lượng lệnh MARKET của 1 symbol (exchangeInfo): stepSize, minQty/maxQty, minNotional
+    def __init__(self, symbol_info):
+        f = {x['filterType']: x for x in symbol_info['filters']}
+        lot = f['LOT_SIZE']
+        market = f.get('MARKET_LOT_SIZE', lot)
+        self.step = Decimal(market['stepSize']) if Decimal(market['stepSize']) > 0 else Decimal(lot['stepSize'])
+        self.min_qty = max(Decimal(lot['minQty']), Decimal(market['minQty']))
+        self.max_qty = min(Decimal(lot['maxQty']), Decimal(market['maxQty']))
+        self.min_notional = Decimal(f['MIN_NOTIONAL']['notional']) if 'MIN_NOTIONAL' in f else Decimal(0)
+
+    def quantize(self, qty):
+        # Làm tròn 8 chữ số trước (bỏ sai số float32 của action, vd. 0.0089999996) rồi cắt xuống bội số stepSize
+        qty = Decimal(f"{abs(float(qty)):.8f}")
+        return (qty / self.step).to_integral_value(rounding=ROUND_DOWN) * self.step
+
+    def check(self, qty, price, reduce_only=False):
+        # -> (khối lượng hợp lệ, None) hoặc (None, lý do không đặt được lệnh)
+        qty = self.quantize(qty)
+        if qty < self.min_qty:
+            return None, f"qty {qty} < minQty {self.min_qty}"
+        if qty > self.max_qty:
+            qty = (self.max_qty / self.step).to_integral_value(rounding=ROUND_DOWN) * self.step
+        # Lệnh reduceOnly không bị giới hạn minNotional
+        if not reduce_only and qty * Decimal(str(price)) < self.min_notional:
+            return None, f"notional {float(qty) * price:.2f} < minNotional {self.min_notional}"
+        return qty, None
+
 
 class BinanceExecutor:
-    def __init__(self, symbol= SYMBOL , leverage=LEVERAGE, dqn_quantity=QUANTITY_DQN):
+    def __init__(self, symbol= SYMBOL , leverage=LEVERAGE, dqn_quantity=QUANTITY_DQN, base_url=BASE_URL, client=None,
+                 pool=None):
         self.symbol = symbol
         self.leverage = leverage
         self.dqn_quantity = dqn_quantity
         self.max_capital_usage = MAX_CAPITAL_USAGE
-        self.client = UMFutures(key=API_KEY,
-                                secret=API_SECRET,
-                                base_url=BASE_URL,)
+        self.client = client or make_client(base_url)  # Nhiều cặp có thể dùng chung 1 client (1 pool kết nối)
+
+        # Snapshot theo tick (giá) + sổ vị thế cục bộ; chỉ đối chiếu với sàn theo lịch hoặc khi nghi lệch
+        self.ledger = PositionLedger()
+        self.reconcile_seconds = RECONCILE_SECONDS
+        self.wallet_balance = 0.0
+        self.start_balance = None
+        self._snapshot = None
+        self._pending = None  # Snapshot đang tải nền (begin_tick(prefetch=True))
+        self._tick_price = None  # Giá của tick do phía gọi cung cấp (VD: 1 request ticker cho mọi cặp)
+        self._tick_boundary = None  # Thời điểm đóng nến (ms) của tick -> độ trễ nến đóng -> lệnh tới sàn
+        self._tick_t0 = None
+        self.tick_orders = []  # Lệnh đã gửi trong tick (thời gian, độ trễ) cho trace
+        self._filters = None
+        self._filters_at = 0.0
+        self._last_reconcile = 0.0
+        self._ledger_dirty = True  # Chưa đồng bộ lần nào
+
+        # Các request độc lập trong 1 tick (giá, positionRisk, exchangeInfo) chạy song song trên cùng
+        # session keep-alive của client. Task trên pool này không bao giờ chờ task khác của chính nó.
+        # pool: pool I/O dùng chung mà phía gọi đang chạy trên đó (multi_agent, song song theo cặp) -> executor
+        # không tạo luồng riêng, request trong tick gửi thẳng trên luồng gọi, chỉ việc nền không ai chờ lên pool
+        self._shared_pool = pool is not None
+        self._pool = pool or ThreadPoolExecutor(max_workers=4, thread_name_prefix="binance-io")
+        self._snapshot_pool = None  # 1 luồng cho snapshot tải nền (chờ các request trên _pool), tạo khi cần
+
+    def begin_tick(self, prefetch=False, price=None, boundary=None):
+        # Gọi đầu mỗi tick: snapshot của tick trước hết hạn.
+        # prefetch=True: tải snapshot tick này ở nền ngay (xem prefetch())
+        # price: giá đã có sẵn -> không gọi ticker riêng cho cặp này
+        # boundary: thời điểm đóng nến (ms) mà tick này xử lý
+        self._drop_pending()
+        self._snapshot = None
+        self._tick_price = price
+        self._tick_boundary = boundary
+        self._tick_t0 = time.perf_counter()
+        self.tick_orders = []
+        if prefetch:
+            self.prefetch()
+
+    def prefetch(self):
+        # Tải snapshot của tick ở nền (song song với tải nến / tính feature). Chỉ gọi khi tick sẽ ra quyết định:
+        # snapshot không dùng tới vẫn tốn request và phải chờ ở begin_tick kế tiếp.
+        # Pool dùng chung: bỏ qua, snapshot tải trên luồng của cặp khi cần
+        if not self._shared_pool and self._pending is None and self._snapshot is None:
+            if self._snapshot_pool is None:
+                self._snapshot_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="binance-snapshot")
+            self._pending = self._snapshot_pool.submit(self._fetch_snapshot)
+
+    def _drop_pending(self):
+        # Snapshot tải nền chưa dùng: huỷ nếu chưa chạy, không thì chờ chạy xong -> reconcile cũ không chạy
+        # song song với tick sau và không reset ledger sau một lệnh mới hơn
+        pending, self._pending = self._pending, None
+        if pending is not None and not pending.cancel():
+            try:
+                pending.result()
+            except Exception as e:
+                logger.warning(f"Discarded snapshot prefetch failed: {e}")
+                self._ledger_dirty = True
+
+    def invalidate(self):
+        # Không chắc trạng thái lệnh (lỗi mạng, lệnh chưa khớp) -> đối chiếu lại với sàn ở lần đọc sau
+        self._drop_pending()
+        self._ledger_dirty = True
+        self._snapshot = None
+
+    def reconcile(self):
+        # positionRisk và account gọi song song
+        positions_req = self._request(self.client.get_position_risk, symbol=self.symbol)
+        account = self.client.account()
+        positions = positions_req.result()
+
+        pos_amt, entry_price = 0.0, 0.0
+        for p in positions:
+            if p['symbol'] == self.symbol:
+                pos_amt = float(p['positionAmt'])
+                entry_price = float(p['entryPrice'])
+                break
+
+        if not self._ledger_dirty and abs(pos_amt - self.ledger.position_amt) > 1e-9:
+            logger.warning(f"Ledger mismatch: local {self.ledger.position_amt} vs exchange {pos_amt} -> resync")
+        self.ledger.reset(pos_amt, entry_price)
+
+        self.wallet_balance = float(
+            next((item for item in account['assets'] if item['asset'] == 'USDT'), None)['walletBalance'])
+        if self.start_balance is None:
+            self.start_balance = self.wallet_balance
+
+        self._last_reconcile = time.time()
+        self._ledger_dirty = False
+
+    def _request(self, fn, **kwargs):
+        # Request lá có kết quả được chờ trong tick: lên pool riêng, hoặc chạy ngay trên luồng gọi nếu pool dùng chung
+        # (phía gọi có thể chính là 1 luồng của pool đó -> không chờ task xếp hàng sau mình)
+        if not self._shared_pool:
+            return self._pool.submit(fn, **kwargs)
+        done = Future()
+        done.set_result(fn(**kwargs))
+        return done
+
+    def filters(self):
+        # exchangeInfo được cache, chỉ tải lại sau FILTERS_TTL
+        if self._filters is None or time.time() - self._filters_at >= FILTERS_TTL:
+            info = self.client.exchange_info()
+            symbol_info = next(s for s in info['symbols'] if s['symbol'] == self.symbol)
+            self._filters = SymbolFilters(symbol_info)
+            self._filters_at = time.time()
+        return self._filters
+
+    def _fetch_snapshot(self):
+        # Giá + (nếu tới hạn) đối chiếu vị thế/số dư: các request chạy song song, ~1 round trip
+        price = self._tick_price
+        ticker = self._request(self.client.ticker_price, symbol=self.symbol) if price is None else None
+        if self._filters is None or time.time() - self._filters_at >= FILTERS_TTL:
+            self._pool.submit(self.filters)  # Không để lần đặt lệnh đầu tiên phải chờ exchangeInfo
+        if self._ledger_dirty or time.time() - self._last_reconcile >= self.reconcile_seconds:
+            with METRICS.timed("account_query_ms", symbol=self.symbol):
+                self.reconcile()
+        return {'price': float(ticker.result()['price']) if ticker is not None else price}
+
+    def snapshot(self):
+        # Trong 1 tick chỉ hỏi giá 1 lần; vị thế/số dư lấy từ ledger
+        if self._snapshot is None:
+            pending, self._pending = self._pending, None
+            self._snapshot = pending.result() if pending is not None else self._fetch_snapshot()
+        return self._snapshot
+
+    def account_pnl_pct(self, price):
+        # Lợi nhuận tích lũy (%) so với số dư lúc bot khởi động (giống obs của env)
+        self.snapshot()
+        if not self.start_balance:
+            return 0.0
+        equity = self.wallet_balance + self.ledger.unrealized_pnl(price)
+        return (equity - self.start_balance) / self.start_balance
 
     def set_leverage(self):
-        print(f"Setting leverage to x{LEVERAGE}...")
+        print(f"Setting leverage to x{self.leverage}...")
         try:
             response = self.client.change_leverage(
-                symbol=SYMBOL,
-                leverage=LEVERAGE
+                symbol=self.symbol,
+                leverage=self.leverage
             )
             print("Leverage updated success:", response)
         except ClientError as e:
             print("Error setting leverage:", e.error_message)
 
-    def get_max_qty(self, price):
+    def get_max_qty(self, price, usdt_balance=None):
 
-        account = self.client.account()
-        usdt_balance = float(
-            next((item for item in account['assets'] if item['asset'] == 'USDT'), None)['walletBalance'])
+        if usdt_balance is None:
+            self.snapshot()
+            usdt_balance = self.wallet_balance
         print(f"Max USDT balance: {usdt_balance}")
 
         # Công thức: (Balance * Leverage) / Price
@@ -60,38 +334,63 @@ class BinanceExecutor:
 
 
     def get_current_state(self):
-        positions = self.client.get_position_risk(symbol=self.symbol)
-        ticker = self.client.ticker_price(symbol=self.symbol)
-
-        current_pos_amt = 0.0
-        for p in positions:
-            if p['symbol'] == self.symbol:
-                current_pos_amt = float(p['positionAmt'])
-                break
-
-        current_price = float(ticker['price'])
-        return current_pos_amt, current_price
+        snapshot = self.snapshot()
+        return self.ledger.position_amt, snapshot['price']
 
     def _place_order(self, side, qty, reduce_only=False):
+        start = time.perf_counter()
         try:
-            qty = round(abs(qty), 3)
-            if qty == 0: return False
+            qty, reason = self.filters().check(qty, self.snapshot()['price'], reduce_only=reduce_only)
+            if qty is None:
+                logger.info(f"Skip {side} order: {reason}")
+                METRICS.inc("rebalance_skipped_total", symbol=self.symbol, reason=f"min_{reason.split()[0]}")
+                return False
 
             params = {
                 "symbol": self.symbol,
                 "side": side,
                 "type": "MARKET",
-                "quantity": qty,
+                "quantity": format(qty, "f"),
             }
             if reduce_only:
                 params["reduceOnly"] = "true"
+            params["newOrderRespType"] = "RESULT"  # Trả về luôn giá/khối lượng khớp để cập nhật ledger
 
             resp = self.client.new_order(**params)
             print(f" {side} {qty} success! ID: {resp['orderId']}")
+            self._apply_order_result(side, resp)
+            self._record_order(side, qty, resp, start)
             return True
         except ClientError as e:
             print(f" Order Failed: {e}")
             return False
+        except Exception:
+            self.invalidate()
+            raise
+
+    def _record_order(self, side, qty, resp, start):
+        # Thời gian _place_order, từ đầu tick, và từ lúc nến đóng tới khi sàn nhận lệnh (updateTime, giờ sàn)
+        now = time.perf_counter()
+        order = {"symbol": self.symbol, "side": side, "qty": float(qty), "ms": round((now - start) * 1000, 3)}
+        METRICS.inc("rebalances_total", symbol=self.symbol, side=side)
+        METRICS.observe("order_ms", order["ms"], symbol=self.symbol)
+        if self._tick_t0 is not None:
+            order["tick_to_order_ms"] = round((now - self._tick_t0) * 1000, 3)
+            METRICS.observe("tick_to_order_ms", order["tick_to_order_ms"], symbol=self.symbol)
+        if self._tick_boundary is not None and resp.get('updateTime'):
+            order["close_to_order_ms"] = int(resp['updateTime']) - self._tick_boundary
+            if order["close_to_order_ms"] >= 0:  # Âm = đồng hồ máy lệch giờ sàn -> chỉ ghi vào trace
+                METRICS.observe("close_to_order_ms", order["close_to_order_ms"], symbol=self.symbol)
+        self.tick_orders.append(order)
+
+    def _apply_order_result(self, side, resp):
+        filled_qty = float(resp.get('executedQty', 0))
+        avg_price = float(resp.get('avgPrice', 0))
+        if filled_qty <= 0 or avg_price <= 0 or resp.get('status') != 'FILLED':
+            # Chưa khớp hết -> không đoán, đối chiếu với sàn ở lần đọc sau
+            self.invalidate()
+            return
+        self.wallet_balance += self.ledger.apply_fill(side, filled_qty, avg_price)
 
     def close_position(self):
         pos, _ = self.get_current_state()
@@ -100,28 +399,24 @@ class BinanceExecutor:
             self._place_order(side, abs(pos), reduce_only=True)
 
     def execute_dqn(self, action_id):
-        current_pos, _ = self.get_current_state()
-        qty = self.dqn_quantity
-
+        # 0 WAIT: giữ nguyên | 1 LONG: +qty | 2 SHORT: -qty | 3 CLOSE: 0 (giống env).
+        # Đảo chiều = 1 lệnh net (|vị thế| + qty), không đóng rồi mở lại bằng 2 lệnh.
         if action_id == 0:
             return
+        current_pos, _ = self.get_current_state()
+        qty = self.dqn_quantity
 
         if action_id == 3: # close
             self.close_position()
+            return
 
-        if action_id == 1: #long
-            if current_pos < 0:  # Đang Short -> Đóng Short
-                self.close_position()
-                time.sleep(1)
-            if current_pos <= 0:  # Mở Long
-                self._place_order("BUY", qty)
+        target = qty if action_id == 1 else -qty
+        if current_pos * target > 0:
+            METRICS.inc("rebalance_skipped_total", symbol=self.symbol, reason="same_side")
+            return  # Đã cùng chiều -> giữ nguyên
 
-        if action_id == 2: #short
-            if current_pos > 0:  # Đang long -> đóng
-                self.close_position()
-                time.sleep(1)
-            if current_pos <= 0:  # Mở short
-                self._place_order("SELL", qty)
+        delta = target - current_pos
+        self._place_order("BUY" if delta > 0 else "SELL", abs(delta))
 
     def execute_ppo(self, action_val):
         current_pos, current_price = self.get_current_state()
@@ -135,6 +430,7 @@ class BinanceExecutor:
         logger.info(f" Maxpossibleqty: {max_possible_qty},  Current position: {current_pos}, target position: {target_pct}, delta: {delta}")
         if abs(delta) < (max_possible_qty * 0.01 * 0.1):
             logger.info(f"PPO Delta too small ({delta:.4f})(< {max_possible_qty * 0.01 * 0.1})")
+            METRICS.inc("rebalance_skipped_total", symbol=self.symbol, reason="small_delta")
             return
 
         logger.info(f"PPO Rebalance: Current {current_pos:.3f} -> Target {action_val:.3f} | Delta: {delta:.3f}")
@@ -0,0 +1,187 @@
+import os
+import signal
+import threading
+import time
+
+from stable_baselines3.common.callbacks import BaseCallback
+
+from cpu_budget import ProcessUsage
+from profiling import StackSampler, TimedVecEnv
+
+
+class CpuUsageCallback(BaseCallback):
+    """
+    Mỗi `interval` giây: % CPU, số thread, core được ghim của learner và từng env worker
+    -> in 1 dòng + ghi vào logger của SB3 (tensorboard: cpu/<process>_pct).
+    """
+
+    def __init__(self, pids, interval=60.0, verbose=1):
+        super().__init__(verbose)
+        self.pids = pids
+        self.interval = interval
+        self.usage = None
+        self.next_report = 0.0
+
+    def _on_training_start(self):
+        self.usage = ProcessUsage(self.pids)
+        self.next_report = time.monotonic() + self.interval
+
+    def _report(self):
+        usage = self.usage.sample()
+        for name, u in usage.items():
+            if u["cpu_pct"] is not None:
+                self.logger.record(f"cpu/{name}_pct", u["cpu_pct"])
+        if self.verbose:
+            print(f"CPU: {ProcessUsage.summary(usage)}")
+
+    def _on_step(self):
+        if time.monotonic() >= self.next_report:
+            self._report()
+            self.next_report = time.monotonic() + self.interval
+        return True
+
+    def _on_training_end(self):
+        self._report()
+
+
+class ThroughputCallback(BaseCallback):
+    """
+    Mỗi `interval` giây: steps/s, % thời gian của từng pha (thu rollout: env step / overhead VecEnv (IPC) /
+    policy + buffer; train: gradient update), thời gian trung bình trong BitcoinTradingEnv.step,
+    RewardHandler và dựng obs, steps/s + % bận của từng env worker -> in 1 dòng + logger SB3 (tensorboard: perf/*).
+    Số liệu env cần env bọc bởi TimedVecEnv (+ ProfiledEnv mỗi env với dummy/subproc).
+
+    kill -USR1 <pid learner>: lấy mẫu stack của learner (và từng worker subproc) trong `sample_seconds` giây
+    -> profile_<process>_<bước>.txt trong thư mục log tensorboard (không có thì `out_dir`).
+    """
+
+    def __init__(self, interval=30.0, sample_seconds=10.0, sample_interval=0.005, out_dir=None, verbose=1):
+        super().__init__(verbose)
+        self.interval = interval
+        self.sample_seconds = sample_seconds
+        self.sample_interval = sample_interval
+        self.out_dir = out_dir
+        self.venv = None
+        self.sample_requested = False
+        self.prev_handler = None
+
+    def _on_training_start(self):
+        self.venv = self.training_env if isinstance(self.training_env, TimedVecEnv) else None
+        if self.venv is None and self.verbose:
+            print("ThroughputCallback: env không bọc TimedVecEnv -> chỉ đo các pha rollout/train")
+        now = time.perf_counter()
+        self.phase = {"rollout": 0.0, "train": 0.0}
+        self.phase_start = now
+        self.in_rollout = False
+        self.last_time = now
+        self.last_timesteps = self.num_timesteps
+        self.last_vec = self.venv.times.snapshot() if self.venv else {}
+        self.last_workers = self.venv.worker_stats() if self.venv else []
+        self.next_report = time.monotonic() + self.interval
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            self.prev_handler = signal.signal(signal.SIGUSR1, self._request_sample)
+
+    def _request_sample(self, signum, frame):
+        self.sample_requested = True  # Bắt đầu ở _on_step kế tiếp (không làm gì nặng trong signal handler)
+
+    def _mark(self, in_rollout):
+        # Cộng thời gian từ mốc trước vào pha đang chạy rồi chuyển pha
+        now = time.perf_counter()
+        self.phase["rollout" if self.in_rollout else "train"] += now - self.phase_start
+        self.phase_start = now
+        self.in_rollout = in_rollout
+
+    def _on_rollout_start(self):
+        self._mark(True)
+
+    def _on_rollout_end(self):
+        self._mark(False)
+
+    def _start_sampling(self):
+        # Thư mục log tensorboard của lần chạy; không bật tensorboard thì logger của SB3 chỉ có thư mục tạm
+        out_dir = (self.logger.get_dir() if self.model.tensorboard_log else None) or self.out_dir or "."
+        os.makedirs(out_dir, exist_ok=True)
+        StackSampler(self.sample_interval, thread_id=threading.get_ident()).start(
+            self.sample_seconds, os.path.join(out_dir, f"profile_learner_{self.num_timesteps}.txt"))
+        if self.venv is not None and self.venv.profiled and self.venv.parallel:
+            for i in range(self.venv.num_envs):
+                path = os.path.join(out_dir, f"profile_env{i}_{self.num_timesteps}.txt")
+                self.venv.env_method("start_sampling", self.sample_seconds, path, self.sample_interval, indices=[i])
+        print(f"Sampling stacks for {self.sample_seconds:.0f}s -> {out_dir}")
+
+    @staticmethod
+    def _delta(cur, prev, name):
+        seconds, calls = cur.get(name, (0.0, 0))
+        prev_seconds, prev_calls = prev.get(name, (0.0, 0))
+        return seconds - prev_seconds, calls - prev_calls
+
+    def _report(self):
+        self._mark(self.in_rollout)
+        now = time.perf_counter()
+        wall = max(now - self.last_time, 1e-9)
+        rollout, train = self.phase["rollout"], self.phase["train"]
+        steps_per_s = (self.num_timesteps - self.last_timesteps) / wall
+        self.logger.record("perf/steps_per_s", steps_per_s)
+        self.logger.record("perf/rollout_pct", 100.0 * rollout / wall)
+        self.logger.record("perf/train_pct", 100.0 * train / wall)
+        line = f"Perf: {steps_per_s:.0f} steps/s | rollout {100 * rollout / wall:.0f}%"
+
+        if self.venv is not None:
+            vec = self.venv.times.snapshot()
+            workers = self.venv.worker_stats()
+            vec_step = self._delta(vec, self.last_vec, "vec_step")[0]
+            self.logger.record("perf/env_step_pct", 100.0 * vec_step / wall)
+            self.logger.record("perf/policy_pct", 100.0 * (rollout - vec_step) / wall)  # Forward policy + buffer + callback
+            line += f" (env {100 * vec_step / wall:.0f}%"
+
+            totals = {name: [0.0, 0] for name in ("step", "reward", "observation")}
+            busy, rates = [], []
+            for i, (cur, prev) in enumerate(zip(workers, self.last_workers)):
+                for name, total in totals.items():
+                    seconds, calls = self._delta(cur, prev, name)
+                    total[0] += seconds
+                    total[1] += calls
+                step_seconds = self._delta(cur, prev, "step")[0]
+                rates.append((cur["steps"] - prev["steps"]) / wall)
+                busy.append(step_seconds)
+                self.logger.record(f"perf/env{i}_steps_per_s", rates[-1])
+                self.logger.record(f"perf/env{i}_busy_pct", 100.0 * step_seconds / wall)
+
+            if busy and not self.venv.batched:
+                # Thời gian chờ VecEnv ngoài env.step: IPC + pickle (subproc, các worker chạy song song) / vòng lặp Python (dummy)
+                inner = max(busy) if self.venv.parallel else sum(busy)
+                overhead = max(vec_step - inner, 0.0)
+                self.logger.record("perf/vec_overhead_pct", 100.0 * overhead / wall)
+                line += f" [overhead {100 * overhead / wall:.0f}%]"
+            line += f", policy {100 * (rollout - vec_step) / wall:.0f}%)"
+            for name, (seconds, calls) in totals.items():
+                if calls:
+                    self.logger.record(f"perf/{name}_us", 1e6 * seconds / calls)
+            if totals["step"][1]:
+                line += " | " + ", ".join(f"{name} {1e6 * s / c:.1f}us" for name, (s, c) in totals.items() if c)
+            if rates:
+                line += (f" | {len(rates)} worker {min(rates):.0f}-{max(rates):.0f} steps/s, "
+                         f"busy {100 * min(busy) / wall:.0f}-{100 * max(busy) / wall:.0f}%")
+            self.last_vec, self.last_workers = vec, workers
+
+        line += f" | train {100 * train / wall:.0f}%"
+        if self.verbose:
+            print(line)
+        self.phase = {"rollout": 0.0, "train": 0.0}
+        self.last_time = now
+        self.last_timesteps = self.num_timesteps
+
+    def _on_step(self):
+        if self.sample_requested:
+            self.sample_requested = False
+            self._start_sampling()
+        if time.monotonic() >= self.next_report:
+            self._report()
+            self.next_report = time.monotonic() + self.interval
+        return True
+
+    def _on_training_end(self):
+        self._report()
+        if self.prev_handler is not None:
+            signal.signal(signal.SIGUSR1, self.prev_handler)
+            self.prev_handler = None
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+INTERVAL_MS = {
+    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "6h": 21_600_000,
+    "8h": 28_800_000, "12h": 43_200_000, "1d": 86_400_000,
+}
+
+COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+PAGE_LIMIT = 99  # < 100 nến/request -> request weight = 1 (Binance Futures)
+
+
+class CandleBuffer:
+    """
+    Bộ đệm nến dạng vòng (ring buffer) trên mảng NumPy, dung lượng cố định.
+
+    - backfill(): tải lịch sử 1 lần lúc khởi động
+    - refresh(): chỉ tải nến có open time >= nến cuối đang giữ, vá lại nến đang chạy,
+      tự phân trang để lấp khoảng trống sau khi mất kết nối
+    Nến cuối trong buffer luôn là nến đang chạy (chưa đóng).
+    """
+
+    def __init__(self, client, symbol, interval, capacity=1500):
+        self.client = client
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.capacity = capacity
+
+        self._data = np.zeros((capacity, len(COLUMNS)), dtype=np.float64)
+        self._start = 0   # vị trí của nến cũ nhất
+        self._count = 0
+        self.gaps = 0     # số lần phát hiện thiếu nến (sàn không có dữ liệu)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def last_open_time(self):
+        if self._count == 0:
+            return None
+        return int(self._row(self._count - 1)[0])
+
+    def _row(self, i):
+        return self._data[(self._start + i) % self.capacity]
+
+    def _fetch(self, **params):
+        klines = self.client.klines(symbol=self.symbol, interval=self.interval, **params)
+        if not klines:
+            return np.zeros((0, len(COLUMNS)))
+        return np.array([k[:6] for k in klines], dtype=np.float64)
+
+    def _append(self, row):
+        if self._count < self.capacity:
+            self._data[(self._start + self._count) % self.capacity] = row
+            self._count += 1
+        else:
+            # Đầy -> ghi đè nến cũ nhất
+            self._data[self._start] = row
+            self._start = (self._start + 1) % self.capacity
+
+    def _merge(self, rows):
+        # Gộp các nến mới tải (đã sắp xếp theo thời gian). Trả về số nến mới thêm vào.
+        added = 0
+        for row in rows:
+            last_ts = self.last_open_time
+            ts = int(row[0])
+            if last_ts is None or ts > last_ts:
+                if last_ts is not None and ts - last_ts > self.interval_ms:
+                    self.gaps += 1
+                    print(f"Warning: thiếu {(ts - last_ts) // self.interval_ms - 1} nến trước {ts}")
+                self._append(row)
+                added += 1
+            elif ts == last_ts:
+                # Vá nến đang chạy (high/low/close/volume thay đổi)
+                self._row(self._count - 1)[:] = row
+        return added
+
+    def push(self, row):
+        # Nến nhận từ WebSocket: [open_time, open, high, low, close, volume]
+        return self._merge(np.asarray([row], dtype=np.float64))
+
+    def backfill(self, limit=None):
+        limit = min(limit or self.capacity, self.capacity)
+        rows = self._fetch(limit=limit)
+        self._start, self._count = 0, 0
+        self._merge(rows)
+        return len(rows)
+
+    def refresh(self):
+        if self._count == 0:
+            return self.backfill()
+
+        # Phân trang từ open time của nến cuối: trang đầu vá nến đang chạy + nến mới đóng,
+        # nếu trang đầy (mất kết nối lâu) thì tải tiếp cho tới hiện tại.
+        added = 0
+        while True:
+            rows = self._fetch(startTime=self.last_open_time, limit=PAGE_LIMIT)
+            added += self._merge(rows)
+            if len(rows) < PAGE_LIMIT:
+                break
+        return added
+
+    def closed_since(self, open_time, last_closed=False):
+        # Các nến ĐÃ ĐÓNG có open time > open_time, duyệt ngược từ cuối.
+        # Mặc định bỏ nến cuối (đang chạy); last_closed=True khi biết nến cuối đã đóng (sự kiện kline x=true)
+        end = self._count if last_closed else self._count - 1
+        n = 0
+        while n < end and self._row(end - 1 - n)[0] > open_time:
+            n += 1
+        idx = (self._start + np.arange(end - n, end)) % self.capacity
+        return self._data[idx]
+
+    def forming(self):
+        return self._row(self._count - 1).copy()
+
+    def to_array(self):
+        idx = (self._start + np.arange(self._count)) % self.capacity
+        return self._data[idx]
+
+    def to_frame(self):
+        df = pd.DataFrame(self.to_array(), columns=COLUMNS)
+        df["timestamp"] = df["timestamp"].astype(np.int64)
+        return df
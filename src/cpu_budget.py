@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Không import numpy/torch ở đây: module này phải chạy được TRƯỚC các import nặng
+# (OpenBLAS/MKL/OpenMP chỉ đọc số thread từ biến môi trường lúc khởi tạo)
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                   "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+
+def parse_cpus(spec=None):
+    # "0-7,16,18-19" / [0, 1, 2] / None (mọi core process đang được phép chạy) -> danh sách core
+    allowed = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    if spec is None:
+        return allowed
+    if isinstance(spec, int):
+        cpus = [spec]
+    elif isinstance(spec, str):
+        cpus = []
+        for part in spec.split(","):
+            lo, _, hi = part.strip().partition("-")
+            cpus.extend(range(int(lo), int(hi or lo) + 1))
+    else:
+        cpus = [int(c) for c in spec]
+    missing = sorted(set(cpus) - set(allowed))
+    if missing:
+        raise ValueError(f"Core {missing} không nằm trong tập core được phép {allowed}")
+    return cpus
+
+
+def plan_budget(system_cfg, n_workers=0):
+    """
+    Chia tập core `system.cpus` cho learner và từng env worker (SubprocVecEnv):
+    learner giữ `learner_threads` core đầu (mặc định: phần còn lại sau các worker),
+    worker i nhận `env_threads` core kế tiếp (quay vòng nếu không đủ core).
+    Trả về {'learner': {'threads', 'cpus'}, 'workers': [{'threads', 'cpus'}, ...]}; cpus = None nếu không ghim.
+    """
+    cpus = parse_cpus(system_cfg.get("cpus"))
+    env_threads = max(1, int(system_cfg.get("env_threads", 1)))
+    learner_threads = system_cfg.get("learner_threads") or max(1, len(cpus) - n_workers * env_threads)
+    pin = system_cfg.get("pin_cpus", True)
+
+    def take(start, count):
+        return sorted({cpus[(start + k) % len(cpus)] for k in range(count)}) if pin else None
+
+    return {
+        "learner": {"threads": learner_threads, "cpus": take(0, min(learner_threads, len(cpus)))},
+        "workers": [{"threads": env_threads, "cpus": take(learner_threads + i * env_threads, env_threads)}
+                    for i in range(n_workers)],
+    }
+
+
+def set_thread_env(threads):
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+
+
+def apply_budget(budget):
+    # Áp dụng cho process hiện tại: biến môi trường (cho thư viện chưa import), affinity, torch nếu đã import
+    set_thread_env(budget["threads"])
+    if budget.get("cpus") and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, budget["cpus"])
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(budget["threads"])
+
+
+@contextmanager
+def worker_thread_env(threads):
+    # Process con (forkserver/spawn) nhận biến môi trường lúc tạo -> worker import numpy/torch với đúng số thread
+    saved = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    set_thread_env(threads)
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+class ProcessUsage:
+    """
+    % CPU (utime + stime trong /proc/<pid>/stat), số thread và core được ghim của từng process
+    giữa 2 lần sample(). 100% = 1 core bận hoàn toàn.
+    """
+
+    def __init__(self, pids):
+        self.pids = dict(pids)  # tên -> pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.last = {name: self._cpu_seconds(pid) for name, pid in self.pids.items()}
+        self.last_time = time.monotonic()
+
+    def _cpu_seconds(self, pid):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self.ticks  # utime, stime
+        except (OSError, IndexError):
+            return None
+
+    @staticmethod
+    def _threads(pid):
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                return next(int(line.split()[1]) for line in f if line.startswith("Threads"))
+        except (OSError, StopIteration):
+            return None
+
+    def sample(self):
+        now = time.monotonic()
+        elapsed = max(now - self.last_time, 1e-9)
+        usage = {}
+        for name, pid in self.pids.items():
+            cpu = self._cpu_seconds(pid)
+            prev = self.last.get(name)
+            try:
+                cpus = sorted(os.sched_getaffinity(pid))
+            except OSError:
+                cpus = []
+            usage[name] = {
+                "cpu_pct": None if cpu is None or prev is None else 100.0 * (cpu - prev) / elapsed,
+                "threads": self._threads(pid),
+                "cpus": cpus,
+            }
+            self.last[name] = cpu
+        self.last_time = now
+        return usage
+
+    @staticmethod
+    def summary(usage):
+        parts = []
+        for name, u in usage.items():
+            pct = "-" if u["cpu_pct"] is None else f"{u['cpu_pct']:.0f}%"
+            parts.append(f"{name} {pct} ({u['threads']} thr, cpu {format_cpus(u['cpus'])})")
+        return " | ".join(parts)
+
+
+def format_cpus(cpus):
+    # [0, 1, 2, 3, 8] -> "0-3,8"
+    if not cpus:
+        return "-"
+    ranges, start, prev = [], cpus[0], cpus[0]
+    for c in cpus[1:] + [None]:
+        if c is not None and c == prev + 1:
+            prev = c
+            continue
+        ranges.append(f"{start}-{prev}" if prev > start else str(start))
+        if c is not None:
+            start = prev = c
+    return ",".join(ranges)
@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+FORMAT = "columnar-v1"
+SCHEMA_FILE = "schema.json"
+STATE_FILE = "state.npy"
+
+# Cột giữ nguyên độ chính xác gốc (giá float64 để PnL/Reward giống hệt, timestamp int64);
+# các feature còn lại lưu float32
+EXACT_COLS = {"timestamp": np.int64, "open": np.float64, "high": np.float64, "low": np.float64,
+              "close": np.float64, "volume": np.float64}
+
+
+class ColumnarDataset:
+    """
+    Dataset dạng cột đọc bằng memory map: mỗi cột 1 file .npy + state.npy (N, k) float32 theo hàng
+    cho observation, mô tả trong schema.json. Các process cùng map 1 file dùng chung page cache,
+    không phải parse CSV hay pickle DataFrame sang từng worker.
+    """
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, SCHEMA_FILE), encoding="utf-8") as f:
+            self.schema = json.load(f)
+        if self.schema.get("format") != FORMAT:
+            raise ValueError(f"{path}: định dạng không hỗ trợ ({self.schema.get('format')})")
+
+        mode = "r" if mmap else None
+        self.n_rows = self.schema["n_rows"]
+        self.meta = self.schema.get("meta", {})
+        self.columns = {c["name"]: np.load(os.path.join(path, c["file"]), mmap_mode=mode)
+                        for c in self.schema["columns"]}
+        self.state_columns = self.schema["state"]["columns"]
+        self.state = np.load(os.path.join(path, self.schema["state"]["file"]), mmap_mode=mode)
+
+    def column(self, name):
+        return self.columns[name]
+
+    def to_frame(self, columns=None):
+        # DataFrame (có copy) cho các chỗ vẫn cần pandas
+        columns = columns or list(self.columns)
+        return pd.DataFrame({c: np.asarray(self.columns[c]) for c in columns})
+
+    def state_frame(self):
+        return pd.DataFrame(np.asarray(self.state), columns=self.state_columns)
+
+
+def load_dataset(path, mmap=True):
+    return ColumnarDataset(path, mmap=mmap)
+
+
+def is_dataset(path):
+    return os.path.isfile(os.path.join(path, SCHEMA_FILE))
+
+
+def write_dataset(df, path, state_cols, meta=None):
+    """
+    Ghi DataFrame feature ra thư mục `path` (ghi vào thư mục tạm rồi đổi tên -> không bao giờ để lại
+    dataset ghi dở). Cột không phải số (vd. `date`) bị bỏ qua, suy ra lại được từ timestamp.
+    """
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    columns = []
+    for name in df.columns:
+        if not pd.api.types.is_numeric_dtype(df[name]):
+            continue
+        dtype = EXACT_COLS.get(name, np.float32)
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(df[name].to_numpy(dtype=dtype)))
+        columns.append({"name": name, "dtype": np.dtype(dtype).name, "file": f"{name}.npy"})
+
+    state = np.ascontiguousarray(df[state_cols].to_numpy(dtype=np.float32))
+    np.save(os.path.join(tmp, STATE_FILE), state)
+
+    meta = dict(meta or {})
+    if "timestamp" in df.columns and len(df):
+        meta["first_ts"] = int(df["timestamp"].iloc[0])
+        meta["last_ts"] = int(df["timestamp"].iloc[-1])
+    meta["created_at"] = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    schema = {
+        "format": FORMAT,
+        "n_rows": len(df),
+        "columns": columns,
+        "state": {"columns": list(state_cols), "dtype": "float32", "file": STATE_FILE},
+        "meta": meta,
+    }
+    with open(os.path.join(tmp, SCHEMA_FILE), "w", encoding="utf-8") as f:
+        json.dump(schema, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return path
+
+
+def append_dataset(path, df_new, state_cols, meta=None, drop_last=0):
+    # .npy có shape cố định trong header -> nối = ghi lại (chỉ là copy mảng, không tính lại feature).
+    # drop_last: bỏ n dòng cuối cũ trước khi nối (dòng được tính lại trong df_new)
+    old = load_dataset(path)
+    df = pd.concat([old.to_frame().iloc[:old.n_rows - drop_last], df_new[[c for c in old.columns]]],
+                   ignore_index=True)
+    meta = {**old.meta, **(meta or {})}
+    del old
+    return write_dataset(df, path, state_cols, meta)
@@ -1,84 +1,247 @@
+import argparse
 import requests
 import pandas as pd
 import time
-from datetime import datetime
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
 import os
 
+try:
+    from data.rate_limit import shared_scheduler, klines_weight, PRIORITY_BACKFILL
+except ImportError:  # Chạy trực tiếp trong src/data
+    from rate_limit import shared_scheduler, klines_weight, PRIORITY_BACKFILL
+
 BASE_URL = "https://fapi.binance.com"
 KLINES_ENDPOINT = "/fapi/v1/klines"
 
-
-def get_binance_data(symbol, interval, start_str, end_str=None):
+COLUMNS = ["timestamp", "open", "high", "low", "close", "volume", "date"]
+_UNIT_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+
+
+def interval_to_ms(interval):
+    return int(interval[:-1]) * _UNIT_MS[interval[-1]]
+
+
+def _fetch_chunk(session, scheduler, base_url, symbol, interval, start_ts, end_ts, limit, max_retries=8):
+    params = {
+        "symbol": symbol,
+        "interval": interval,
+        "startTime": start_ts,
+        "endTime": end_ts,
+        "limit": limit
+    }
+
+    def get():
+        response = session.get(base_url + KLINES_ENDPOINT, params=params, timeout=30)
+        scheduler.update(response.headers)
+        response.raise_for_status()  # 429/418 -> scheduler chặn theo Retry-After rồi thử lại
+        return response.json()
+
+    # Backfill xếp sau lệnh và dữ liệu live trong bộ điều phối dùng chung
+    try:
+        return scheduler.call(get, weight=klines_weight(limit), priority=PRIORITY_BACKFILL, retries=max_retries)
+    except requests.RequestException as e:
+        raise RuntimeError(f"Không tải được chunk {start_ts}-{end_ts} sau {max_retries} lần thử: {e}") from e
+
+
+def _write_rows(f, data):
+    # Cấu trúc trả về của Binance: [Open Time, Open, High, Low, Close, Volume, ...]
+    for candle in data:
+        date = datetime.fromtimestamp(candle[0] / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        f.write(f"{candle[0]},{float(candle[1])!r},{float(candle[2])!r},{float(candle[3])!r},"
+                f"{float(candle[4])!r},{float(candle[5])!r},{date}\n")
+
+
+def download_klines(symbol, interval, start_ts, end_ts, output_path, base_url=BASE_URL, workers=8, chunk_size=1500):
+    """
+    Tải nến song song theo chunk (mỗi chunk = 1 request `chunk_size` nến) qua 1 session dùng chung,
+    có giới hạn weight. Chunk xong được ghi ngay ra file part (<output>.parts/<start>_<end>.csv) nên chạy lại
+    sẽ bỏ qua các chunk đã có (resume); part của kế hoạch khác (end / chunk_size khác) bị xoá.
+    Cuối cùng kiểm tra liên tục rồi nối các part theo thứ tự thành file CSV.
+    """
+    interval_ms = interval_to_ms(interval)
+    step = interval_ms * chunk_size
+    chunks = [(s, min(s + step, end_ts) - 1) for s in range(start_ts, end_ts, step)]
+
+    parts_dir = output_path + ".parts"
+    os.makedirs(parts_dir, exist_ok=True)
+    planned = {_part_name(c) for c in chunks}
+    for name in os.listdir(parts_dir):
+        if name not in planned:
+            # Part của lần chạy trước với mốc cuối khác: dùng lại sẽ mất các nến sau mốc cũ
+            os.remove(os.path.join(parts_dir, name))
+    pending = [c for c in chunks if not os.path.exists(os.path.join(parts_dir, _part_name(c)))]
+    print(f" {symbol} {interval}: {len(chunks)} chunk, còn {len(pending)} chunk cần tải ({workers} luồng)")
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    scheduler = shared_scheduler()
+
+    def work(chunk):
+        start, end = chunk
+        data = _fetch_chunk(session, scheduler, base_url, symbol, interval, start, end, chunk_size)
+        part = os.path.join(parts_dir, _part_name(chunk))
+        with open(part + ".tmp", "w", newline="") as f:
+            _write_rows(f, data)
+        os.replace(part + ".tmp", part)  # Ghi xong mới đổi tên -> part luôn hoàn chỉnh
+        return start, len(data)
+
+    done = len(chunks) - len(pending)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(work, c) for c in pending]
+        for fut in as_completed(futures):
+            start, n = fut.result()
+            done += 1
+            temp_date = datetime.fromtimestamp(start / 1000).strftime('%d/%m/%Y')
+            print(f"   -> [{done}/{len(chunks)}] chunk {temp_date}: {n} nến")
+    session.close()
+    print(f"   Rate limit: {scheduler.summary()}")
+
+    # Nối các part theo thứ tự thời gian (đọc/ghi theo luồng, không giữ toàn bộ trong RAM).
+    # Ghi ra file tạm; chỉ thay file đích và xoá part khi mọi part hợp lệ
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    n_rows, missing = 0, 0
+    prev_ts = start_ts - interval_ms
+    with open(output_path + ".tmp", "w", newline="") as out:
+        out.write(",".join(COLUMNS) + "\n")
+        for chunk in chunks:
+            part = os.path.join(parts_dir, _part_name(chunk))
+            with open(part) as f:
+                for line in f:
+                    ts = int(line.split(",", 1)[0])
+                    if ts <= prev_ts or not chunk[0] <= ts <= chunk[1] or (ts - start_ts) % interval_ms:
+                        out.close()
+                        os.remove(output_path + ".tmp")
+                        os.remove(part)  # Part hỏng -> lần chạy sau tải lại chunk này
+                        raise RuntimeError(f"Part {part}: nến {ts} trùng/lệch/ngoài khoảng {chunk} -> đã xoá, chạy lại để tải lại")
+                    if ts - prev_ts != interval_ms:
+                        gap = (ts - prev_ts) // interval_ms - 1
+                        missing += gap
+                        print(f"Warning: thiếu {gap} nến trước {ts}")
+                    out.write(line)
+                    n_rows += 1
+                    prev_ts = ts
+
+    expected = (chunks[-1][1] - start_ts) // interval_ms + 1 if chunks else 0
+    tail = expected - n_rows - missing  # Nến cuối chưa có trên sàn (end trong tương lai / nến đang chạy) hoặc sàn trả thiếu
+    if missing or tail:
+        print(f"Warning: {n_rows}/{expected} nến (thiếu giữa chừng: {missing}, thiếu ở cuối: {tail})")
+    os.replace(output_path + ".tmp", output_path)
+    shutil.rmtree(parts_dir)
+    return n_rows
+
+
+def _part_name(chunk):
+    return f"{chunk[0]}_{chunk[1]}.csv"
+
+
+def _last_line(path):
+    # Đọc dòng cuối file (seek từ cuối, không đọc cả file). Trả về (offset đầu dòng, nội dung)
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = end - 1
+        while pos > 0:
+            f.seek(pos - 1)
+            if f.read(1) == b"\n" and pos < end - 1:
+                break
+            pos -= 1
+        f.seek(pos)
+        return pos, f.read().decode().strip()
+
+
+def sync_binance_data(symbol, interval, base_url=BASE_URL, workers=8, output_path=None):
+    """
+    Đồng bộ tăng dần: chỉ tải các nến mới hơn timestamp cuối trong file raw rồi nối vào cuối.
+    Nến cuối cũ được tải lại và ghi đè (có thể đã được lưu khi còn đang chạy).
+    Chỉ lấy nến đã đóng. Kiểm tra tính liên tục (thiếu nến / trùng nến) trước khi ghi.
+    """
+    output_path = output_path or f"../../data/raw/{symbol}_{interval}.csv"
+    if not os.path.exists(output_path):
+        raise FileNotFoundError(f"{output_path} chưa có, cần tải đầy đủ trước (bỏ --incremental)")
+
+    step = interval_to_ms(interval)
+    offset, last_line = _last_line(output_path)
+    last_ts = int(last_line.split(",")[0])
+    end_ts = int(time.time() * 1000) // step * step  # Mốc mở của nến đang chạy -> không lấy nến này
+
+    if end_ts <= last_ts:
+        print(f"{output_path} đã cập nhật (nến cuối {last_ts})")
+        return {"appended": 0, "gaps": 0, "duplicates": 0}
+
+    new_path = output_path + ".new"
+    download_klines(symbol, interval, last_ts, end_ts, new_path, base_url=base_url, workers=workers)
+
+    # Kiểm tra liên tục
+    stats = {"appended": 0, "gaps": 0, "duplicates": 0}
+    lines = []
+    prev_ts = last_ts - step
+    with open(new_path) as f:
+        next(f)  # header
+        for line in f:
+            ts = int(line.split(",", 1)[0])
+            if ts <= prev_ts:
+                stats["duplicates"] += 1
+                continue
+            if ts - prev_ts != step:
+                stats["gaps"] += 1
+                print(f"Warning: thiếu {(ts - prev_ts) // step - 1} nến trước {ts}")
+            lines.append(line)
+            prev_ts = ts
+    os.remove(new_path)
+
+    if not lines or int(lines[0].split(",", 1)[0]) != last_ts:
+        # Sàn không trả lại nến cuối cũ -> giữ nguyên dòng cũ
+        offset = None
+
+    with open(output_path, "r+", newline="") as f:
+        if offset is not None:
+            f.seek(offset)
+            f.truncate()
+        else:
+            f.seek(0, os.SEEK_END)
+        f.writelines(lines)
+    stats["appended"] = len(lines) - (1 if offset is not None else 0)
+
+    print(f"Đã nối {stats['appended']} nến mới vào {output_path} (thiếu: {stats['gaps']}, trùng: {stats['duplicates']})")
+    return stats
+
+
+def get_binance_data(symbol, interval, start_str, end_str=None, base_url=BASE_URL, workers=8):
 
     # Chuyển đổi ngày tháng sang mili-giây (Timestamp)
     start_ts = int(datetime.strptime(start_str, "%d/%m/%Y").timestamp() * 1000)
     if end_str:
         end_ts = int(datetime.strptime(end_str, "%d/%m/%Y").timestamp() * 1000)
     else:
-        end_ts = int(time.time() * 1000)
-
-    all_data = []
-    limit = 1500
+        # Mốc mở của nến đang chạy -> không lưu nến chưa đóng (như sync_binance_data)
+        end_ts = int(time.time() * 1000) // interval_to_ms(interval) * interval_to_ms(interval)
 
     print(f" Đang tải dữ liệu {symbol} khung {interval} từ {start_str}...")
 
-    while start_ts < end_ts:
-        # Gọi API
-        params = {
-            "symbol": symbol,
-            "interval": interval,
-            "startTime": start_ts,
-            "endTime": end_ts,
-            "limit": limit
-        }
-
-        try:
-            response = requests.get(BASE_URL + KLINES_ENDPOINT, params=params)
-            data = response.json()
-
-            if not data:
-                break
-
-            # Lưu dữ liệu vào list
-            # Cấu trúc trả về của Binance: [Open Time, Open, High, Low, Close, Volume, ...]
-            for candle in data:
-                all_data.append([
-                    candle[0],  # Timestamp
-                    float(candle[1]),  # Open
-                    float(candle[2]),  # High
-                    float(candle[3]),  # Low
-                    float(candle[4]),  # Close
-                    float(candle[5]),  # Volume
-                ])
-
-            # Cập nhật thời gian bắt đầu cho vòng lặp tiếp theo
-            start_ts = data[-1][0] + 1
-
-            temp_date = datetime.fromtimestamp(start_ts / 1000).strftime('%d/%m/%Y')
-            print(f"   -> Đã tải đến: {temp_date}")
-
-            # để không bị Binance chặn IP
-            time.sleep(0.5)
-
-        except Exception as e:
-            print(f"Lỗi kết nối: {e}")
-            time.sleep(5)
-            continue
-
-    # Chuyển sang DataFrame và lưu file
-    df = pd.DataFrame(all_data, columns=["timestamp", "open", "high", "low", "close", "volume"])
-    df["date"] = pd.to_datetime(df["timestamp"], unit="ms")
     output_path = f"../../data/raw/{symbol}_{interval}.csv"
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    n_rows = download_klines(symbol, interval, start_ts, end_ts, output_path, base_url=base_url, workers=workers)
 
-    df.to_csv(output_path, index=False)
-    print(f"Hoàn tất! Đã lưu {len(df)} dòng dữ liệu tại: {output_path}")
-    return df
+    print(f"Hoàn tất! Đã lưu {n_rows} dòng dữ liệu tại: {output_path}")
+    return pd.read_csv(output_path)
 
 
 if __name__ == "__main__":
-    SYMBOL = "BTCUSDT"
-    TIMEFRAME = "1h"
-    START_DATE = "01/01/2023"
-
-    get_binance_data(SYMBOL, TIMEFRAME, START_DATE)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Tải nến Binance Futures (song song, resume được)")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--interval", default="1h")
+    parser.add_argument("--start", default="01/01/2023", help="dd/mm/YYYY")
+    parser.add_argument("--end", default=None, help="dd/mm/YYYY (mặc định: hiện tại)")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--incremental", action="store_true", help="Chỉ tải nến mới và nối vào file raw đã có")
+    args = parser.parse_args()
+
+    if args.incremental:
+        sync_binance_data(args.symbol, args.interval, base_url=args.base_url, workers=args.workers)
+    else:
+        get_binance_data(args.symbol, args.interval, args.start, args.end, base_url=args.base_url, workers=args.workers)
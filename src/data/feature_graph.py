@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+
+
+def ewm(x, alpha, min_periods=0):
+    # EMA kiểu pandas ewm(adjust=False) (giống thư viện ta), đệ quy chạy trong Cython của pandas
+    return pd.Series(x, copy=False).ewm(alpha=alpha, min_periods=min_periods, adjust=False).mean().to_numpy()
+
+
+def rolling_moments(series, window, block=1024):
+    """
+    Trung bình và độ lệch chuẩn (ddof=1) trượt `window` cho K chuỗi cùng lúc.
+    `series`: mảng (K, N) hoặc danh sách K mảng 1 chiều; trả về (mean, std) cùng shape (K, N).
+    Một lượt qua dữ liệu bằng tổng tích lũy theo từng khối `block` dòng; mỗi khối được trừ đi
+    trung bình của khối trước khi cộng dồn để tổng bình phương không mất độ chính xác.
+    Cửa sổ có NaN -> kết quả NaN (giống rolling(window).mean()/std() của pandas).
+    """
+    # Mỗi chuỗi nằm liền trong bộ nhớ (K, N) -> cumsum theo trục cuối nhanh hơn
+    XT = np.ascontiguousarray(np.atleast_2d(np.asarray(series, dtype=np.float64)))
+    k, n = XT.shape
+    mean = np.full((k, n), np.nan)
+    std = np.full((k, n), np.nan)
+    has_nan = bool(np.isnan(XT).any())
+
+    c1 = np.zeros((k, block + window))
+    c2 = np.zeros((k, block + window))
+    for start in range(window - 1, n, block):
+        stop = min(start + block, n)
+        seg = XT[:, start - window + 1:stop]
+        length = seg.shape[1]
+        nan = np.isnan(seg) if has_nan else None
+
+        if nan is None:
+            shift = seg.mean(axis=1, keepdims=True)
+            y = seg - shift
+        else:
+            filled = np.where(nan, 0.0, seg)
+            shift = filled.sum(axis=1, keepdims=True) / np.maximum((~nan).sum(axis=1, keepdims=True), 1)
+            y = np.where(nan, 0.0, filled - shift)
+
+        np.cumsum(y, axis=1, out=c1[:, 1:length + 1])
+        np.multiply(y, y, out=y)
+        np.cumsum(y, axis=1, out=c2[:, 1:length + 1])
+
+        s1 = c1[:, window:length + 1] - c1[:, :length + 1 - window]
+        s2 = c2[:, window:length + 1] - c2[:, :length + 1 - window]
+        m = s1 / window
+        var = (s2 - s1 * m) / (window - 1)
+        np.maximum(var, 0.0, out=var)
+        np.sqrt(var, out=var)
+        m += shift
+
+        if nan is not None:
+            cn = np.zeros((k, length + 1))
+            np.cumsum(nan, axis=1, out=cn[:, 1:])
+            bad = (cn[:, window:] - cn[:, :-window]) > 0
+            m[bad] = np.nan
+            var[bad] = np.nan
+        mean[:, start:stop] = m
+        std[:, start:stop] = var
+
+    return mean, std
+
+
+class _Node:
+    def __init__(self, name, deps, kind="fn", fn=None, window=None, eps=1e-8):
+        self.name = name
+        self.deps = tuple(deps)
+        self.kind = kind  # "fn" | "mean" | "zscore"
+        self.fn = fn
+        self.window = window
+        self.eps = eps
+
+
+class FeatureGraph:
+    """
+    Tập feature khai báo dưới dạng đồ thị phụ thuộc giữa các feature có tên.
+
+    - feature(name, deps): đăng ký hàm fn(*mảng phụ thuộc, params) -> mảng
+    - rolling_mean / zscore: feature cửa sổ trượt; mọi cửa sổ cùng độ dài được tính chung một lần
+      bằng rolling_moments (cùng nguồn + cùng cửa sổ chỉ tính 1 lần, vd. SMA50 và Norm_Close)
+    compute() chỉ tính các node mà output yêu cầu cần tới; tên không đăng ký là cột đầu vào.
+    `window` có thể là số hoặc tên tham số trong params.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+
+    def _add(self, node):
+        if node.name in self.nodes:
+            raise ValueError(f"Feature '{node.name}' đã được đăng ký")
+        self.nodes[node.name] = node
+
+    def feature(self, name, deps=()):
+        def decorator(fn):
+            self._add(_Node(name, deps, fn=fn))
+            return fn
+        return decorator
+
+    def rolling_mean(self, name, source, window):
+        self._add(_Node(name, (source,), kind="mean", window=window))
+
+    def zscore(self, name, source, window, eps=1e-8):
+        self._add(_Node(name, (source,), kind="zscore", window=window, eps=eps))
+
+    def plan(self, outputs):
+        # Thứ tự topo của các node cần cho `outputs`
+        order, seen, visiting = [], set(), set()
+
+        def visit(name):
+            if name in seen or name not in self.nodes:
+                return
+            if name in visiting:
+                raise ValueError(f"Phụ thuộc vòng tại feature '{name}'")
+            visiting.add(name)
+            for dep in self.nodes[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            seen.add(name)
+            order.append(self.nodes[name])
+
+        for name in outputs:
+            visit(name)
+        return order
+
+    def compute(self, frame, outputs, params):
+        # Trả về dict tên -> mảng cho mọi node đã tính (kể cả trung gian) và cột đầu vào đã dùng
+        values = {}
+        pending = self.plan(outputs)
+
+        def get(name):
+            if name not in values:
+                values[name] = np.asarray(frame[name], dtype=np.float64)
+            return values[name]
+
+        def ready(node):
+            return all(d in values or d not in self.nodes for d in node.deps)
+
+        while pending:
+            progressed = False
+            # 1. Các node hàm thường đã đủ phụ thuộc
+            for node in [n for n in pending if n.kind == "fn" and ready(n)]:
+                values[node.name] = node.fn(*[get(d) for d in node.deps], params)
+                pending.remove(node)
+                progressed = True
+            # 2. Gom mọi node cửa sổ trượt đã sẵn sàng -> 1 lần rolling_moments cho mỗi độ dài cửa sổ
+            rolling = [n for n in pending if n.kind != "fn" and ready(n)]
+            if rolling:
+                self._compute_rolling(rolling, get, values, params)
+                for node in rolling:
+                    pending.remove(node)
+                progressed = True
+            if not progressed:
+                raise ValueError(f"Không tính được: {[n.name for n in pending]}")
+        return values
+
+    def _compute_rolling(self, nodes, get, values, params):
+        by_window = {}
+        for node in nodes:
+            window = params[node.window] if isinstance(node.window, str) else node.window
+            by_window.setdefault(window, []).append(node)
+
+        for window, group in by_window.items():
+            sources = list(dict.fromkeys(node.deps[0] for node in group))
+            mean, std = rolling_moments([get(s) for s in sources], window)
+            for node in group:
+                j = sources.index(node.deps[0])
+                if node.kind == "mean":
+                    values[node.name] = mean[j]
+                else:
+                    std[j] += node.eps
+                    values[node.name] = (get(node.deps[0]) - mean[j]) / std[j]
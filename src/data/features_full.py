@@ -1,92 +1,309 @@
 import pandas as pd
 import numpy as np
-from ta.momentum import RSIIndicator
-from ta.trend import MACD, SMAIndicator
-from ta.volatility import AverageTrueRange
+import argparse
+import hashlib
+import json
 import os
+import time
+import yaml
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+try:
+    from data.columnar import write_dataset, append_dataset, is_dataset, load_dataset
+    from data.feature_graph import FeatureGraph, ewm
+except ImportError:  # Chạy trực tiếp trong src/data
+    from columnar import write_dataset, append_dataset, is_dataset, load_dataset
+    from feature_graph import FeatureGraph, ewm
 
-def add_technical_indicators(df):
-    df = df.copy()
-    for col in ['close', 'high', 'low', 'volume']:
-        df[col] = df[col].astype(float)
+# Tham số feature: là một phần của cache key -> đổi tham số thì dữ liệu được tính lại
+FEATURE_PARAMS = {
+    "rsi_window": 14,
+    "macd_fast": 12,
+    "macd_slow": 26,
+    "macd_signal": 9,
+    "atr_window": 14,
+    "sma_fast": 50,
+    "sma_slow": 200,
+    "window_z": 50,
+}
+FEATURE_VERSION = 2  # Tăng khi đổi công thức trong GRAPH
 
-    # RSI (14)
-    df["raw_RSI"] = RSIIndicator(close=df["close"], window=14).rsi()
-    # MACD Histogram
-    macd = MACD(close=df["close"], window_slow=26, window_fast=12, window_sign=9)
-    df["raw_MACD"] = macd.macd_diff()
-    # ATR (Volatility)
-    atr = AverageTrueRange(high=df["high"], low=df["low"], close=df["close"], window=14)
-    df["raw_ATR"] = atr.average_true_range()
-    # SMA 50 & 200
-    df["SMA50"] = SMAIndicator(close=df["close"], window=50).sma_indicator()
-    df["SMA200"] = SMAIndicator(close=df["close"], window=200).sma_indicator()
 
+FEATURE_COLS = ["raw_RSI", "raw_MACD", "raw_ATR", "SMA50", "SMA200",
+                "Norm_Close", "RSI14", "Volatility", "MACD", "SMA_Dist", "I_trend"]
 
-    # Norm_Close (Rolling Z-score)
-    window_z = 50
-    roll_mean = df["close"].rolling(window=window_z).mean()
-    roll_std = df["close"].rolling(window=window_z).std()
-    df["Norm_Close"] = (df["close"] - roll_mean) / (roll_std + 1e-8)
+GRAPH = FeatureGraph()
 
-    # RSI14: Chuẩn hóa về [-1, 1] thay vì [0, 100]
-    df["RSI14"] = (df["raw_RSI"] / 50.0) - 1.0
 
-    # Volatility: Dùng Rolling Z-score thay vì Global Mean
-    # Tính ATR %
-    atr_pct = df["raw_ATR"] / df["close"]
-    # Z-score
-    atr_mean = atr_pct.rolling(window=window_z).mean()
-    atr_std = atr_pct.rolling(window=window_z).std()
-    df["Volatility"] = (atr_pct - atr_mean) / (atr_std + 1e-8)
+# RSI (14)
+@GRAPH.feature("raw_RSI", deps=("close",))
+def _raw_rsi(close, params):
+    window = params["rsi_window"]
+    diff = np.diff(close, prepend=np.nan)
+    emaup = ewm(np.where(diff > 0, diff, 0.0), 1 / window, min_periods=window)
+    emadn = ewm(np.where(diff < 0, -diff, 0.0), 1 / window, min_periods=window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(emadn == 0, 100.0, 100 - 100 / (1 + emaup / emadn))
 
-    # MACD: Rolling Z-score
-    macd_mean = df["raw_MACD"].rolling(window=window_z).mean()
-    macd_std = df["raw_MACD"].rolling(window=window_z).std()
-    df["MACD"] = (df["raw_MACD"] - macd_mean) / (macd_std + 1e-8)
 
-    # SMA Distance (Mean Reversion Signal)
-    df["SMA_Dist"] = (df["close"] - df["SMA50"]) / df["SMA50"]
+# MACD Histogram
+@GRAPH.feature("raw_MACD", deps=("close",))
+def _raw_macd(close, params):
+    fast, slow, sign = params["macd_fast"], params["macd_slow"], params["macd_signal"]
+    macd = ewm(close, 2 / (fast + 1), min_periods=fast) - ewm(close, 2 / (slow + 1), min_periods=slow)
+    return macd - ewm(macd, 2 / (sign + 1), min_periods=sign)
 
-    # Trend Flag (Regime Detection)
-    df["I_trend"] = np.where(df["close"] > df["SMA200"], 1.0, 0.0)
 
-    # Loại bỏ NaN sinh ra do các cửa sổ trượt (Rolling windows)
-    # Cần drop khoảng 200 dòng đầu (do SMA200)
-    df.dropna(inplace=True)
-    df.reset_index(drop=True, inplace=True)
+# ATR (Volatility) - Wilder: nến đầu = trung bình TR của `window` nến, sau đó EMA alpha = 1/window
+@GRAPH.feature("raw_ATR", deps=("high", "low", "close"))
+def _raw_atr(high, low, close, params):
+    window = params["atr_window"]
+    prev_close = np.concatenate(([np.nan], close[:-1]))
+    true_range = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+    atr = np.zeros(len(close))
+    if len(close) >= window:
+        seed = true_range[:window].mean()
+        atr[window - 1:] = ewm(np.concatenate(([seed], true_range[window:])), 1 / window)
+    return atr
 
-    # Xử lý vô cùng (inf) nếu có lỗi chia 0
-    df.replace([np.inf, -np.inf], 0, inplace=True)
 
-    return df
+# SMA 50 & 200
+GRAPH.rolling_mean("SMA50", "close", "sma_fast")
+GRAPH.rolling_mean("SMA200", "close", "sma_slow")
 
+# Norm_Close (Rolling Z-score)
+GRAPH.zscore("Norm_Close", "close", "window_z")
 
-if __name__ == "__main__":
-    input_path = "../../data/raw/BTCUSDT_1h.csv"
-    output_dir = "../../data/processed"
 
-    if os.path.exists(input_path):
-        df = pd.read_csv(input_path)
-        print(f"Raw data shape: {df.shape}")
+# RSI14: Chuẩn hóa về [-1, 1] thay vì [0, 100]
+@GRAPH.feature("RSI14", deps=("raw_RSI",))
+def _rsi14(raw_rsi, params):
+    return raw_rsi / 50.0 - 1.0
 
-        df_processed = add_technical_indicators(df)
-        print(f"Processed data shape: {df_processed.shape}")
 
+# Volatility: Rolling Z-score của ATR % thay vì Global Mean
+@GRAPH.feature("atr_pct", deps=("raw_ATR", "close"))
+def _atr_pct(raw_atr, close, params):
+    return raw_atr / close
+
+
+GRAPH.zscore("Volatility", "atr_pct", "window_z")
+
+# MACD: Rolling Z-score
+GRAPH.zscore("MACD", "raw_MACD", "window_z")
+
+
+# SMA Distance (Mean Reversion Signal)
+@GRAPH.feature("SMA_Dist", deps=("close", "SMA50"))
+def _sma_dist(close, sma50, params):
+    return (close - sma50) / sma50
+
+
+# Trend Flag (Regime Detection)
+@GRAPH.feature("I_trend", deps=("close", "SMA200"))
+def _i_trend(close, sma200, params):
+    return np.where(close > sma200, 1.0, 0.0)
+
+
+def add_technical_indicators(df, params=FEATURE_PARAMS, outputs=FEATURE_COLS, keep_inputs=True):
+    """
+    Tính các feature `outputs` (chỉ các node cần thiết trong GRAPH) và ghép sau các cột gốc của df
+    (keep_inputs=False: chỉ trả về các cột output, vd. outputs=STATE_COLS cho state).
+    Bỏ các dòng còn NaN do cửa sổ trượt (khoảng 200 dòng đầu do SMA200), inf -> 0.
+    """
+    values = GRAPH.compute(df, outputs, params)
+
+    # Dòng hợp lệ: mọi feature đã tính (kể cả trung gian) và mọi cột giữ lại đều không NaN
+    valid = np.ones(len(df), dtype=bool)
+    for name in GRAPH.plan(outputs):
+        valid &= ~np.isnan(values[name.name])
+
+    columns = {}
+    if keep_inputs:
+        for col in df.columns:
+            arr = df[col].to_numpy(dtype=float) if col in ('close', 'high', 'low', 'volume') else df[col].to_numpy()
+            valid &= ~pd.isna(arr)
+            columns[col] = arr
+    for name in outputs:
+        columns[name] = values[name]
+
+    out = {}
+    for col, arr in columns.items():
+        arr = arr[valid]
+        if arr.dtype.kind == "f":
+            # Xử lý vô cùng (inf) nếu có lỗi chia 0
+            arr[np.isinf(arr)] = 0
+        out[col] = arr
+    return pd.DataFrame(out)
+
+
+STATE_COLS = ["Norm_Close", "RSI14", "Volatility", "MACD", "SMA_Dist", "I_trend"]
+
+# Số nến lịch sử tính lại cùng phần đuôi khi cập nhật tăng dần:
+# SMA200 + z-score 50 nến, cộng thêm đủ dài để các chỉ báo EWM (RSI/MACD/ATR) hội tụ
+# (sai số khởi tạo giảm theo (13/14)^n, nhỏ hơn nhiều so với 5 chữ số thập phân khi lưu)
+LOOKBACK = 1000
+
+
+def build_features(input_path, output_dir, symbol="BTCUSDT", interval="1h", meta=None, verbose=True):
+    df = pd.read_csv(input_path)
+    df_processed = add_technical_indicators(df)
+
+    if verbose:
+        print(f"Raw data shape: {df.shape}")
+        print(f"Processed data shape: {df_processed.shape}")
         cols_check = ["Norm_Close", "RSI14", "Volatility", "MACD"]
         print("\n Statistics Check (Should be standardized) ")
         print(df_processed[cols_check].describe().loc[['mean', 'std', 'min', 'max']])
 
-        os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
 
-        df_processed.to_csv(f"{output_dir}/BTCUSDT_1h_features_full.csv", index=False, float_format="%.5f")
+    df_processed.to_csv(f"{output_dir}/{symbol}_{interval}_features_full.csv", index=False, float_format="%.5f")
 
-        # CÁC THAM SỐ DÙNG CHO STATE
-        state_cols = ["Norm_Close", "RSI14", "Volatility", "MACD", "SMA_Dist", "I_trend"]
-        df_state = df_processed[state_cols]
-        df_state.to_csv(f"{output_dir}/BTCUSDT_1h_state.csv", index=False, float_format="%.5f")
+    # CÁC THAM SỐ DÙNG CHO STATE
+    df_state = df_processed[STATE_COLS]
+    df_state.to_csv(f"{output_dir}/{symbol}_{interval}_state.csv", index=False, float_format="%.5f")
 
+    # Bản dạng cột float32 (không làm tròn 5 chữ số) cho train/env đọc bằng memmap
+    write_dataset(df_processed, f"{output_dir}/{symbol}_{interval}.cols", STATE_COLS,
+                  meta={"symbol": symbol, "interval": interval, "source": os.path.basename(input_path),
+                        **(meta or {})})
+
+    if verbose:
         print(f"\nSaved files to: {output_dir}")
+    return df_processed
+
+
+def update_features(input_path, output_dir, symbol="BTCUSDT", interval="1h", meta=None, verbose=True):
+    """
+    Cập nhật tăng dần: tính feature cho các nến raw từ dòng cuối của file features_full trở đi
+    (kèm LOOKBACK nến trước đó để khởi động chỉ báo). Dòng cuối cũ được tính lại và ghi đè
+    (nến raw đó có thể đã được lưu khi còn đang chạy), các dòng mới nối vào cuối file full,
+    file state và dataset dạng cột. Chưa có file processed -> tính lại toàn bộ.
+    """
+    full_path = f"{output_dir}/{symbol}_{interval}_features_full.csv"
+    state_path = f"{output_dir}/{symbol}_{interval}_state.csv"
+    cols_path = f"{output_dir}/{symbol}_{interval}.cols"
+    if not (os.path.exists(full_path) and os.path.exists(state_path) and is_dataset(cols_path)):
+        return build_features(input_path, output_dir, symbol, interval, meta=meta, verbose=verbose)
+
+    last_ts = pd.read_csv(full_path, usecols=["timestamp"])["timestamp"].iloc[-1]
+    df = pd.read_csv(input_path)
+    first = int(np.searchsorted(df["timestamp"].to_numpy(), last_ts, side="left"))
+    if first >= len(df):
+        if verbose:
+            print(f"{full_path} đã cập nhật (nến cuối {last_ts})")
+        return None
+
+    window = df.iloc[max(0, first - LOOKBACK):]
+    df_processed = add_technical_indicators(window)
+    df_new = df_processed[df_processed["timestamp"] >= last_ts]
+    replace = len(df_new) > 0 and df_new["timestamp"].iloc[0] == last_ts
+
+    for path, frame in ((full_path, df_new), (state_path, df_new[STATE_COLS])):
+        if replace:
+            _drop_last_line(path)
+        frame.to_csv(path, mode="a", header=False, index=False, float_format="%.5f")
+    append_dataset(cols_path, df_new, STATE_COLS, meta=meta, drop_last=int(replace))
+
+    if verbose:
+        print(f"Đã tính lại nến cuối và nối {len(df_new) - int(replace)} dòng feature mới vào: {output_dir}")
+    return df_new
+
+
+def _drop_last_line(path):
+    # Cắt dòng cuối file (quét ngược từ cuối, không đọc cả file)
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell() - 1
+        while pos > 0:
+            f.seek(pos - 1)
+            if f.read(1) == b"\n":
+                break
+            pos -= 1
+        f.truncate(pos)
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def params_key(params=FEATURE_PARAMS):
+    spec = {"version": FEATURE_VERSION, "params": params, "state": STATE_COLS}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def _build_job(symbol, interval, raw_dir, output_dir, incremental=False, force=False):
+    """
+    1 job của pipeline (chạy trong process con). Cache key = hash file raw + hash tham số feature,
+    lưu trong meta của dataset dạng cột: key khớp -> bỏ qua; chỉ raw đổi và --incremental -> nối phần mới;
+    còn lại -> tính lại toàn bộ.
+    """
+    t0 = time.perf_counter()
+    input_path = f"{raw_dir}/{symbol}_{interval}.csv"
+    if not os.path.exists(input_path):
+        return symbol, interval, "missing raw", 0, 0.0
+
+    key = {"raw_sha256": file_sha256(input_path), "params_key": params_key()}
+    cols_path = f"{output_dir}/{symbol}_{interval}.cols"
+    cached = {}
+    if is_dataset(cols_path) and os.path.exists(f"{output_dir}/{symbol}_{interval}_state.csv"):
+        cached = load_dataset(cols_path).meta
+
+    if not force and all(cached.get(k) == v for k, v in key.items()):
+        status = "cached"
+    elif not force and incremental and cached.get("params_key") == key["params_key"] and \
+            update_features(input_path, output_dir, symbol, interval, meta=key, verbose=False) is not None:
+        status = "updated"
     else:
-        print(f"Error: Input file not found at {input_path}")
\ No newline at end of file
+        build_features(input_path, output_dir, symbol, interval, meta=key, verbose=False)
+        status = "built"
+
+    n_rows = load_dataset(cols_path).n_rows
+    return symbol, interval, status, n_rows, time.perf_counter() - t0
+
+
+def build_all(symbols, intervals, raw_dir, output_dir, workers=4, incremental=False, force=False):
+    # Mỗi cặp (symbol, khung thời gian) là 1 job độc lập -> chia cho process pool
+    jobs = [(s, i) for s in symbols for i in intervals]
+    workers = max(1, min(workers, len(jobs)))
+    print(f"Feature pipeline: {len(jobs)} job ({len(symbols)} symbol x {len(intervals)} khung), {workers} process")
+
+    t0 = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_build_job, s, i, raw_dir, output_dir, incremental, force) for s, i in jobs]
+        for fut in as_completed(futures):
+            symbol, interval, status, n_rows, seconds = fut.result()
+            results.append((symbol, interval, status, n_rows, seconds))
+            print(f"   -> {symbol} {interval}: {status} ({n_rows} dòng, {seconds:.2f}s)")
+    print(f"Xong {len(jobs)} job trong {time.perf_counter() - t0:.2f}s -> {output_dir}")
+    return results
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+if __name__ == "__main__":
+    with open("../../config.yaml", "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    feat_cfg = cfg.get("features", {})
+
+    parser = argparse.ArgumentParser(description="Tính feature từ dữ liệu raw (song song, có cache)")
+    parser.add_argument("--symbol", nargs="+", default=_as_list(feat_cfg.get("symbols", cfg["symbol"])))
+    parser.add_argument("--interval", nargs="+", default=_as_list(feat_cfg.get("timeframes", cfg["timeframes"])))
+    parser.add_argument("--workers", type=int, default=feat_cfg.get("workers", os.cpu_count()))
+    parser.add_argument("--raw-dir", default="../../data/raw")
+    parser.add_argument("--output-dir", default="../../data/processed")
+    parser.add_argument("--incremental", action="store_true", help="Chỉ tính và nối các nến mới")
+    parser.add_argument("--force", action="store_true", help="Bỏ qua cache, tính lại toàn bộ")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    build_all(args.symbol, args.interval, args.raw_dir, args.output_dir,
+              workers=args.workers, incremental=args.incremental, force=args.force)
@@ -0,0 +1,232 @@
+import math
+import numpy as np
+
+
+# Các chỉ báo dạng "streaming": cập nhật O(1) mỗi nến đã đóng, cho ra cùng giá trị với
+# add_technical_indicators (features_full.py) trong sai số float.
+#   push(x): đưa giá trị mới vào (thay đổi trạng thái)
+#   peek(x): tính thử kết quả nếu đưa x vào, KHÔNG thay đổi trạng thái (dùng cho nến đang chạy)
+
+
+class _EMA:
+    # Giống pandas ewm(adjust=False): y_t = ((1-a) * y_{t-1} + a * x_t) / ((1-a) + a)
+    def __init__(self, com, min_periods):
+        self.alpha = 1.0 / (1.0 + com)
+        self.min_periods = min_periods
+        self.value = math.nan
+        self.count = 0
+
+    @classmethod
+    def from_span(cls, span, min_periods):
+        return cls((span - 1) / 2.0, min_periods)
+
+    @classmethod
+    def from_alpha(cls, alpha, min_periods):
+        return cls((1.0 - alpha) / alpha, min_periods)
+
+    def _next(self, x):
+        if self.count == 0 or self.value == x:
+            return x
+        old_wt = 1.0 - self.alpha
+        return (old_wt * self.value + self.alpha * x) / (old_wt + self.alpha)
+
+    def _output(self, value, count):
+        return value if count >= self.min_periods else math.nan
+
+    def peek(self, x):
+        return self._output(self._next(x), self.count + 1)
+
+    def push(self, x):
+        self.value = self._next(x)
+        self.count += 1
+        return self._output(self.value, self.count)
+
+
+class _RollingWindow:
+    # Trung bình + độ lệch chuẩn (ddof=1) trượt trên `window` phần tử, cập nhật kiểu Welford.
+    # Mỗi khi vòng buffer quay lại đầu thì tính lại chính xác từ buffer để tránh trôi số (O(1) trung bình).
+    def __init__(self, window):
+        self.window = window
+        self.buf = [0.0] * window
+        self.pos = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def _next(self, x):
+        if self.count < self.window:
+            n = self.count + 1
+            delta = x - self.mean
+            mean = self.mean + delta / n
+            m2 = self.m2 + delta * (x - mean)
+        else:
+            y = self.buf[self.pos]
+            mean = self.mean + (x - y) / self.window
+            m2 = self.m2 + (x - y) * (x - mean + y - self.mean)
+        return mean, m2
+
+    def _output(self, mean, m2, count):
+        if count < self.window:
+            return math.nan, math.nan
+        return mean, math.sqrt(max(m2, 0.0) / (self.window - 1))
+
+    def peek(self, x):
+        mean, m2 = self._next(x)
+        return self._output(mean, m2, self.count + 1)
+
+    def push(self, x):
+        self.mean, self.m2 = self._next(x)
+        self.buf[self.pos] = x
+        self.pos = (self.pos + 1) % self.window
+        self.count += 1
+
+        if self.pos == 0:
+            self.mean = math.fsum(self.buf) / self.window
+            self.m2 = math.fsum((v - self.mean) ** 2 for v in self.buf)
+
+        return self._output(self.mean, self.m2, self.count)
+
+
+class _ATR:
+    # Giống ta.volatility.AverageTrueRange: 0 cho tới nến thứ `window`, nến đó = trung bình TR,
+    # sau đó làm mượt Wilder: atr = (atr * (w - 1) + tr) / w
+    def __init__(self, window):
+        self.window = window
+        self.count = 0
+        self.tr_sum = 0.0
+        self.value = 0.0
+
+    def _next(self, tr):
+        n = self.count + 1
+        if n < self.window:
+            return self.tr_sum + tr, 0.0
+        if n == self.window:
+            return self.tr_sum + tr, (self.tr_sum + tr) / self.window
+        return self.tr_sum, (self.value * (self.window - 1) + tr) / float(self.window)
+
+    def peek(self, tr):
+        return self._next(tr)[1]
+
+    def push(self, tr):
+        self.tr_sum, self.value = self._next(tr)
+        self.count += 1
+        return self.value
+
+
+class StreamingFeatures:
+    """
+    Bản streaming của add_technical_indicators: seed 1 lần từ lịch sử, sau đó mỗi nến đóng
+    chỉ tốn O(1) để cập nhật RSI14, MACD, Volatility, Norm_Close, SMA_Dist, I_trend.
+
+    update()/peek() trả về dict các cột giống dòng cuối của add_technical_indicators,
+    hoặc None khi chưa đủ dữ liệu warmup (tương ứng các dòng bị dropna ở bản batch).
+    """
+
+    def __init__(self, window_z=50):
+        self.window_z = window_z
+
+        # RSI(14): ewm alpha = 1/14 trên up/down
+        self.rsi_up = _EMA.from_alpha(1 / 14, 14)
+        self.rsi_down = _EMA.from_alpha(1 / 14, 14)
+        # MACD(12, 26, 9)
+        self.ema_fast = _EMA.from_span(12, 12)
+        self.ema_slow = _EMA.from_span(26, 26)
+        self.macd_signal = _EMA.from_span(9, 9)
+        # ATR(14)
+        self.atr = _ATR(14)
+        # SMA 50 & 200
+        self.sma50 = _RollingWindow(50)
+        self.sma200 = _RollingWindow(200)
+        # Rolling Z-score
+        self.z_close = _RollingWindow(window_z)
+        self.z_atr = _RollingWindow(window_z)
+        self.z_macd = _RollingWindow(window_z)
+
+        self.prev_close = math.nan
+        self.n_candles = 0
+
+    def seed(self, df):
+        # Nạp lịch sử nến ĐÃ ĐÓNG (DataFrame có cột high, low, close). Trả về feature của nến cuối.
+        features = None
+        for high, low, close in zip(df["high"].astype(float), df["low"].astype(float), df["close"].astype(float)):
+            features = self.update(high, low, close)
+        return features
+
+    def update(self, high, low, close):
+        # Nến đã đóng -> cập nhật trạng thái
+        return self._compute(float(high), float(low), float(close), commit=True)
+
+    def peek(self, high, low, close):
+        # Nến đang chạy -> tính feature tạm thời, không thay đổi trạng thái
+        return self._compute(float(high), float(low), float(close), commit=False)
+
+    def _compute(self, high, low, close, commit):
+        def feed(indicator, x):
+            return indicator.push(x) if commit else indicator.peek(x)
+
+        prev_close = self.prev_close
+
+        # RSI (nến đầu tiên: diff = NaN -> up = down = 0, giống ta)
+        diff = close - prev_close if not math.isnan(prev_close) else 0.0
+        emaup = feed(self.rsi_up, diff if diff > 0 else 0.0)
+        emadn = feed(self.rsi_down, -diff if diff < 0 else 0.0)
+        if emadn == 0:
+            raw_rsi = 100.0
+        else:
+            raw_rsi = 100 - (100 / (1 + emaup / emadn))
+
+        # MACD Histogram
+        fast = feed(self.ema_fast, close)
+        slow = feed(self.ema_slow, close)
+        macd = fast - slow
+        raw_macd = math.nan
+        if not math.isnan(macd):
+            raw_macd = macd - feed(self.macd_signal, macd)
+
+        # ATR
+        if math.isnan(prev_close):
+            tr = high - low
+        else:
+            tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        raw_atr = feed(self.atr, tr)
+
+        # SMA 50 & 200
+        sma50, _ = feed(self.sma50, close)
+        sma200, _ = feed(self.sma200, close)
+
+        # Rolling Z-score
+        close_mean, close_std = feed(self.z_close, close)
+        atr_pct = raw_atr / close
+        atr_mean, atr_std = feed(self.z_atr, atr_pct)
+        macd_mean, macd_std = math.nan, math.nan
+        if not math.isnan(raw_macd):
+            macd_mean, macd_std = feed(self.z_macd, raw_macd)
+
+        if commit:
+            self.prev_close = close
+            self.n_candles += 1
+
+        features = {
+            "close": close,
+            "raw_RSI": raw_rsi,
+            "raw_MACD": raw_macd,
+            "raw_ATR": raw_atr,
+            "SMA50": sma50,
+            "SMA200": sma200,
+            "Norm_Close": (close - close_mean) / (close_std + 1e-8),
+            "RSI14": (raw_rsi / 50.0) - 1.0,
+            "Volatility": (atr_pct - atr_mean) / (atr_std + 1e-8),
+            "MACD": (raw_macd - macd_mean) / (macd_std + 1e-8),
+            "SMA_Dist": (close - sma50) / sma50 if sma50 != 0 else np.inf,
+            "I_trend": 1.0 if close > sma200 else 0.0,
+        }
+
+        # Chưa đủ warmup (bản batch sẽ dropna dòng này)
+        if any(math.isnan(v) for v in features.values()):
+            return None
+
+        # Xử lý vô cùng (inf) nếu có lỗi chia 0
+        for k, v in features.items():
+            if math.isinf(v):
+                features[k] = 0.0
+        return features
@@ -0,0 +1,223 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import requests
+
+# Giới hạn của Binance USDT-M Futures (theo IP / tài khoản)
+WEIGHT_LIMIT_1M = 2400
+ORDER_LIMIT_10S = 300
+ORDER_LIMIT_1M = 1200
+
+# Mức ưu tiên: số nhỏ được phục vụ trước
+PRIORITY_ORDER = 0
+PRIORITY_LIVE = 1
+PRIORITY_BACKFILL = 2
+PRIORITY_NAMES = {PRIORITY_ORDER: "order", PRIORITY_LIVE: "live", PRIORITY_BACKFILL: "backfill"}
+
+
+def klines_weight(limit):
+    # Bảng weight của /fapi/v1/klines theo limit
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+def _header(headers, name):
+    # Header của requests không phân biệt hoa/thường; limit_usage của binance-connector là chữ thường
+    if headers is None:
+        return None
+    value = headers.get(name)
+    return value if value is not None else headers.get(name.lower())
+
+
+class _Bucket:
+    # Token bucket nạp đều: `capacity` token mỗi `period` giây
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, floor=0.0):
+        # Số giây cần chờ để lấy `amount` token mà vẫn còn >= floor
+        return max(amount + floor - self.tokens, 0.0) / self.rate
+
+    def sync(self, used):
+        # Số đã dùng do sàn báo (tính cả process khác cùng IP) -> không tiêu quá phần còn lại
+        self.tokens = min(self.tokens, self.capacity - used)
+
+
+class RequestScheduler:
+    """
+    Bộ điều phối request dùng chung cho mọi lời gọi Binance trong 1 process (loader, executor, live loop).
+
+    - Token bucket theo request weight/phút và số lệnh/10s, /phút (với hệ số an toàn `safety`),
+      đồng bộ theo header X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-* của sàn -> process khác cùng IP
+      cũng được tính vào.
+    - Hàng đợi theo ưu tiên: lệnh trước dữ liệu live, dữ liệu live trước backfill; backfill chỉ được
+      dùng weight tới mức còn chừa `backfill_reserve` cho live trading.
+    - 429/418: chặn mọi request tới hết Retry-After (không có thì backoff lũy thừa có jitter).
+    - metrics(): mức dùng weight, hàng đợi, thời gian chờ, số lần bị giới hạn.
+    """
+
+    def __init__(self, weight_limit=WEIGHT_LIMIT_1M, order_limit_10s=ORDER_LIMIT_10S, order_limit_1m=ORDER_LIMIT_1M,
+                 safety=0.8, backfill_reserve=0.25, max_backoff=60.0):
+        self.weight_limit = weight_limit
+        self.weight = _Bucket(weight_limit * safety, 60.0)
+        self.orders_10s = _Bucket(order_limit_10s * safety, 10.0)
+        self.orders_1m = _Bucket(order_limit_1m * safety, 60.0)
+        self.reserve = self.weight.capacity * backfill_reserve
+        self.max_backoff = max_backoff
+
+        self.cond = threading.Condition()
+        self.waiting = []  # heap (priority, seq)
+        self.seq = itertools.count()
+        self.blocked_until = 0.0
+        self.strikes = 0  # Số lần bị 429/418 liên tiếp
+
+        self.used_weight = 0  # Weight đã dùng trong 1 phút do sàn báo gần nhất
+        self.stats = {"requests": 0, "weight": 0, "orders": 0, "rate_limited": 0, "banned": 0, "retries": 0,
+                      "wait_seconds": {name: 0.0 for name in PRIORITY_NAMES.values()}}
+
+    def acquire(self, weight=1, priority=PRIORITY_LIVE, is_order=False):
+        ticket = (priority, next(self.seq))
+        start = time.monotonic()
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+            self.cond.notify_all()  # Request ưu tiên cao hơn vừa vào -> request đang chờ ở đầu hàng nhường
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self.blocked_until - now
+                    if self.waiting[0] == ticket and wait <= 0:
+                        for bucket in (self.weight, self.orders_10s, self.orders_1m):
+                            bucket.refill(now)
+                        floor = self.reserve if priority >= PRIORITY_BACKFILL else 0.0
+                        wait = self.weight.wait_time(weight, floor)
+                        if is_order:
+                            wait = max(wait, self.orders_10s.wait_time(1), self.orders_1m.wait_time(1))
+                        if wait <= 0:
+                            break
+                    self.cond.wait(timeout=wait if wait > 0 else None)
+
+                self.weight.tokens -= weight
+                if is_order:
+                    self.orders_10s.tokens -= 1
+                    self.orders_1m.tokens -= 1
+                    self.stats["orders"] += 1
+                self.stats["requests"] += 1
+                self.stats["weight"] += weight
+                self.stats["wait_seconds"][PRIORITY_NAMES.get(priority, str(priority))] += time.monotonic() - start
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()
+
+    def update(self, headers):
+        used = _header(headers, "X-MBX-USED-WEIGHT-1M")
+        orders_10s = _header(headers, "X-MBX-ORDER-COUNT-10S")
+        orders_1m = _header(headers, "X-MBX-ORDER-COUNT-1M")
+        with self.cond:
+            now = time.monotonic()
+            if used is not None:
+                self.used_weight = int(used)
+                self.weight.refill(now)
+                self.weight.sync(int(used))
+            if orders_10s is not None:
+                self.orders_10s.refill(now)
+                self.orders_10s.sync(int(orders_10s))
+            if orders_1m is not None:
+                self.orders_1m.refill(now)
+                self.orders_1m.sync(int(orders_1m))
+
+    def backoff(self, attempt):
+        # Backoff lũy thừa có jitter (nửa cố định + nửa ngẫu nhiên) để các client không thử lại cùng lúc
+        delay = min(self.max_backoff, 2.0 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def penalize(self, status, retry_after=None):
+        # 429: vượt giới hạn, 418: IP bị ban vì tiếp tục gửi sau 429 -> chặn mọi request tới hết hạn
+        with self.cond:
+            self.strikes += 1
+            self.stats["banned" if status == 418 else "rate_limited"] += 1
+            delay = float(retry_after) if retry_after else self.backoff(self.strikes)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self.cond.notify_all()
+        return delay
+
+    def call(self, fn, weight=1, priority=PRIORITY_LIVE, is_order=False, retries=3):
+        """
+        Gọi fn() khi đủ ngân sách. Lỗi mạng / 5xx của request dữ liệu được thử lại với backoff;
+        lệnh không bao giờ tự gửi lại (trạng thái có thể đã khớp, để phía gọi đối chiếu).
+        """
+        for attempt in range(retries + 1):
+            self.acquire(weight, priority, is_order)
+            try:
+                result = fn()
+            except Exception as e:
+                # ClientError/ServerError của binance-connector: status_code + header; requests.HTTPError: response
+                response = getattr(e, "response", None)
+                status = getattr(e, "status_code", None) or getattr(response, "status_code", None)
+                headers = getattr(e, "header", None) or getattr(response, "headers", None)
+                if headers is not None:
+                    self.update(headers)
+                if status in (418, 429):
+                    self.penalize(status, _header(headers, "Retry-After"))
+                    if is_order or attempt == retries:
+                        raise
+                    continue
+                # Chỉ thử lại lỗi mạng/timeout và 5xx; lỗi 4xx khác là lỗi của request
+                retryable = (status is None and isinstance(e, requests.RequestException)) or (status or 0) >= 500
+                if not retryable or is_order or attempt == retries:
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(self.backoff(attempt))
+                continue
+            self.strikes = 0
+            return result
+
+    def metrics(self):
+        with self.cond:
+            queued = {}
+            for priority, _ in self.waiting:
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                queued[name] = queued.get(name, 0) + 1
+            return {
+                "used_weight_1m": self.used_weight,
+                "weight_limit_1m": self.weight_limit,
+                "utilization": self.used_weight / self.weight_limit,
+                "tokens": round(self.weight.tokens, 1),
+                "queued": queued,
+                "blocked_for": max(self.blocked_until - time.monotonic(), 0.0),
+                **self.stats,
+                "wait_seconds": {k: round(v, 3) for k, v in self.stats["wait_seconds"].items()},
+            }
+
+    def summary(self):
+        m = self.metrics()
+        return (f"weight {m['used_weight_1m']}/{m['weight_limit_1m']} ({m['utilization']:.0%}) | "
+                f"queued {sum(m['queued'].values())} | 429x{m['rate_limited']} 418x{m['banned']}")
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler():
+    # 1 bộ điều phối cho cả process (mọi request cùng 1 IP)
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RequestScheduler()
+        return _shared
@@ -7,19 +7,45 @@ import pandas as pd
 from DQN.action_dqn import ActionDQN
 from PPO.action_ppo import ActionPPO
 from reward import RewardHandler
+from data.columnar import load_dataset
 
 
 class BitcoinTradingEnv(gym.Env):
     metadata = {'render_modes': ['human']}
 
-    def __init__(self, df_full, df_state, model_type='DQN', initial_balance=10000, fee_rate=0.0004):
+    def __init__(self, df_full=None, df_state=None, model_type='DQN', initial_balance=10000, fee_rate=0.0004,
+                 lean_info=False, dataset=None, end_step=None):
         super(BitcoinTradingEnv, self).__init__()
 
-        self.df_full = df_full.reset_index(drop=True)
-        self.df_state = df_state.reset_index(drop=True)
         self.model_type = model_type
         self.initial_balance = initial_balance
         self.fee_rate = fee_rate
+        # lean_info=True: step() trả về info rỗng (bỏ qua việc dựng dict mỗi bước khi train)
+        self.lean_info = lean_info
+
+        # --- 0. Chuyển dữ liệu sang mảng NumPy liên tục (chỉ làm 1 lần) ---
+        if dataset is not None:
+            # Dataset dạng cột (đường dẫn hoặc ColumnarDataset): dùng thẳng mảng memmap,
+            # các worker map cùng file nên chia sẻ page cache thay vì giữ bản copy riêng
+            if isinstance(dataset, str):
+                dataset = load_dataset(dataset)
+            self.df_full = None
+            self.df_state = None
+            self._close = np.ascontiguousarray(dataset.column('close'), dtype=np.float64)
+            self._state = np.ascontiguousarray(dataset.state, dtype=np.float32)
+            state_columns = list(dataset.state_columns)
+        else:
+            self.df_full = df_full.reset_index(drop=True)
+            self.df_state = df_state.reset_index(drop=True)
+            # Giá giữ float64 để PnL/Reward giống hệt khi đọc từ pandas
+            self._close = np.ascontiguousarray(self.df_full['close'].to_numpy(dtype=np.float64))
+            # State đã được ép về float32 khi tạo observation nên lưu sẵn float32
+            self._state = np.ascontiguousarray(self.df_state.to_numpy(dtype=np.float32))
+            state_columns = list(self.df_state.columns)
+        self._trend = np.ascontiguousarray(self._state[:, state_columns.index('I_trend')])
+        self._n_market = self._state.shape[1]
+        # end_step: episode kết thúc tại bước này (các nến sau để dành làm đoạn held-out, VD sweep.py)
+        self._last_step = len(self._close) - 1 if end_step is None else min(int(end_step), len(self._close) - 1)
 
         # --- 1. Cấu hình Action Space ---
         if model_type == 'DQN':
@@ -44,15 +70,19 @@ class BitcoinTradingEnv(gym.Env):
 
         # Cấu hình Observation Space
         # Tổng = 8 features ( 6 + 2 )
-        self.obs_shape = (self.df_state.shape[1] + 2,)
+        self.obs_shape = (self._n_market + 2,)
         self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=self.obs_shape, dtype=np.float32)
 
+        # Buffer observation dùng lại mỗi bước (VecEnv của SB3 tự copy sang buffer riêng)
+        self._obs_buf = np.zeros(self.obs_shape, dtype=np.float32)
+
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
 
         # Reset các biến tài khoản
         self.balance = self.initial_balance
-        self.net_worth = self.initial_balance
+        # float64 ngay từ đầu: số Python (int/float) trừ phí float32 của PPO sẽ bị ép về float32
+        self.net_worth = np.float64(self.initial_balance)
         self.current_step = 0
 
         # Reset tracker vị thế
@@ -68,11 +98,11 @@ class BitcoinTradingEnv(gym.Env):
 
     def step(self, action):
         # 1. Lấy dữ liệu thị trường hiện tại
-        current_price = self.df_full.loc[self.current_step, 'close']
+        current_price = self._close[self.current_step]
         # Lấy giá bước trước để tính PnL thay đổi (nếu cần) hoặc dùng logic Reward
-        prev_price = self.df_full.loc[self.current_step - 1, 'close'] if self.current_step > 0 else current_price
+        prev_price = self._close[self.current_step - 1] if self.current_step > 0 else current_price
 
-        trend_flag = self.df_state.loc[self.current_step, 'I_trend']
+        trend_flag = self._trend[self.current_step]
 
         # 2. Thực hiện hành động (Qua Action Handler)
         # Handler sẽ tính toán vị thế mới và phí
@@ -107,7 +137,7 @@ class BitcoinTradingEnv(gym.Env):
 
         # 5. Chuyển bước tiếp theo
         self.current_step += 1
-        done = self.current_step >= len(self.df_full) - 1
+        done = self.current_step >= self._last_step
 
         # Điều kiện dừng sớm: Cháy tài khoản (còn dưới 50% vốn)
         if self.net_worth < self.initial_balance * 0.5:
@@ -115,8 +145,16 @@ class BitcoinTradingEnv(gym.Env):
             reward = -100  # Phạt cực nặng nếu cháy
 
         obs = self._get_observation()
+        if done:
+            # Obs cuối được VecEnv giữ lại làm terminal_observation -> không được trùng buffer sẽ bị reset ghi đè
+            obs = obs.copy()
+
+        # step: hàng dataset của obs trả về (CompactReplayBuffer dựng lại obs từ đây)
+        if self.lean_info:
+            return obs, reward, done, False, {'step': self.current_step}
 
         info = {
+            'step': self.current_step,
             'net_worth': self.net_worth,
             'step_reward': reward,
             'action': trade_type_str,
@@ -126,16 +164,18 @@ class BitcoinTradingEnv(gym.Env):
         return obs, reward, done, False, info
 
     def _get_observation(self):
+        # Ghi thẳng vào buffer có sẵn (không tạo mảng mới mỗi bước).
+        # Lưu ý: giá trị trả về bị ghi đè ở bước sau, cần .copy() nếu muốn giữ lại.
+        obs = self._obs_buf
+
         # Lấy state từ file csv đã chuẩn hóa
-        market_state = self.df_state.iloc[self.current_step].values
+        obs[:self._n_market] = self._state[self.current_step]
 
         # Thêm thông tin tài khoản vào state để Bot biết mình đang Long hay Short
-        account_state = np.array([
-            self.pos_tracker,  # Vị thế hiện tại
-            (self.net_worth - self.initial_balance) / self.initial_balance  # Lợi nhuận tích lũy (%)
-        ])
+        obs[self._n_market] = self.pos_tracker  # Vị thế hiện tại
+        obs[self._n_market + 1] = (self.net_worth - self.initial_balance) / self.initial_balance  # Lợi nhuận tích lũy (%)
 
-        return np.concatenate((market_state, account_state)).astype(np.float32)
+        return obs
 
     def render(self, mode='human'):
         if self.current_step % 100 == 0:
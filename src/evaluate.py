@@ -0,0 +1,202 @@
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import torch
+import yaml
+from stable_baselines3 import PPO, DQN
+
+from backtest import Backtester, data_kwargs, load_env
+from vec_env import BatchedTradingVecEnv
+
+
+HORIZON_FILE = "train_horizon.json"
+
+
+def save_horizon(save_dir, end_step, n_steps):
+    # Mốc cuối dữ liệu train (train.py/sweep.py ghi cạnh checkpoint, kể cả khi train toàn bộ: end_step = n_steps)
+    # -> các nến từ end_step trở đi chưa được train
+    os.makedirs(save_dir, exist_ok=True)
+    with open(os.path.join(save_dir, HORIZON_FILE), "w", encoding="utf-8") as f:
+        json.dump({"end_step": int(end_step), "n_steps": int(n_steps)}, f)
+
+
+def load_horizon(models_dir):
+    path = os.path.join(models_dir, HORIZON_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)  # {'end_step', 'n_steps'}
+
+
+def holdout_folds(n_steps, train_end, test_bars, step=None):
+    """
+    Chia đoạn dữ liệu sau mốc train [train_end, n_steps) thành các fold test (train_end, test_start, test_end)
+    dài test_bars nến, mỗi fold dịch đi `step` nến (mặc định = test_bars, không chồng lấn).
+    Mọi checkpoint chỉ được train trên các nến trước train_end -> mọi fold đều out-of-sample.
+    """
+    step = step or test_bars
+    folds = []
+    start = train_end
+    while start + test_bars <= n_steps:
+        folds.append((train_end, start, start + test_bars))
+        start += step
+    return folds
+
+
+def find_checkpoints(models_dir):
+    # <prefix>_<bước>_steps.zip của CheckpointCallback theo thứ tự bước train, final_model.zip cuối cùng
+    def order(path):
+        m = re.search(r"_(\d+)_steps\.zip$", path)
+        return int(m.group(1)) if m else float("inf")
+    return sorted(glob.glob(os.path.join(models_dir, "*.zip")), key=order)
+
+
+_worker = {}
+
+
+def _init_worker(cfg, data, folds, threads):
+    # Mỗi process: dữ liệu + env batch (mỗi env là 1 fold) tạo 1 lần, dùng cho mọi checkpoint
+    torch.set_num_threads(threads)
+    env = load_env(cfg, data=data)
+    starts = np.array([f[1] for f in folds])
+    ends = np.array([f[2] for f in folds])
+    _worker['cfg'] = cfg
+    _worker['folds'] = folds
+    _worker['backtester'] = Backtester.from_env(env)
+    _worker['venv'] = BatchedTradingVecEnv(
+        n_envs=len(folds),
+        model_type=env.model_type,
+        initial_balance=env.initial_balance,
+        fee_rate=env.fee_rate,
+        lean_info=True,
+        start_steps=starts,
+        end_steps=ends,
+        **data
+    )
+
+
+def rollout(model, venv, n_bars):
+    # Chuỗi action deterministic (n_envs, n_bars) của model trên env batch (obs các env gom thành 1 batch)
+    actions = np.zeros((venv.num_envs, n_bars), dtype=np.float32 if venv.model_type == 'PPO' else np.int64)
+    obs = venv.reset()
+    for t in range(n_bars):
+        action, _ = model.predict(obs, deterministic=True)
+        actions[:, t] = np.asarray(action).reshape(venv.num_envs, -1)[:, 0]
+        obs, _, _, _ = venv.step(action)
+    return actions
+
+
+def evaluate_checkpoint(path):
+    """
+    Rollout deterministic out-of-sample của 1 checkpoint trên mọi fold test cùng lúc:
+    obs của các fold được gom thành 1 batch -> mỗi nến chỉ 1 lần forward qua policy.
+    Chuỗi action thu được chạy lại qua Backtester (đúng logic env) để lấy thống kê từng fold.
+    """
+    cfg, folds, venv, backtester = _worker['cfg'], _worker['folds'], _worker['venv'], _worker['backtester']
+    model_cls = PPO if cfg['model_type'].upper() == 'PPO' else DQN
+    model = model_cls.load(path, device='cpu')
+
+    t0 = time.perf_counter()
+    actions = rollout(model, venv, folds[0][2] - folds[0][1])
+    rollout_seconds = time.perf_counter() - t0
+
+    rows = []
+    for i, (train_end, test_start, test_end) in enumerate(folds):
+        stats = backtester.run(actions[i], start=test_start)['stats'].iloc[0].to_dict()
+        rows.append({'checkpoint': os.path.basename(path), 'fold': i, 'train_end': train_end, 'test_start': test_start,
+                     'test_end': test_end, **stats})
+    return rows, rollout_seconds
+
+
+def leaderboard(folds_df):
+    # Xếp hạng checkpoint theo Sharpe trung bình out-of-sample qua các fold
+    board = folds_df.groupby('checkpoint').agg(
+        mean_sharpe=('sharpe', 'mean'),
+        median_sharpe=('sharpe', 'median'),
+        mean_return=('total_return', 'mean'),
+        worst_return=('total_return', 'min'),
+        worst_drawdown=('max_drawdown', 'max'),
+        mean_turnover=('turnover', 'mean'),
+        mean_fee_drag=('fee_drag', 'mean'),
+        blown_folds=('blown', 'sum'),
+        n_folds=('fold', 'count'),
+    )
+    board = board.sort_values('mean_sharpe', ascending=False).reset_index()
+    board.insert(0, 'rank', np.arange(1, len(board) + 1))
+    return board
+
+
+def run_holdout(cfg, models_dir, test_bars, step=None, workers=4, train_end=None):
+    data = data_kwargs(cfg)
+    n_steps = load_env(cfg, data=data)._last_step
+    saved = load_horizon(models_dir)
+    if saved is not None and saved["end_step"] >= saved["n_steps"]:
+        raise ValueError(f"{models_dir}: model train trên toàn bộ dữ liệu ({saved['n_steps']} nến), không còn đoạn "
+                         f"out-of-sample -> train lại với --holdout-bars N")
+    horizon = None if saved is None else saved["end_step"]
+    if train_end is not None and horizon is not None and train_end < horizon:
+        raise ValueError(f"--train-end {train_end} < mốc train đã lưu {horizon}: fold test sẽ chồng lên dữ liệu train")
+    train_end = train_end if train_end is not None else horizon
+    if train_end is None:
+        raise ValueError(f"{models_dir} không có {HORIZON_FILE}: train lại với --holdout-bars N hoặc chỉ định --train-end")
+    if train_end >= n_steps:
+        raise ValueError(f"Mốc train {train_end} >= số nến hiện có {n_steps}: không có đoạn out-of-sample")
+    folds = holdout_folds(n_steps, train_end, test_bars, step)
+    checkpoints = find_checkpoints(models_dir)
+    if not folds:
+        raise ValueError(f"Đoạn sau mốc train ({n_steps - train_end} nến từ bước {train_end}) "
+                         f"không đủ cho 1 fold test {test_bars} nến")
+    if not checkpoints:
+        raise FileNotFoundError(f"Không có checkpoint .zip trong {models_dir}")
+
+    workers = max(1, min(workers, len(checkpoints)))
+    threads = max(1, (os.cpu_count() or 1) // workers)  # Tránh các process tranh nhau core khi chạy torch
+    print(f"Out-of-sample: {len(checkpoints)} checkpoint x {len(folds)} fold ({test_bars} nến test "
+          f"từ bước {train_end}), {workers} process x {threads} thread")
+
+    rows = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cfg, data, folds, threads)) as pool:
+        futures = {pool.submit(evaluate_checkpoint, path): path for path in checkpoints}
+        for fut in as_completed(futures):
+            fold_rows, seconds = fut.result()
+            rows.extend(fold_rows)
+            print(f"   -> {os.path.basename(futures[fut])}: rollout {seconds:.2f}s")
+    print(f"Xong trong {time.perf_counter() - t0:.2f}s")
+
+    folds_df = pd.DataFrame(rows).sort_values(['checkpoint', 'fold']).reset_index(drop=True)
+    return leaderboard(folds_df), folds_df
+
+
+if __name__ == "__main__":
+    with open('../config.yaml', 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f)
+    eval_cfg = cfg.get('evaluation', {})
+    default_dir = os.path.join(cfg['paths']['models_dir'], f"{cfg['model_type'].upper()}_{cfg['project_name']}")
+
+    parser = argparse.ArgumentParser(description="Đánh giá out-of-sample các checkpoint đã lưu (đoạn sau mốc train)")
+    parser.add_argument("--models-dir", default=default_dir)
+    parser.add_argument("--train-end", type=int, default=None,
+                        help=f"Mốc cuối dữ liệu train (bước); mặc định đọc <models-dir>/{HORIZON_FILE}")
+    parser.add_argument("--test-bars", type=int, default=eval_cfg.get('test_bars', 720))
+    parser.add_argument("--step", type=int, default=eval_cfg.get('step'))
+    parser.add_argument("--workers", type=int, default=eval_cfg.get('workers', os.cpu_count()))
+    parser.add_argument("--output", default=None, help="Mặc định: <models-dir>/leaderboard.csv")
+    args = parser.parse_args()
+
+    board, folds_df = run_holdout(cfg, args.models_dir, args.test_bars, step=args.step,
+                                  workers=args.workers, train_end=args.train_end)
+
+    output = args.output or os.path.join(args.models_dir, "leaderboard.csv")
+    board.to_csv(output, index=False)
+    folds_df.to_csv(os.path.splitext(output)[0] + "_folds.csv", index=False)
+    print(board.to_string(index=False))
+    print(f"\nSaved leaderboard to: {output}")
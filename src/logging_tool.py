@@ -1,5 +1,7 @@
 import logging
 import os
+import time
+from contextlib import contextmanager
 from logging.handlers import RotatingFileHandler
 
 
@@ -25,3 +27,29 @@ def setup_logging():
     logger.addHandler(console_handler)
 
     return logger
+
+
+class StageTimer:
+    # Đo thời gian (ms) từng giai đoạn của 1 tick live; summary() -> 1 dòng log
+    # spans: (tên, bắt đầu tính từ đầu tick, thời lượng) theo thứ tự chạy - dùng cho trace (metrics.py)
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.stages = {}
+        self.spans = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.stages[name] = self.stages.get(name, 0.0) + ms
+            self.spans.append((name, (start - self.t0) * 1000, ms))
+
+    def total(self):
+        return (time.perf_counter() - self.t0) * 1000
+
+    def summary(self):
+        parts = [f"{name} {ms:.1f}ms" for name, ms in self.stages.items()]
+        return " | ".join(parts + [f"total {self.total():.1f}ms"])
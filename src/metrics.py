@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+from data.rate_limit import shared_scheduler
+from logging_tool import StageTimer
+
+# Mốc histogram (ms): từ predict/feature (vài ms) tới nến đóng -> lệnh, retry (vài chục giây)
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+PREFIX = "tradingbot_"
+SKIP_OUTCOMES = ("no_new_candle", "no_features", "not_enough_candles")
+
+logger = logging.getLogger("TradingBot")
+
+
+def _num(value):
+    return str(value) if isinstance(value, int) and not isinstance(value, bool) else repr(float(value))
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+def _group(store):
+    # {(tên, nhãn): giá trị} -> [(tên, [(nhãn, giá trị), ...])] theo thứ tự tên
+    groups = {}
+    for (name, labels), value in sorted(store.items(), key=lambda item: item[0]):
+        groups.setdefault(name, []).append((labels, value))
+    return groups.items()
+
+
+class MetricsRegistry:
+    """
+    Counter, gauge và histogram theo (tên, nhãn), thread-safe (các luồng I/O cùng ghi).
+    render(): định dạng text của Prometheus - scrape qua serve_metrics() hoặc đọc file write()
+    (textfile collector của node_exporter).
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = []  # fn() -> [(tên, {nhãn}, giá trị)]: gauge đọc lúc xuất (VD: RequestScheduler)
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            hist["counts"][bisect_left(self.buckets, value)] += 1  # Bucket đầu tiên có cận trên >= value
+            hist["sum"] += value
+            hist["count"] += 1
+
+    @contextmanager
+    def timed(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000, **labels)
+
+    def render(self):
+        gauges = {}
+        for collect in self.collectors:
+            for name, labels, value in collect():
+                gauges[self._key(name, labels)] = value
+        lines = []
+        with self.lock:
+            gauges.update(self.gauges)
+            for kind, store in (("counter", self.counters), ("gauge", gauges)):
+                for name, series in _group(store):
+                    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                    lines.extend(f"{PREFIX}{name}{_labels(labels)} {_num(value)}" for labels, value in series)
+            for name, series in _group(self.histograms):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for labels, hist in series:
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + ("+Inf",), hist["counts"]):
+                        cumulative += count
+                        le = bound if isinstance(bound, str) else _num(bound)
+                        lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {_num(hist['sum'])}")
+                    lines.append(f"{PREFIX}{name}_count{_labels(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # Ghi file tạm rồi đổi tên: scraper không bao giờ đọc phải file ghi dở
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+METRICS = MetricsRegistry()  # Dùng chung trong process (executor, client, vòng live)
+
+
+def scheduler_gauges():
+    # Trạng thái RequestScheduler dùng chung: weight đã dùng, số lần 429/418, retry, thời gian chờ theo ưu tiên
+    m = shared_scheduler().metrics()
+    rows = [("rate_limit_used_weight", {}, m["used_weight_1m"]),
+            ("rate_limit_utilization", {}, m["utilization"]),
+            ("rate_limit_blocked_seconds", {}, m["blocked_for"])]
+    rows += [(f"rate_limit_{key}", {}, m[key]) for key in ("requests", "orders", "rate_limited", "banned", "retries")]
+    rows += [("rate_limit_wait_seconds", {"priority": p}, v) for p, v in m["wait_seconds"].items()]
+    rows += [("rate_limit_queued", {"priority": p}, v) for p, v in m["queued"].items()]
+    return rows
+
+
+def serve_metrics(registry, port, host="127.0.0.1"):
+    # GET /metrics -> registry.render() trên thread nền (endpoint cho Prometheus scrape)
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def _trace_logger(path):
+    # Mỗi tick 1 dòng JSON, xoay file như trading.log (5MB, giữ 3 file cũ); không in ra console
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    trace = logging.getLogger("TradingBot.trace")
+    trace.propagate = False
+    if not trace.handlers:
+        handler = RotatingFileHandler(path, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        trace.addHandler(handler)
+        trace.setLevel(logging.INFO)
+    return trace
+
+
+class TickTrace(StageTimer):
+    # StageTimer của 1 tick + mốc đóng nến (ms) và thời điểm bắt đầu theo đồng hồ của lịch (giờ mô phỏng khi replay)
+    def __init__(self, symbol, boundary=None, clock=time.time):
+        super().__init__()
+        self.symbol = symbol
+        self.boundary = boundary
+        self.started_at = clock()
+
+
+class LiveMetrics:
+    """
+    Số liệu vận hành của bot live, mỗi tick:
+    - histogram (ms): từng stage, tổng tick, trễ bắt đầu tick sau đóng nến
+      (+ từ executor/client: mỗi API endpoint, truy vấn tài khoản, đặt lệnh, nến đóng -> lệnh tới sàn)
+    - counter: tick theo kết quả, tick bị bỏ qua, lỗi API, lệnh rebalance / rebalance bị bỏ qua
+    Xuất qua HTTP /metrics (metrics_port), file Prometheus ghi lại sau mỗi tick (metrics_file)
+    và trace JSON mỗi tick với các span (trace_file).
+    """
+
+    def __init__(self, registry=METRICS, metrics_port=None, metrics_file=None, trace_file=None, clock=time.time):
+        self.registry = registry
+        self.metrics_file = metrics_file
+        self.clock = clock
+        self.trace_log = _trace_logger(trace_file) if trace_file else None
+        if scheduler_gauges not in registry.collectors:
+            registry.collectors.append(scheduler_gauges)
+        self.server = serve_metrics(registry, metrics_port) if metrics_port else None
+        if self.server is not None:
+            print(f"Metrics: http://127.0.0.1:{metrics_port}/metrics")
+
+    @classmethod
+    def from_config(cls, live_cfg, clock=time.time):
+        return cls(metrics_port=live_cfg.get("metrics_port"), metrics_file=live_cfg.get("metrics_file"),
+                   trace_file=live_cfg.get("trace_file"), clock=clock)
+
+    def start_tick(self, symbol, boundary=None):
+        trace = TickTrace(symbol, boundary, self.clock)
+        if boundary is not None:
+            self.registry.observe("tick_start_delay_ms", trace.started_at * 1000 - boundary, symbol=symbol)
+        return trace
+
+    def skipped(self, reason, symbol, count=1):
+        self.registry.inc("skipped_ticks_total", count, symbol=symbol, reason=reason)
+
+    def finish(self, trace, outcome, orders=(), **attrs):
+        total = trace.total()
+        reg = self.registry
+        for name, _, ms in trace.spans:
+            reg.observe("tick_stage_ms", ms, stage=name, symbol=trace.symbol)
+        reg.observe("tick_total_ms", total, symbol=trace.symbol)
+        reg.inc("ticks_total", symbol=trace.symbol, outcome=outcome)
+        if outcome in SKIP_OUTCOMES:
+            self.skipped(outcome, trace.symbol)
+        reg.set("last_tick_timestamp_seconds", time.time(), symbol=trace.symbol)
+
+        try:
+            if self.trace_log is not None:
+                self.trace_log.info(json.dumps({
+                    "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                    "symbol": trace.symbol,
+                    "candle_close": trace.boundary,
+                    "outcome": outcome,
+                    "start_delay_ms": None if trace.boundary is None else round(trace.started_at * 1000 - trace.boundary, 1),
+                    "total_ms": round(total, 3),
+                    "spans": [{"name": name, "start_ms": round(start, 3), "ms": round(ms, 3)}
+                              for name, start, ms in trace.spans],
+                    "orders": list(orders),
+                    **attrs,
+                }, default=str))
+            if self.metrics_file:
+                self.registry.write(self.metrics_file)
+        except OSError as e:
+            logger.warning(f"Metrics export failed: {e}")  # Không để lỗi ghi file làm dừng bot
@@ -0,0 +1,474 @@
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import requests
+
+from data.rate_limit import WEIGHT_LIMIT_1M, ORDER_LIMIT_10S, ORDER_LIMIT_1M, klines_weight
+from replay_server import KlineReplay
+
+BAN_SECONDS = 120  # Gửi tiếp khi đang bị 429 (chưa hết Retry-After) -> 418, IP bị ban
+BAN_GRACE = 1.0    # Request đã gửi trước khi client kịp nhận 429 (đang bay) chưa tính là vi phạm
+
+# Request weight theo endpoint (theo tài liệu Binance)
+ENDPOINT_WEIGHT = {
+    "/fapi/v1/time": 1,
+    "/fapi/v2/ticker/price": 1,
+    "/fapi/v3/account": 5,
+    "/fapi/v3/positionRisk": 5,
+    "/fapi/v1/order": 0,  # Lệnh tính vào giới hạn số lệnh, không tính IP weight
+    "/fapi/v1/leverage": 1,
+    "/fapi/v1/exchangeInfo": 1,
+}
+
+# Bộ lọc lệnh mặc định (giống BTCUSDT trên Binance USDT-M)
+DEFAULT_FILTERS = {"stepSize": "0.001", "minQty": "0.001", "maxQty": "1000", "marketMaxQty": "120",
+                   "tickSize": "0.10", "minNotional": "100"}
+
+
+class ExchangeError(Exception):
+    # Lỗi trả về client theo định dạng của Binance: HTTP status + {"code", "msg"}
+    def __init__(self, status, code, msg, headers=None):
+        super().__init__(msg)
+        self.status = status
+        self.code = code
+        self.msg = msg
+        self.headers = headers or {}
+
+
+class MockAccount:
+    """
+    Tài khoản USDT-M 1 chiều (one-way) trong bộ nhớ: lệnh MARKET khớp ngay ở giá hiện tại,
+    phí taker tính trên giá trị khớp, PnL đã chốt cộng vào ví khi giảm/đóng/đảo vị thế.
+    """
+
+    def __init__(self, balance=10000.0, fee_rate=0.0004, leverage=20):
+        self.wallet_balance = float(balance)
+        self.fee_rate = fee_rate
+        self.leverage = leverage
+        self.position_amt = 0.0
+        self.entry_price = 0.0
+        self.realized_pnl = 0.0
+        self.fees = 0.0
+        self.next_order_id = 1
+
+    def unrealized_pnl(self, price):
+        return self.position_amt * (price - self.entry_price)
+
+    def available_balance(self, price):
+        margin = abs(self.position_amt) * price / self.leverage
+        return self.wallet_balance + self.unrealized_pnl(price) - margin
+
+    def fill(self, side, qty, price, reduce_only=False):
+        signed_qty = qty if side == "BUY" else -qty
+        pos = self.position_amt
+        if reduce_only:
+            if pos == 0 or (pos > 0) == (signed_qty > 0):
+                raise ExchangeError(400, -2022, "ReduceOnly Order is rejected.")
+            qty = min(qty, abs(pos))
+            signed_qty = qty if side == "BUY" else -qty
+
+        new_pos = round(pos + signed_qty, 8)
+        if abs(new_pos) > abs(pos) and abs(new_pos) * price / self.leverage > self.wallet_balance + self.unrealized_pnl(price):
+            # Tăng vị thế: ký quỹ ban đầu của vị thế mới phải nằm trong vốn (ví + PnL chưa chốt)
+            raise ExchangeError(400, -2019, "Margin is insufficient.")
+
+        realized = 0.0
+        if pos == 0 or (pos > 0) == (signed_qty > 0):
+            self.entry_price = (abs(pos) * self.entry_price + qty * price) / abs(new_pos)
+        else:
+            closed_qty = min(qty, abs(pos))
+            realized = closed_qty * (price - self.entry_price) * (1 if pos > 0 else -1)
+            if new_pos == 0:
+                self.entry_price = 0.0
+            elif (new_pos > 0) != (pos > 0):
+                self.entry_price = price
+
+        fee = qty * price * self.fee_rate
+        self.position_amt = new_pos
+        self.wallet_balance += realized - fee
+        self.realized_pnl += realized
+        self.fees += fee
+
+        order_id = self.next_order_id
+        self.next_order_id += 1
+        return order_id, qty
+
+
+class MockExchange(KlineReplay):
+    """
+    Sàn Binance USDT-M Futures giả lập, chạy offline trên dữ liệu nến CSV (mở rộng KlineReplay):
+
+    - WS  :port/ws/<symbol>@kline_<interval>: như KlineReplay
+    - REST :rest_port: klines, time, exchangeInfo, ticker/price, account, positionRisk, order (MARKET), leverage
+      + /mock/v1/clock (đồng hồ mô phỏng cho client) và /mock/v1/stats (đếm request/lệnh)
+    Thời gian mô phỏng chạy nhanh gấp `speed` nến mỗi giây thực; giá hiện tại = giá đóng của nến
+    đã đóng gần nhất (lệnh MARKET khớp ở đó, cộng trượt giá `slippage_bps`).
+    Header X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-* tính theo thời gian thực, vượt `weight_limit` -> 429,
+    vẫn gửi trong lúc chờ Retry-After -> 418 (ban BAN_SECONDS giây) như sàn thật.
+    Giả lập độ trễ (`latency_ms` ± `jitter_ms`) và lỗi: `error_rate` (503, request không được xử lý),
+    `unknown_rate` (lệnh đã khớp nhưng trả 503 -1007, trạng thái không rõ).
+    Lệnh bị kiểm tra theo bộ lọc `filters` (stepSize, minQty, maxQty, minNotional) như sàn thật.
+    """
+
+    def __init__(self, csv_path, symbol="BTCUSDT", interval="1h", speed=1.0, start=300,
+                 balance=10000.0, fee_rate=0.0004, leverage=20, slippage_bps=0.0,
+                 latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, unknown_rate=0.0, seed=0, filters=None,
+                 weight_limit=WEIGHT_LIMIT_1M):
+        super().__init__(csv_path, symbol=symbol, interval=interval, speed=speed, start=start)
+        self.start_pos = self.pos
+        self.filters = {**DEFAULT_FILTERS, **(filters or {})}
+        self.account = MockAccount(balance, fee_rate, leverage)
+        self.slippage_bps = slippage_bps
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.unknown_rate = unknown_rate
+        self.rng = random.Random(seed)
+        self.weight_limit = weight_limit
+        self.limited_at = 0.0     # Thời điểm 429 đầu tiên và hết hạn Retry-After của đợt bị giới hạn
+        self.limited_until = 0.0
+        self.banned_until = 0.0
+
+        self.lock = threading.Lock()
+        self.t0 = time.time()
+        self.weights = deque()  # (thời điểm, weight) trong 1 phút gần nhất
+        self.orders = deque()   # thời điểm đặt lệnh trong 1 phút gần nhất
+        self.stats = {"requests": 0, "weight": 0, "orders": 0, "errors": 0, "rate_limited": 0, "banned": 0,
+                      "by_path": {}}
+
+    # --- Đồng hồ mô phỏng ---
+    @property
+    def rate(self):
+        # Số giây mô phỏng trên 1 giây thực
+        return self.speed * self.interval_ms / 1000.0
+
+    def server_time(self, now=None):
+        elapsed = (time.time() if now is None else now) - self.t0
+        return int(self.rows[self.start_pos, 0] + elapsed * self.rate * 1000)
+
+    def _sync(self):
+        # Vị trí nến đang chạy theo đồng hồ mô phỏng (REST và WS dùng chung)
+        pos = int(np.searchsorted(self.rows[:, 0], self.server_time(), side="right")) - 1
+        self.pos = max(self.pos, min(pos, len(self.rows) - 1))
+        return self.pos
+
+    def price(self):
+        # Giá hiện tại: giá đóng của nến đã đóng gần nhất
+        return float(self.rows[max(self._sync() - 1, 0), 4])
+
+    def _rest_kline(self, i):
+        if i < self.pos:
+            return super()._rest_kline(i)
+        # Nến đang chạy: mới chỉ có giá mở (không lộ high/low/close tương lai)
+        t, o = self.rows[i, 0], self.rows[i, 1]
+        return [int(t), str(o), str(o), str(o), str(o), "0", int(t) + self.interval_ms - 1,
+                "0", 0, "0", "0", "0"]
+
+    async def play(self):
+        sent = self.pos
+        while sent < len(self.rows) - 1:
+            # Ngủ tới mốc đóng nến kế tiếp theo đồng hồ mô phỏng
+            next_close = self.rows[sent + 1, 0]
+            await asyncio.sleep(max((next_close - self.server_time()) / 1000.0 / self.rate, 0.0))
+            with self.lock:
+                pos = self._sync()
+            for i in range(sent, pos):
+                await self._broadcast(self._kline(i, True))
+            if pos > sent:
+                await self._broadcast(self._kline(pos, False))
+                sent = pos
+        self.finished.set()
+
+    # --- Giới hạn request ---
+    def _count(self, path, weight, is_order):
+        now = time.time()
+        while self.weights and self.weights[0][0] <= now - 60:
+            self.weights.popleft()
+        while self.orders and self.orders[0] <= now - 60:
+            self.orders.popleft()
+
+        used = sum(w for _, w in self.weights) + weight
+        orders_10s = sum(1 for t in self.orders if t > now - 10) + is_order
+        orders_1m = len(self.orders) + is_order
+        headers = {"X-MBX-USED-WEIGHT-1M": str(used)}
+        if is_order:
+            headers["X-MBX-ORDER-COUNT-10S"] = str(orders_10s)
+            headers["X-MBX-ORDER-COUNT-1M"] = str(orders_1m)
+
+        self.stats["requests"] += 1
+        self.stats["by_path"][path] = self.stats["by_path"].get(path, 0) + 1
+        ignoring = self.limited_at + BAN_GRACE < now < self.limited_until
+        if not path.startswith("/mock/") and (ignoring or now < self.banned_until):
+            self.stats["banned"] += 1
+            self.banned_until = max(self.banned_until, now + BAN_SECONDS)
+            raise ExchangeError(418, -1003, f"Way too many requests; IP banned until {int(self.banned_until * 1000)}.",
+                                {**headers, "Retry-After": str(int(self.banned_until - now) + 1)})
+        if used > self.weight_limit or orders_10s > ORDER_LIMIT_10S or orders_1m > ORDER_LIMIT_1M:
+            self.stats["rate_limited"] += 1
+            retry_after = 10 if orders_10s > ORDER_LIMIT_10S else 60
+            if now >= self.limited_until:
+                self.limited_at = now
+            self.limited_until = max(self.limited_until, now + retry_after)
+            raise ExchangeError(429, -1003, "Too many requests; please use the websocket for live updates.",
+                                {**headers, "Retry-After": str(retry_after)})
+
+        self.weights.append((now, weight))
+        self.stats["weight"] += weight
+        if is_order:
+            self.orders.append(now)
+            self.stats["orders"] += 1
+        return headers
+
+    # --- Endpoint ---
+    def handle(self, method, path, q):
+        route = (method, path)
+        if route == ("GET", "/fapi/v1/klines"):
+            limit = min(int(q.get("limit", 500)), 1500)
+            return klines_weight(limit), False, lambda: self.klines(
+                limit=limit,
+                startTime=int(q["startTime"]) if "startTime" in q else None,
+                endTime=int(q["endTime"]) if "endTime" in q else None)
+        if route == ("GET", "/fapi/v1/time"):
+            return ENDPOINT_WEIGHT[path], False, lambda: {"serverTime": self.server_time()}
+        if route == ("GET", "/mock/v1/clock"):
+            return 0, False, lambda: {"serverTime": self.server_time(), "rate": self.rate}
+        if route == ("GET", "/mock/v1/stats"):
+            return 0, False, self._stats_body
+        if route == ("GET", "/fapi/v2/ticker/price"):
+            ticker = lambda: {"symbol": self.symbol, "price": str(self.price()), "time": self.server_time()}
+            if "symbol" not in q:
+                return 2, False, lambda: [ticker()]  # Không truyền symbol: danh sách mọi cặp, weight 2
+            return ENDPOINT_WEIGHT[path], False, ticker
+        if route == ("GET", "/fapi/v3/account"):
+            return ENDPOINT_WEIGHT[path], False, self._account_body
+        if route == ("GET", "/fapi/v3/positionRisk"):
+            return ENDPOINT_WEIGHT[path], False, self._position_body
+        if route == ("GET", "/fapi/v1/exchangeInfo"):
+            return ENDPOINT_WEIGHT[path], False, self._exchange_info
+        if route == ("POST", "/fapi/v1/order"):
+            return ENDPOINT_WEIGHT[path], True, lambda: self._new_order(q)
+        if route == ("POST", "/fapi/v1/leverage"):
+            return ENDPOINT_WEIGHT[path], False, lambda: self._change_leverage(q)
+        raise ExchangeError(404, -5000, f"Path {path} not supported by mock exchange")
+
+    def _exchange_info(self):
+        f = self.filters
+        return {"timezone": "UTC", "serverTime": self.server_time(), "symbols": [{
+            "symbol": self.symbol, "status": "TRADING", "contractType": "PERPETUAL",
+            "baseAsset": self.symbol[:-4], "quoteAsset": "USDT", "marginAsset": "USDT",
+            "orderTypes": ["MARKET"],
+            "filters": [
+                {"filterType": "PRICE_FILTER", "tickSize": f["tickSize"], "minPrice": "0.10", "maxPrice": "4529764"},
+                {"filterType": "LOT_SIZE", "stepSize": f["stepSize"], "minQty": f["minQty"], "maxQty": f["maxQty"]},
+                {"filterType": "MARKET_LOT_SIZE", "stepSize": f["stepSize"], "minQty": f["minQty"],
+                 "maxQty": f["marketMaxQty"]},
+                {"filterType": "MIN_NOTIONAL", "notional": f["minNotional"]},
+            ],
+        }]}
+
+    def _check_filters(self, qty_str, price, reduce_only):
+        f = self.filters
+        qty = Decimal(qty_str)
+        if qty % Decimal(f["stepSize"]) != 0:
+            raise ExchangeError(400, -1111, "Precision is over the maximum defined for this asset.")
+        if qty < Decimal(f["minQty"]):
+            raise ExchangeError(400, -4004, "Quantity less than min quantity.")
+        if qty > Decimal(f["marketMaxQty"]):
+            raise ExchangeError(400, -4005, "Quantity greater than max quantity.")
+        if not reduce_only and qty * Decimal(str(price)) < Decimal(f["minNotional"]):
+            raise ExchangeError(400, -4164, f"Order's notional must be no smaller than {f['minNotional']} "
+                                            f"(unless you choose reduce only).")
+
+    def _stats_body(self):
+        acc = self.account
+        return {**self.stats, "pos": self.pos, "server_time": self.server_time(),
+                "wallet_balance": acc.wallet_balance, "position_amt": acc.position_amt,
+                "realized_pnl": acc.realized_pnl, "fees": acc.fees}
+
+    def _account_body(self):
+        acc, price = self.account, self.price()
+        upnl = acc.unrealized_pnl(price)
+        available = acc.available_balance(price)
+        return {
+            "totalWalletBalance": str(acc.wallet_balance),
+            "totalUnrealizedProfit": str(upnl),
+            "totalMarginBalance": str(acc.wallet_balance + upnl),
+            "availableBalance": str(available),
+            "assets": [{"asset": "USDT", "walletBalance": str(acc.wallet_balance), "unrealizedProfit": str(upnl),
+                        "marginBalance": str(acc.wallet_balance + upnl), "availableBalance": str(available),
+                        "updateTime": self.server_time()}],
+            "positions": [{"symbol": self.symbol, "positionSide": "BOTH", "positionAmt": str(acc.position_amt),
+                           "unrealizedProfit": str(upnl), "notional": str(acc.position_amt * price)}],
+        }
+
+    def _position_body(self):
+        acc, price = self.account, self.price()
+        return [{"symbol": self.symbol, "positionSide": "BOTH", "positionAmt": str(acc.position_amt),
+                 "entryPrice": str(acc.entry_price), "breakEvenPrice": str(acc.entry_price),
+                 "markPrice": str(price), "unRealizedProfit": str(acc.unrealized_pnl(price)),
+                 "liquidationPrice": "0", "notional": str(acc.position_amt * price),
+                 "leverage": str(acc.leverage), "updateTime": self.server_time()}]
+
+    def _new_order(self, q):
+        if q.get("symbol") != self.symbol:
+            raise ExchangeError(400, -1121, "Invalid symbol.")
+        if q.get("type") != "MARKET":
+            raise ExchangeError(400, -1116, "Invalid orderType (mock exchange only fills MARKET).")
+        side = q.get("side")
+        if side not in ("BUY", "SELL"):
+            raise ExchangeError(400, -1117, "Invalid side.")
+        qty = float(q.get("quantity", 0))
+        if qty <= 0:
+            raise ExchangeError(400, -4003, "Quantity less than or equal to zero.")
+        reduce_only = q.get("reduceOnly") == "true"
+        self._check_filters(q["quantity"], self.price(), reduce_only)
+
+        slip = self.slippage_bps / 1e4
+        price = self.price() * (1 + slip if side == "BUY" else 1 - slip)
+        order_id, filled = self.account.fill(side, qty, price, reduce_only=reduce_only)
+        if self.rng.random() < self.unknown_rate:
+            # Lệnh đã khớp nhưng client không nhận được kết quả
+            self.stats["errors"] += 1
+            raise ExchangeError(503, -1007, "Timeout waiting for response from backend server. "
+                                            "Send status unknown; execution status unknown.")
+
+        body = {"orderId": order_id, "symbol": self.symbol, "status": "FILLED", "side": side, "type": "MARKET",
+                "positionSide": "BOTH", "reduceOnly": q.get("reduceOnly") == "true", "origQty": str(qty),
+                "updateTime": self.server_time(), "clientOrderId": q.get("newClientOrderId", f"mock-{order_id}")}
+        if q.get("newOrderRespType") == "RESULT":
+            body.update({"executedQty": str(filled), "avgPrice": str(price), "cumQuote": str(filled * price)})
+        else:
+            body.update({"status": "NEW", "executedQty": "0", "avgPrice": "0.00", "cumQuote": "0"})
+        return body
+
+    def _change_leverage(self, q):
+        leverage = int(q.get("leverage", 0))
+        if not 1 <= leverage <= 125:
+            raise ExchangeError(400, -4028, "Leverage is not valid.")
+        self.account.leverage = leverage
+        return {"leverage": leverage, "maxNotionalValue": "1000000", "symbol": q.get("symbol", self.symbol)}
+
+    def dispatch(self, method, raw_path):
+        # Trả về (status, headers, body) cho 1 request REST
+        url = urlparse(raw_path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        delay = self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        headers = {}
+        try:
+            weight, is_order, action = self.handle(method, url.path, q)
+            with self.lock:
+                headers = self._count(url.path, weight, is_order)
+                if not url.path.startswith("/mock/") and self.rng.random() < self.error_rate:
+                    self.stats["errors"] += 1
+                    raise ExchangeError(503, -1001, "Internal error; unable to process your request. Please try again.",
+                                        headers)
+                return 200, headers, action()
+        except ExchangeError as e:
+            return e.status, {**headers, **e.headers}, {"code": e.code, "msg": e.msg}
+
+    def rest_server(self, host="127.0.0.1", port=8766):
+        exchange = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Giữ kết nối (requests.Session dùng lại)
+            disable_nagle_algorithm = True  # Header và body ghi 2 lần -> tránh trễ ~40ms do Nagle + delayed ACK
+
+            def _respond(self):
+                # Tham số của request ký nằm trên query string hoặc body (form)
+                path = self.path
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    body = self.rfile.read(length).decode()
+                    path += ("&" if "?" in path else "?") + body
+                status, headers, body = exchange.dispatch(self.command, path)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    async def serve(self, host="127.0.0.1", port=8765, rest_port=8766):
+        self.t0 = time.time()
+        server = self.rest_server(host, rest_port)
+        print(f"Mock exchange REST http://{host}:{rest_port} | balance {self.account.wallet_balance} USDT, "
+              f"latency {self.latency_ms}±{self.jitter_ms}ms, error_rate {self.error_rate}")
+        try:
+            await super().serve(host, port)
+        finally:
+            server.shutdown()
+            print(json.dumps(self._stats_body(), indent=2))
+
+
+class ReplayClock:
+    """
+    Đồng hồ phía client bám theo thời gian mô phỏng của MockExchange (dùng cho CandleScheduler):
+    clock() trả về giây mô phỏng, sleep(s) ngủ s giây mô phỏng.
+    """
+
+    def __init__(self, base_url):
+        resp = requests.get(f"{base_url}/mock/v1/clock", timeout=5).json()
+        self.wall0 = time.time()
+        self.sim0 = resp["serverTime"] / 1000.0
+        self.rate = resp["rate"]
+
+    def clock(self):
+        return self.sim0 + (time.time() - self.wall0) * self.rate
+
+    def sleep(self, seconds):
+        time.sleep(max(seconds, 0.0) / self.rate)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sàn Binance USDT-M Futures giả lập (offline) phát lại nến từ CSV")
+    parser.add_argument("--csv", default="../data/raw/BTCUSDT_1h.csv")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--interval", default="1h")
+    parser.add_argument("--speed", type=float, default=1.0, help="Số nến mô phỏng mỗi giây thực")
+    parser.add_argument("--start", type=int, default=1600, help="Bắt đầu phát từ dòng thứ mấy")
+    parser.add_argument("--port", type=int, default=8765, help="Cổng WebSocket (kline stream)")
+    parser.add_argument("--rest-port", type=int, default=8766)
+    parser.add_argument("--balance", type=float, default=10000.0)
+    parser.add_argument("--fee-rate", type=float, default=0.0004)
+    parser.add_argument("--slippage-bps", type=float, default=0.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỉ lệ request bị trả 503 (không xử lý)")
+    parser.add_argument("--unknown-rate", type=float, default=0.0, help="Tỉ lệ lệnh đã khớp nhưng trả 503 -1007")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--weight-limit", type=int, default=WEIGHT_LIMIT_1M, help="Giới hạn weight/phút (hạ thấp để thử 429)")
+    parser.add_argument("--min-notional", default=DEFAULT_FILTERS["minNotional"], help="Bộ lọc MIN_NOTIONAL (USDT)")
+    args = parser.parse_args()
+
+    exchange = MockExchange(args.csv, symbol=args.symbol, interval=args.interval, speed=args.speed, start=args.start,
+                            balance=args.balance, fee_rate=args.fee_rate, slippage_bps=args.slippage_bps,
+                            latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                            unknown_rate=args.unknown_rate, seed=args.seed,
+                            filters={"minNotional": args.min_notional}, weight_limit=args.weight_limit)
+    try:
+        asyncio.run(exchange.serve(port=args.port, rest_port=args.rest_port))
+    except KeyboardInterrupt:
+        pass
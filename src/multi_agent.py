@@ -0,0 +1,226 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from binance_api import BinanceExecutor, BASE_URL, make_client
+from candle_buffer import CandleBuffer
+from scheduler import CandleScheduler
+from data.rate_limit import shared_scheduler
+from metrics import LiveMetrics
+from run_agent import (MODEL_TYPE, MODEL_PATH, SYMBOL, TIMEFRAME, LEVERAGE, LIVE_CFG, SEED_SIZE, CLOSE_RETRIES,
+                       logger, FeatureSync, construct_observation, load_model, execute_action)
+from stream import AccountSnapshot
+
+
+def symbol_specs(live_cfg):
+    # live.symbols: "ETHUSDT" hoặc {symbol, model, model_type, leverage}; thiếu trường nào lấy theo config chung
+    specs = []
+    for item in live_cfg.get("symbols") or [SYMBOL]:
+        item = {"symbol": item} if isinstance(item, str) else dict(item)
+        specs.append({
+            "symbol": item["symbol"].upper(),
+            "model": item.get("model", MODEL_PATH),
+            "model_type": item.get("model_type", MODEL_TYPE).upper(),
+            "leverage": item.get("leverage", LEVERAGE),
+        })
+    return specs
+
+
+class SymbolSlot:
+    # Trạng thái riêng của 1 cặp: executor (ledger, bộ lọc lệnh), buffer nến, feature streaming
+    def __init__(self, spec, client, dry_run=False, pool=None):
+        self.symbol = spec["symbol"]
+        self.model_key = (spec["model"], spec["model_type"])
+        self.model_type = spec["model_type"]
+        self.dry_run = dry_run
+
+        self.executor = BinanceExecutor(symbol=self.symbol, leverage=spec["leverage"], client=client, pool=pool)
+        self.candles = CandleBuffer(client, self.symbol, TIMEFRAME, capacity=SEED_SIZE)
+        self.account = AccountSnapshot(self.symbol) if dry_run else None  # Dry-run: coi như tài khoản trống
+        self.feats = None
+        self.last_decided_ts = None
+
+    def setup(self):
+        self.candles.backfill()
+        self.feats = FeatureSync(self.candles)
+        if self.feats.engine is None:
+            raise RuntimeError(f"{self.symbol}: không tải được lịch sử nến để seed feature")
+        self.last_decided_ts = self.feats.last_closed_ts  # Không trade lại nến lúc seed
+
+    def prepare(self, boundary, mode, price=None):
+        # Nến -> feature -> obs của tick. Trả về (obs, price) hoặc None nếu chưa có gì để quyết định
+        self.executor.begin_tick(price=price, boundary=boundary)
+        self.candles.refresh()
+        if mode == "close":
+            # Sàn có thể trả nến vừa đóng trễ một chút sau mốc
+            for _ in range(CLOSE_RETRIES):
+                if self.candles.last_open_time >= boundary:
+                    break
+                time.sleep(0.5)
+                self.candles.refresh()
+        if len(self.candles) < 2:
+            return None
+
+        self.feats.sync()
+        if mode == "close":
+            if self.feats.last_closed_ts <= self.last_decided_ts:
+                return None
+            features = self.feats.last_features
+        else:
+            features = self.feats.peek_forming()
+        if features is None:
+            return None
+
+        self.last_decided_ts = self.feats.last_closed_ts
+        return construct_observation(features, self.executor, account=self.account)
+
+
+class MultiSymbolAgent:
+    """
+    Trade N cặp trong 1 process theo cùng lịch đóng nến (REST):
+    - dùng chung 1 client (1 pool kết nối keep-alive), RequestScheduler và các model đã load
+      (mỗi file model load 1 lần dù nhiều cặp dùng)
+    - mọi request chạy trên 1 thread pool `workers` luồng (executor các cặp không tạo luồng riêng)
+      -> số request đồng thời không vượt số kết nối keep-alive
+    - mỗi tick: 1 request ticker cho mọi cặp, tải nến + tính feature các cặp song song trên 1 thread pool,
+      gom obs các cặp cùng model thành 1 batch -> 1 lần predict, rồi gửi lệnh các cặp song song
+    - lỗi của 1 cặp chỉ bỏ qua cặp đó trong tick
+    """
+
+    def __init__(self, specs, rest_url=BASE_URL, dry_run=False, workers=16, metrics=None):
+        self.dry_run = dry_run
+        self.metrics = metrics or LiveMetrics()
+        workers = max(1, min(workers, len(specs)))
+        self.client = make_client(rest_url, pool_size=workers)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="symbol")
+
+        self.models = {}
+        for spec in specs:
+            key = (spec["model"], spec["model_type"])
+            if key not in self.models:
+                model = load_model(*key)
+                if model is None:
+                    raise FileNotFoundError(f"Không load được model {key[0]} ({key[1]})")
+                self.models[key] = model
+        self.slots = [SymbolSlot(spec, self.client, dry_run=dry_run, pool=self.pool) for spec in specs]
+
+    def _run(self, fn, slots):
+        # Chạy fn(slot) song song; cặp bị lỗi -> None
+        def safe(slot):
+            try:
+                return fn(slot)
+            except Exception as e:
+                logger.error(f"{slot.symbol}: {e}")
+                slot.executor.invalidate()
+                return None
+        return list(self.pool.map(safe, slots))
+
+    def setup(self):
+        for slot, ok in zip(self.slots, self._run(lambda s: s.setup() or True, self.slots)):
+            if not ok:
+                raise RuntimeError(f"{slot.symbol}: seed thất bại")
+        print(f"Seeded features for {len(self.slots)} symbols")
+
+    def prices(self):
+        # 1 request (weight 2) cho giá mọi cặp thay vì N request ticker; lỗi -> mỗi executor tự hỏi giá
+        try:
+            return {t["symbol"]: float(t["price"]) for t in self.client.ticker_price()}
+        except Exception as e:
+            logger.warning(f"Ticker (all symbols) failed: {e}")
+            return {}
+
+    def predict(self, ready):
+        # Gom obs theo model -> mỗi model 1 lần forward cho cả batch
+        actions = {}
+        groups = {}
+        for slot, obs in ready:
+            groups.setdefault(slot.model_key, []).append((slot, obs))
+        for key, items in groups.items():
+            batch = np.stack([obs for _, obs in items])
+            batch_actions, _ = self.models[key].predict(batch, deterministic=True)
+            for (slot, _), action in zip(items, batch_actions):
+                actions[slot.symbol] = action
+        return actions
+
+    def tick(self, boundary, mode):
+        # Trace mức tick (symbol="ALL"); lệnh của từng cặp mang nhãn symbol riêng
+        trace = self.metrics.start_tick("ALL", boundary)
+        outcome = "error"
+        try:
+            outcome = self._tick(trace, boundary, mode)
+        finally:
+            orders = [o for slot in self.slots for o in slot.executor.tick_orders]
+            self.metrics.finish(trace, outcome, orders=orders, symbols=len(self.slots))
+
+    def _tick(self, timer, boundary, mode):
+        with timer.stage("prices"):
+            prices = {} if self.dry_run else self.prices()
+        with timer.stage("klines_features"):
+            results = self._run(lambda s: s.prepare(boundary, mode, prices.get(s.symbol)), self.slots)
+        ready = [(slot, r[0]) for slot, r in zip(self.slots, results) if r is not None]
+        if not ready:
+            print("No new closed candle yet")
+            return "no_new_candle"
+
+        with timer.stage("predict"):
+            actions = self.predict(ready)
+        logger.info("Signals: " + ", ".join(f"{symbol}={np.round(a, 3)}" for symbol, a in actions.items()))
+        with timer.stage("orders"):
+            self._run(lambda s: execute_action(s.executor, actions[s.symbol], model_type=s.model_type,
+                                               dry_run=self.dry_run), [slot for slot, _ in ready])
+        logger.info(f"Tick {len(ready)}/{len(self.slots)} symbols: {timer.summary()} | {shared_scheduler().summary()}")
+        return "decided"
+
+    def run(self, scheduler):
+        self.setup()
+        print("Waiting for next candle check...")
+        errors = 0  # Số tick lỗi liên tiếp -> backoff có jitter
+        while True:
+            try:
+                boundary, missed = scheduler.wait()
+                if missed > 0:
+                    logger.info(f"Missed {missed} candle closes -> catching up")
+                    self.metrics.skipped("missed_close", "ALL", missed)
+                self.tick(boundary, scheduler.mode)
+                errors = 0
+            except KeyboardInterrupt:
+                print("\nBot stopped by user.")
+                break
+            except Exception as e:
+                errors += 1
+                delay = shared_scheduler().backoff(errors)
+                print(f"Critical Error: {e} -> retry in {delay:.1f}s")
+                scheduler.sleep(delay)
+                scheduler.retry()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live bot nhiều cặp trong 1 process (REST, theo lịch đóng nến)")
+    parser.add_argument("--symbols", nargs="+", default=None, help="Ghi đè live.symbols, VD: BTCUSDT ETHUSDT")
+    parser.add_argument("--rest-url", default=BASE_URL, help="VD: http://127.0.0.1:8766 khi chạy với mock_exchange.py")
+    parser.add_argument("--replay", action="store_true", help="Dùng đồng hồ mô phỏng của mock_exchange.py")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ in tín hiệu, không đặt lệnh")
+    parser.add_argument("--workers", type=int, default=LIVE_CFG.get("workers", 16), help="Số luồng I/O dùng chung")
+    args = parser.parse_args()
+
+    specs = symbol_specs({"symbols": args.symbols} if args.symbols else LIVE_CFG)
+    print(f"STARTING MULTI-SYMBOL BOT - {len(specs)} symbols ({TIMEFRAME}): {', '.join(s['symbol'] for s in specs)}")
+
+    clock = {}
+    if args.replay:
+        from mock_exchange import ReplayClock
+        replay_clock = ReplayClock(args.rest_url)
+        clock = {"clock": replay_clock.clock, "sleep": replay_clock.sleep}
+
+    scheduler = CandleScheduler(
+        TIMEFRAME,
+        mode=LIVE_CFG.get("schedule", "close"),
+        offset_seconds=LIVE_CFG.get("close_offset_seconds", 2),
+        poll_seconds=LIVE_CFG.get("poll_seconds", 60),
+        **clock
+    )
+    agent = MultiSymbolAgent(specs, rest_url=args.rest_url, dry_run=args.dry_run, workers=args.workers,
+                             metrics=LiveMetrics.from_config(LIVE_CFG, clock=scheduler.clock))
+    agent.run(scheduler)
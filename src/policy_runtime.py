@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import zipfile
+
+import numpy as np
+
+FORMAT = "numpy-policy-v1"
+
+_ACTIVATIONS = {
+    "tanh": lambda x: np.tanh(x, out=x),
+    "relu": lambda x: np.maximum(x, 0.0, out=x),
+    "identity": lambda x: x,
+}
+
+
+def _sequential_layers(modules):
+    # Linear -> (W^T, b), hàm kích hoạt -> tên; chỉ hỗ trợ MLP thuần
+    import torch.nn as nn
+
+    layers = []
+    for module in modules:
+        if isinstance(module, nn.Linear):
+            weight = module.weight.detach().cpu().numpy().T.astype(np.float32)
+            bias = module.bias.detach().cpu().numpy().astype(np.float32)
+            layers.append((np.ascontiguousarray(weight), bias))
+        else:
+            name = type(module).__name__.lower()
+            if name not in _ACTIVATIONS:
+                raise ValueError(f"Layer không hỗ trợ khi export: {type(module).__name__}")
+            layers.append(name)
+    return layers
+
+
+def _saved_model_type(model_path):
+    # Đọc lớp policy trong file .zip của SB3 (khỏi phải truyền model_type cho final_model.zip)
+    with zipfile.ZipFile(model_path) as zf:
+        data = json.loads(zf.read("data"))
+    return "DQN" if ".dqn." in data["policy_class"].get("__module__", "") else "PPO"
+
+
+def export_policy(model_path, output_path=None, model_type=None):
+    """
+    Xuất trọng số MlpPolicy (SB3) của model .zip ra file .npz chỉ cần NumPy để chạy.
+    PPO: mạng policy + action_net (action = mean, clip theo action space); DQN: q_net (action = argmax Q).
+    Chỉ bước này cần torch/SB3.
+    """
+    from stable_baselines3 import PPO, DQN
+    from stable_baselines3.common.torch_layers import FlattenExtractor
+
+    model_type = (model_type or _saved_model_type(model_path)).upper()
+    model = (PPO if model_type == "PPO" else DQN).load(model_path, device="cpu")
+    policy = model.policy
+
+    if model_type == "PPO":
+        if not isinstance(policy.pi_features_extractor, FlattenExtractor) or policy.squash_output:
+            raise ValueError("Chỉ export được MlpPolicy (FlattenExtractor, không squash_output)")
+        layers = _sequential_layers(list(policy.mlp_extractor.policy_net) + [policy.action_net])
+    else:
+        if not isinstance(policy.q_net.features_extractor, FlattenExtractor):
+            raise ValueError("Chỉ export được MlpPolicy (FlattenExtractor)")
+        layers = _sequential_layers(policy.q_net.q_net)
+
+    arrays = {}
+    meta = {
+        "format": FORMAT,
+        "model_type": model_type,
+        "obs_dim": int(np.prod(model.observation_space.shape)),
+        "layers": [],
+        "source": os.path.basename(model_path),
+    }
+    for layer in layers:
+        if isinstance(layer, str):
+            meta["layers"].append(layer)
+        else:
+            i = len(arrays) // 2
+            arrays[f"w{i}"], arrays[f"b{i}"] = layer
+            meta["layers"].append(f"linear:{i}")
+    if model_type == "PPO":
+        meta["action_low"] = model.action_space.low.tolist()
+        meta["action_high"] = model.action_space.high.tolist()
+
+    if output_path is None:
+        output_path = os.path.splitext(model_path)[0] + ".npz"
+    np.savez(output_path, meta=np.array(json.dumps(meta)), **arrays)
+    return output_path
+
+
+class NumpyPolicy:
+    """
+    Chạy policy đã export bằng NumPy (float32), không import torch/SB3.
+    predict() cùng chữ ký và cùng kiểu kết quả với model.predict(obs, deterministic=True) của SB3.
+    """
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as f:
+            meta = json.loads(str(f["meta"]))
+            if meta.get("format") != FORMAT:
+                raise ValueError(f"{path} không phải file policy {FORMAT}")
+            self.layers = []
+            for layer in meta["layers"]:
+                if layer.startswith("linear:"):
+                    i = layer.split(":")[1]
+                    self.layers.append((f[f"w{i}"], f[f"b{i}"]))
+                else:
+                    self.layers.append(_ACTIVATIONS[layer])
+
+        self.meta = meta
+        self.model_type = meta["model_type"]
+        self.obs_dim = meta["obs_dim"]
+        if self.model_type == "PPO":
+            self.action_low = np.asarray(meta["action_low"], dtype=np.float32)
+            self.action_high = np.asarray(meta["action_high"], dtype=np.float32)
+
+    @classmethod
+    def load(cls, path):
+        return cls(path)
+
+    def forward(self, obs):
+        # obs (B, obs_dim) float32 -> output lớp cuối (B, n_out)
+        x = obs
+        for layer in self.layers:
+            if isinstance(layer, tuple):
+                x = x @ layer[0]
+                x += layer[1]
+            else:
+                x = layer(x)
+        return x
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        # Luôn deterministic: PPO -> mean action, DQN -> argmax Q
+        obs = np.asarray(observation, dtype=np.float32)
+        single = obs.ndim == 1
+        out = self.forward(obs.reshape(-1, self.obs_dim))
+
+        if self.model_type == "DQN":
+            action = out.argmax(axis=1)
+        else:
+            action = np.clip(out, self.action_low, self.action_high)
+        return (action[0] if single else action), state
+
+
+_BENCH_SCRIPT = """
+import json, sys, time
+t0 = time.perf_counter()
+runtime, path, model_type, n = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+import numpy as np
+if runtime == "numpy":
+    from policy_runtime import NumpyPolicy
+    model = NumpyPolicy.load(path)
+else:
+    from stable_baselines3 import PPO, DQN
+    model = (PPO if model_type == "PPO" else DQN).load(path, device="cpu")
+startup = time.perf_counter() - t0
+obs = np.random.default_rng(0).standard_normal((n, model.observation_space.shape[0] if runtime != "numpy" else model.obs_dim)).astype(np.float32)
+model.predict(obs[0], deterministic=True)
+t1 = time.perf_counter()
+for o in obs:
+    model.predict(o, deterministic=True)
+latency = (time.perf_counter() - t1) / n
+# VmHWM: RSS đỉnh của riêng process này (ru_maxrss trên Linux giữ giá trị của process cha qua fork/exec)
+with open("/proc/self/status") as f:
+    hwm = next(int(line.split()[1]) for line in f if line.startswith("VmHWM"))
+print(json.dumps({"runtime": runtime, "startup_s": startup, "predict_us": latency * 1e6, "max_rss_mb": hwm / 1024}))
+"""
+
+
+def benchmark(model_path, npz_path, model_type, n_predict=2000):
+    # Mỗi runtime chạy trong 1 process mới -> đo đúng thời gian import + load và RSS
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for runtime, path in (("sb3", model_path), ("numpy", npz_path)):
+        out = subprocess.run([sys.executable, "-c", _BENCH_SCRIPT, runtime, path, model_type, str(n_predict)],
+                             cwd=here, capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def compare_actions(model_path, npz_path, model_type, n=10000):
+    # Đối chiếu action của NumpyPolicy với SB3 trên obs ngẫu nhiên
+    from stable_baselines3 import PPO, DQN
+
+    model = (PPO if model_type == "PPO" else DQN).load(model_path, device="cpu")
+    policy = NumpyPolicy.load(npz_path)
+    obs = np.random.default_rng(1).standard_normal((n, policy.obs_dim)).astype(np.float32) * 2.0
+    ref, _ = model.predict(obs, deterministic=True)
+    got, _ = policy.predict(obs)
+    if model_type == "DQN":
+        return {"mismatch": int((ref != got).sum()), "n": n}
+    return {"max_abs_diff": float(np.abs(ref - got).max()), "n": n}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export / benchmark policy NumPy (không cần torch khi chạy live)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export", help="Xuất model .zip (SB3) ra .npz")
+    p_bench = sub.add_parser("bench", help="So sánh startup, RSS, latency predict với SB3")
+    for p in (p_export, p_bench):
+        p.add_argument("--model", required=True, help="File model .zip của SB3")
+        p.add_argument("--model-type", default=None, choices=["PPO", "DQN"])
+        p.add_argument("--output", default=None, help="File .npz (mặc định: cạnh file .zip)")
+    p_bench.add_argument("--n", type=int, default=2000, help="Số lần predict khi đo latency")
+    args = parser.parse_args()
+
+    npz_path = export_policy(args.model, args.output, args.model_type)
+    print(f"Exported policy to: {npz_path}")
+
+    if args.command == "bench":
+        model_type = NumpyPolicy.load(npz_path).model_type
+        print(compare_actions(args.model, npz_path, model_type))
+        for r in benchmark(os.path.abspath(args.model), os.path.abspath(npz_path), model_type, args.n):
+            print(f"{r['runtime']:>6}: startup {r['startup_s']:.3f}s | predict {r['predict_us']:.1f}us | "
+                  f"max RSS {r['max_rss_mb']:.0f}MB")
@@ -0,0 +1,149 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+import gymnasium as gym
+from stable_baselines3.common.vec_env import SubprocVecEnv, VecEnvWrapper
+
+from vec_env import BatchedTradingVecEnv
+
+
+class PhaseTimes:
+    # Tổng thời gian (giây) + số lần gọi theo từng pha, cộng dồn; người đọc tự lấy hiệu giữa 2 lần đọc
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def add(self, name, seconds, calls=1):
+        self.seconds[name] += seconds
+        self.calls[name] += calls
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            result = fn(*args, **kwargs)
+            self.add(name, time.perf_counter() - t0)
+            return result
+        return timed
+
+    def snapshot(self):
+        return {name: (self.seconds[name], self.calls[name]) for name in self.seconds}
+
+
+class StackSampler:
+    """
+    Profiler lấy mẫu thuần Python: thread nền đọc stack của 1 thread (mặc định thread chính) mỗi `interval` giây
+    qua sys._current_frames() trong `seconds` giây, rồi ghi file collapsed stack
+    ("a.py:f;b.py:g <số mẫu>", mở bằng speedscope hoặc flamegraph.pl).
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.counts = Counter()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds, path):
+        self._thread = threading.Thread(target=self._run, args=(seconds, path), name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self, seconds, path):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        self.save(path)
+
+    def top(self, n=10):
+        # Hàm tốn nhiều thời gian nhất theo self time (hàm ở đỉnh stack)
+        leaves = Counter()
+        for stack, count in self.counts.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = max(sum(leaves.values()), 1)
+        return [(name, 100.0 * count / total) for name, count in leaves.most_common(n)]
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Profile pid {os.getpid()}: {sum(self.counts.values())} samples -> {path}\n"
+              + "\n".join(f"   {pct:5.1f}%  {name}" for name, pct in self.top()))
+
+
+class ProfiledEnv(gym.Wrapper):
+    # Đo thời gian trong BitcoinTradingEnv.step, RewardHandler.calculate và dựng obs (chạy trong process của env)
+    def __init__(self, env):
+        super().__init__(env)
+        self.times = PhaseTimes()
+        self.sampler = None
+        base = env.unwrapped
+        base.reward_handler.calculate = self.times.wrap("reward", base.reward_handler.calculate)
+        base._get_observation = self.times.wrap("observation", base._get_observation)
+
+    def step(self, action):
+        t0 = time.perf_counter()
+        result = self.env.step(action)
+        self.times.add("step", time.perf_counter() - t0)
+        return result
+
+    def profile_stats(self):
+        # Gọi qua env_method (SubprocVecEnv: 1 lần IPC mỗi lần báo cáo, không phải mỗi bước)
+        return {"pid": os.getpid(), "steps": self.times.calls["step"], **self.times.snapshot()}
+
+    def start_sampling(self, seconds, path, interval=0.005):
+        if self.sampler is None or not self.sampler.running:
+            self.sampler = StackSampler(interval)
+            self.sampler.start(seconds, path)
+
+
+class TimedVecEnv(VecEnvWrapper):
+    """
+    Đo thời gian learner chờ VecEnv step (gồm IPC với SubprocVecEnv) và gom số liệu của từng env worker.
+    BatchedTradingVecEnv tính mọi env trong process này -> đo luôn reward (calculate_batch) và dựng obs.
+    """
+
+    def __init__(self, venv):
+        super().__init__(venv)
+        self.times = PhaseTimes()
+        self.batched = isinstance(venv, BatchedTradingVecEnv)
+        self.parallel = isinstance(venv, SubprocVecEnv)
+        self.profiled = not self.batched and all(venv.env_is_wrapped(ProfiledEnv))
+        if self.batched:
+            venv.reward_handler.calculate_batch = self.times.wrap("reward", venv.reward_handler.calculate_batch)
+            venv._fill_observation = self.times.wrap("observation", venv._fill_observation)
+        self._t0 = 0.0
+
+    def reset(self):
+        return self.venv.reset()
+
+    def step_async(self, actions):
+        self._t0 = time.perf_counter()
+        self.venv.step_async(actions)
+
+    def step_wait(self):
+        result = self.venv.step_wait()
+        self.times.add("vec_step", time.perf_counter() - self._t0)
+        return result
+
+    def worker_stats(self):
+        # [{'pid', 'steps', 'step': (giây, lần gọi), 'reward': ..., 'observation': ...}] mỗi process/env, cộng dồn
+        if self.batched:
+            times = self.times.snapshot()
+            return [{"pid": os.getpid(), "steps": self.times.calls["vec_step"] * self.num_envs,
+                     "step": times.get("vec_step", (0.0, 0)),
+                     **{k: v for k, v in times.items() if k != "vec_step"}}]
+        if self.profiled:
+            return self.venv.env_method("profile_stats")
+        return []
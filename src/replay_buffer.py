@@ -0,0 +1,227 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+import yaml
+from gymnasium import spaces
+from stable_baselines3.common.buffers import BaseBuffer, ReplayBuffer
+from stable_baselines3.common.type_aliases import ReplayBufferSamples
+
+from data.columnar import is_dataset, load_dataset
+from vec_env import BatchedTradingVecEnv
+
+
+def load_state(dataset):
+    # Mảng state (N, k) float32 của dataset: thư mục dạng cột (memmap, dùng chung page cache) hoặc file CSV state
+    if is_dataset(dataset):
+        return load_dataset(dataset).state
+    return np.ascontiguousarray(pd.read_csv(dataset).to_numpy(dtype=np.float32))
+
+
+class CompactReplayBuffer(BaseBuffer):
+    """
+    Replay buffer cho DQN không lưu observation: obs = state[row] (cột thị trường, có sẵn trong dataset)
+    + [vị thế, lợi nhuận tích lũy]; next_obs luôn là hàng row + 1 (env đi 1 nến mỗi bước).
+    Mỗi transition chỉ giữ row (int32), vị thế trước/sau (int8), PnL trước/sau (float32),
+    action (uint8), reward (float32), done/timeout (bool): 21 byte thay vì 84 byte của ReplayBuffer.
+    Obs được dựng lại bằng gather vectorized lúc sample, giống hệt obs gốc.
+
+    Row lấy từ info['step'] của env (BitcoinTradingEnv / BatchedTradingVecEnv luôn trả về).
+    storage_dir: lưu các mảng ra file .npy memmap (buffer lớn hơn RAM, OS giữ phần đang dùng trong page cache).
+    """
+
+    # 1 bản ghi packed (không padding) mỗi transition -> sample chỉ cần 1 lần gather
+    RECORD = np.dtype([
+        ("row", np.int32),
+        ("position", np.int8),
+        ("next_position", np.int8),
+        ("pnl", np.float32),
+        ("next_pnl", np.float32),
+        ("action", np.uint8),
+        ("reward", np.float32),
+        ("done", np.bool_),
+        ("timeout", np.bool_),
+    ])
+
+    def __init__(self, buffer_size, observation_space, action_space, device="auto", n_envs=1,
+                 optimize_memory_usage=False, handle_timeout_termination=True, dataset=None, storage_dir=None):
+        super().__init__(buffer_size, observation_space, action_space, device, n_envs=n_envs)
+        # buffer_size là tổng số transition (như ReplayBuffer): chia đều cho các env
+        self.buffer_size = max(buffer_size // n_envs, 1)
+        if not isinstance(action_space, spaces.Discrete) or action_space.n > 256:
+            raise ValueError("CompactReplayBuffer chỉ dùng cho action rời rạc (DQN, <= 256 action)")
+        if dataset is None:
+            raise ValueError("CompactReplayBuffer cần `dataset` (thư mục dạng cột hoặc CSV state) để dựng lại obs")
+        self.dataset = dataset
+        self._state = None
+        self.n_market = self.obs_shape[0] - 2
+
+        # optimize_memory_usage của SB3 không cần: obs không được lưu
+        self.handle_timeout_termination = handle_timeout_termination
+        self.storage_path = None
+        shape = (self.buffer_size, self.n_envs)
+        if storage_dir is None:
+            self.records = np.zeros(shape, dtype=self.RECORD)
+        else:
+            # Thư mục riêng mỗi buffer: DQN.load (đánh giá checkpoint lúc đang train) không ghi đè file đang dùng
+            os.makedirs(storage_dir, exist_ok=True)
+            self.storage_path = tempfile.mkdtemp(prefix="replay_", dir=storage_dir)
+            self.records = np.lib.format.open_memmap(os.path.join(self.storage_path, "transitions.npy"), mode="w+",
+                                                     dtype=self.RECORD, shape=shape)
+            weakref.finalize(self, shutil.rmtree, self.storage_path, True)  # Buffer là dữ liệu tạm: xóa khi giải phóng
+
+    @property
+    def state(self):
+        # Tải lần đầu dùng tới (DQN.load cũng tạo buffer, không cần dataset nếu không train tiếp)
+        if self._state is None:
+            state = load_state(self.dataset)
+            if state.shape[1] != self.n_market:
+                raise ValueError(f"Obs {self.obs_shape} không khớp state {state.shape[1]} cột + 2 cột tài khoản")
+            self._state = state
+        return self._state
+
+    def __getstate__(self):
+        # save_replay_buffer (pickle): không kèm mảng state của dataset, tải lại từ `dataset` khi dùng tới
+        state = self.__dict__.copy()
+        state["_state"] = None
+        return state
+
+    @property
+    def nbytes(self):
+        return self.records.nbytes
+
+    def add(self, obs, next_obs, action, reward, done, infos):
+        # info['step'] là hàng của next_obs (env đã đi 1 nến) -> obs ở hàng trước đó
+        rows = np.fromiter((info["step"] for info in infos), dtype=np.int64, count=self.n_envs) - 1
+        obs = np.asarray(obs).reshape(self.n_envs, -1)
+        next_obs = np.asarray(next_obs).reshape(self.n_envs, -1)
+        m = self.n_market
+        if not (np.array_equal(obs[:, :m], self.state[rows]) and np.array_equal(next_obs[:, :m], self.state[rows + 1])):
+            raise ValueError("Obs không khớp state của dataset (sai dataset hoặc obs đã bị chuẩn hóa)")
+
+        record = self.records[self.pos]
+        record["row"] = rows
+        record["position"] = obs[:, m]
+        record["next_position"] = next_obs[:, m]
+        record["pnl"] = obs[:, m + 1]
+        record["next_pnl"] = next_obs[:, m + 1]
+        record["action"] = np.asarray(action).reshape(self.n_envs)
+        record["reward"] = np.asarray(reward).reshape(self.n_envs)
+        record["done"] = np.asarray(done).reshape(self.n_envs)
+        if self.handle_timeout_termination:
+            record["timeout"] = [info.get("TimeLimit.truncated", False) for info in infos]
+
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+            self.pos = 0
+
+    def _build_obs(self, rows, positions, pnls):
+        obs = np.empty((len(rows), self.n_market + 2), dtype=np.float32)
+        np.take(self.state, rows, axis=0, out=obs[:, :self.n_market])
+        obs[:, self.n_market] = positions
+        obs[:, self.n_market + 1] = pnls
+        return obs
+
+    def _get_samples(self, batch_inds, env=None):
+        # Cùng thứ tự rút ngẫu nhiên với ReplayBuffer (batch_inds rồi env_indices) -> cùng seed cho cùng mẫu
+        env_indices = np.random.randint(0, high=self.n_envs, size=(len(batch_inds),))
+        # Chỉ số phẳng + np.take trên view 1 chiều: nhanh gấp ~3 lần fancy index 2 chiều với bản ghi packed
+        batch = np.take(self.records.reshape(-1), batch_inds * self.n_envs + env_indices)
+        rows = batch["row"]
+        obs = self._build_obs(rows, batch["position"], batch["pnl"])
+        next_obs = self._build_obs(rows + 1, batch["next_position"], batch["next_pnl"])
+        dones = batch["done"] & ~batch["timeout"]
+
+        data = (
+            self._normalize_obs(obs, env),
+            batch["action"].astype(np.int64).reshape(-1, 1),
+            self._normalize_obs(next_obs, env),
+            dones.astype(np.float32).reshape(-1, 1),
+            self._normalize_reward(batch["reward"].astype(np.float32).reshape(-1, 1), env),  # copy liền mạch
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
+
+
+def buffer_nbytes(buffer):
+    if isinstance(buffer, CompactReplayBuffer):
+        return buffer.nbytes
+    names = ["observations", "next_observations", "actions", "rewards", "dones", "timeouts"]
+    return sum(getattr(buffer, name).nbytes for name in names if getattr(buffer, name, None) is not None)
+
+
+def fill_buffers(buffers, dataset, n_transitions, n_envs=64, seed=0):
+    # Đổ transition thật (env batch, action ngẫu nhiên) vào các buffer, giống luồng add() của DQN
+    venv = BatchedTradingVecEnv(n_envs=n_envs, model_type="DQN", lean_info=True, dataset=dataset)
+    rng = np.random.default_rng(seed)
+    obs = venv.reset()
+    for _ in range(n_transitions // n_envs):
+        actions = rng.integers(0, 4, size=n_envs)
+        next_obs, rewards, dones, infos = venv.step(actions)
+        real_next = next_obs.copy()
+        for i in np.flatnonzero(dones):
+            real_next[i] = infos[i]["terminal_observation"]
+        for buffer in buffers:
+            buffer.add(obs, real_next, actions, rewards, dones, infos)
+        obs = next_obs
+
+
+def benchmark(dataset, n_transitions=1_000_000, batch_sizes=(32, 256), n_samples=2000, n_envs=64):
+    """
+    So sánh ReplayBuffer (SB3) và CompactReplayBuffer (RAM / memmap) trên cùng transition:
+    byte mỗi transition, số mẫu sample() mỗi giây, và kiểm tra mẫu giống hệt nhau với cùng seed.
+    """
+    probe = BatchedTradingVecEnv(n_envs=1, model_type="DQN", lean_info=True, dataset=dataset)
+    size = n_transitions // n_envs
+    args = (n_transitions, probe.observation_space, probe.action_space)
+    buffers = {
+        "sb3": ReplayBuffer(*args, device="cpu", n_envs=n_envs),
+        "compact": CompactReplayBuffer(*args, device="cpu", n_envs=n_envs, dataset=dataset),
+        "compact_memmap": CompactReplayBuffer(*args, device="cpu", n_envs=n_envs, dataset=dataset,
+                                              storage_dir=tempfile.gettempdir()),
+    }
+    t0 = time.perf_counter()
+    fill_buffers(list(buffers.values()), dataset, n_transitions, n_envs)
+    print(f"Filled {size * n_envs} transitions in {time.perf_counter() - t0:.1f}s")
+
+    results = []
+    for name, buffer in buffers.items():
+        row = {"buffer": name, "bytes_per_transition": buffer_nbytes(buffer) / (size * n_envs)}
+        for batch_size in batch_sizes:
+            np.random.seed(0)
+            t = time.perf_counter()
+            for _ in range(n_samples):
+                buffer.sample(batch_size)
+            row[f"samples_per_s_b{batch_size}"] = n_samples * batch_size / (time.perf_counter() - t)
+        results.append(row)
+
+    # Cùng seed -> cùng transition, obs dựng lại phải giống hệt bản SB3 lưu
+    np.random.seed(1)
+    ref = buffers["sb3"].sample(4096)
+    np.random.seed(1)
+    got = buffers["compact"].sample(4096)
+    identical = all(bool((a == b).all()) for a, b in zip(ref, got) if a is not None)
+    return results, identical
+
+
+if __name__ == "__main__":
+    with open("../config.yaml", "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+
+    parser = argparse.ArgumentParser(description="Benchmark CompactReplayBuffer với ReplayBuffer của SB3")
+    parser.add_argument("--dataset", default=cfg["paths"].get("dataset"), help="Thư mục dataset dạng cột")
+    parser.add_argument("--n", type=int, default=1_000_000, help="Số transition")
+    parser.add_argument("--n-envs", type=int, default=64)
+    parser.add_argument("--samples", type=int, default=2000, help="Số lần sample() mỗi cỡ batch")
+    args = parser.parse_args()
+
+    results, identical = benchmark(args.dataset, args.n, n_samples=args.samples, n_envs=args.n_envs)
+    for r in results:
+        print(f"{r['buffer']:>15}: {r['bytes_per_transition']:.1f} B/transition | "
+              + " | ".join(f"{k.split('_')[-1]} {v / 1e6:.2f}M samples/s" for k, v in r.items() if k.startswith("samples")))
+    print(f"Samples identical to SB3 ReplayBuffer: {identical}")
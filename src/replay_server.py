@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import json
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+from websockets.asyncio.server import serve
+
+from candle_buffer import INTERVAL_MS
+
+
+class KlineReplay:
+    """
+    Server WebSocket giả lập luồng kline của Binance Futures, phát lại từ file CSV (data/raw).
+
+    - WS  /ws/<symbol>@kline_<interval>: mỗi bước phát nến vừa đóng (x=true) rồi nến kế tiếp (x=false)
+    - GET /fapi/v1/klines: trả các nến tới vị trí phát hiện tại (để client backfill khi kết nối lại)
+    `speed` = số nến phát mỗi giây.
+    """
+
+    def __init__(self, csv_path, symbol="BTCUSDT", interval="1h", speed=1.0, start=300):
+        df = pd.read_csv(csv_path)
+        self.rows = df[["timestamp", "open", "high", "low", "close", "volume"]].to_numpy(dtype=np.float64)
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.speed = speed
+        self.pos = min(start, len(self.rows) - 1)  # Vị trí nến đang chạy; các nến trước đó đã đóng
+        self.clients = set()
+        self.finished = asyncio.Event()
+
+    def _kline(self, i, closed):
+        t, o, h, l, c, v = self.rows[i]
+        return {
+            "e": "kline", "E": int(t) + self.interval_ms, "s": self.symbol,
+            "k": {"t": int(t), "T": int(t) + self.interval_ms - 1, "s": self.symbol, "i": self.interval,
+                  "o": str(o), "h": str(h), "l": str(l), "c": str(c), "v": str(v), "x": closed},
+        }
+
+    def _rest_kline(self, i):
+        t, o, h, l, c, v = self.rows[i]
+        return [int(t), str(o), str(h), str(l), str(c), str(v), int(t) + self.interval_ms - 1,
+                "0", 0, "0", "0", "0"]
+
+    def klines(self, limit=500, startTime=None, endTime=None):
+        times = self.rows[:, 0]
+        end = self.pos + 1
+        if endTime is not None:
+            end = min(end, int(np.searchsorted(times, endTime, side="right")))
+        if startTime is not None:
+            start = int(np.searchsorted(times, startTime, side="left"))
+            end = min(end, start + limit)
+        else:
+            start = max(0, end - limit)
+        return [self._rest_kline(i) for i in range(start, end)]
+
+    def process_request(self, connection, request):
+        url = urlparse(request.path)
+        if url.path.startswith("/ws/"):
+            return None  # Handshake WebSocket bình thường
+
+        if url.path == "/fapi/v1/klines":
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            body = self.klines(limit=min(int(q.get("limit", 500)), 1500),
+                               startTime=int(q["startTime"]) if "startTime" in q else None,
+                               endTime=int(q["endTime"]) if "endTime" in q else None)
+            response = connection.respond(200, json.dumps(body))
+            del response.headers["Content-Type"]
+            response.headers["Content-Type"] = "application/json"
+            return response
+        return connection.respond(404, "Not Found")
+
+    async def handler(self, ws):
+        self.clients.add(ws)
+        try:
+            await ws.send(json.dumps(self._kline(self.pos, False)))
+            await ws.wait_closed()
+        finally:
+            self.clients.discard(ws)
+
+    async def _broadcast(self, msg):
+        data = json.dumps(msg)
+        for ws in list(self.clients):
+            try:
+                await ws.send(data)
+            except Exception:
+                self.clients.discard(ws)
+
+    async def play(self):
+        while self.pos < len(self.rows) - 1:
+            await asyncio.sleep(1.0 / self.speed)
+            await self._broadcast(self._kline(self.pos, True))
+            self.pos += 1
+            await self._broadcast(self._kline(self.pos, False))
+        self.finished.set()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        async with serve(self.handler, host, port, process_request=self.process_request):
+            print(f"Replay server ws://{host}:{port}/ws/{self.symbol.lower()}@kline_{self.interval} "
+                  f"| http://{host}:{port}/fapi/v1/klines | {self.speed} nến/giây")
+            await self.play()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Phát lại nến từ CSV qua WebSocket (giả lập Binance)")
+    parser.add_argument("--csv", default="../data/raw/BTCUSDT_1h.csv")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--interval", default="1h")
+    parser.add_argument("--speed", type=float, default=10.0, help="Số nến phát mỗi giây")
+    parser.add_argument("--start", type=int, default=1600, help="Bắt đầu phát từ dòng thứ mấy")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    replay = KlineReplay(args.csv, symbol=args.symbol, interval=args.interval, speed=args.speed, start=args.start)
+    asyncio.run(replay.serve(port=args.port))
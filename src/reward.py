@@ -56,4 +56,30 @@ class RewardHandler:
             'dd_penalty': dd_penalty,
             'trend_factor': trend_factor,
             'max_drawdown': current_dd
-        }
\ No newline at end of file
+        }
+
+    def calculate_batch(self,
+                        net_worth,
+                        max_net_worth,
+                        current_price,
+                        past_price,
+                        position,
+                        trend_flag):
+        # Phiên bản vector hóa của calculate() cho N env cùng lúc.
+        # max_net_worth là mảng đỉnh tài sản của từng env, được cập nhật tại chỗ.
+        np.maximum(max_net_worth, net_worth, out=max_net_worth)
+
+        log_return = np.log(current_price / past_price)
+        step_reward = position * log_return
+
+        risk_cost = np.abs(position) * self.holding_penalty
+
+        current_dd = (max_net_worth - net_worth - risk_cost) / max_net_worth
+        dd_penalty = self.beta * current_dd
+
+        trend_factor = np.where((trend_flag == 0.0) & (position > 0), 0.5, 1.0)
+
+        raw_reward = (step_reward - dd_penalty) * trend_factor
+        total_reward = raw_reward * self.scaling
+        return np.clip(total_reward, -10, 10)
+
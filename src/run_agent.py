@@ -1,3 +1,4 @@
+import argparse
 import time
 
 
@@ -8,11 +9,15 @@ import yaml
 import logging_tool
 from dotenv import load_dotenv
 from datetime import datetime
-from stable_baselines3 import PPO, DQN
 
-from binance_api import BinanceExecutor
-from data.features_full import add_technical_indicators
-from logging_tool import setup_logging
+from binance_api import BinanceExecutor, BASE_URL
+from candle_buffer import CandleBuffer
+from scheduler import CandleScheduler
+from data.features_stream import StreamingFeatures
+from data.rate_limit import shared_scheduler
+from logging_tool import setup_logging, StageTimer
+from metrics import LiveMetrics
+from policy_runtime import NumpyPolicy
 
 load_dotenv()
 logger = setup_logging()
@@ -44,30 +49,56 @@ SYMBOL = cfg["symbol"]
 LEVERAGE = cfg["leverage"]
 WINDOW_SIZE = cfg["env"]["window_size"]
 MAX_CAPITAL_USAGE = cfg["max_capital_usage"]
-
-
-def get_live_klines(client, symbol, interval, limit=100):
-    try:
-        klines = client.klines(symbol=symbol, interval=interval, limit=limit)
-        data = []
-        for k in klines:
-            data.append({
-                "timestamp": k[0],
-                "open": float(k[1]),
-                "high": float(k[2]),
-                "low": float(k[3]),
-                "close": float(k[4]),
-                "volume": float(k[5])
-            })
-        return pd.DataFrame(data)
-    except Exception as e:
-        print(f"Error fetching klines: {e}")
-        return None
-
-
-def construct_observation(df_features, executor):
-    # 1. Lấy dữ liệu thị trường mới nhất
-    last_row = df_features.iloc[-1]
+LIVE_CFG = cfg.get("live", {})
+POLICY_RUNTIME = LIVE_CFG.get("policy_runtime", "sb3")
+SEED_SIZE = 1500  # Dung lượng buffer nến = số nến seed feature (tối đa 1 request klines của Binance Futures)
+CLOSE_RETRIES = 10  # Số lần thử lại (mỗi 0.5s) nếu sàn chưa trả nến vừa đóng
+
+
+class FeatureSync:
+    # Giữ bộ tính feature streaming khớp với CandleBuffer (dùng chung cho vòng REST và WebSocket)
+    def __init__(self, candles):
+        self.candles = candles
+        self.engine = None
+        self.last_closed_ts = None
+        self.last_features = None  # Feature của nến đã đóng gần nhất
+        self.reseed()
+
+    def reseed(self):
+        # Seed bộ tính feature streaming từ lịch sử nến ĐÃ ĐÓNG (bỏ nến cuối đang chạy)
+        df = self.candles.to_frame()
+        if len(df) < 2:
+            return False
+
+        self.engine = StreamingFeatures()
+        self.last_features = self.engine.seed(df.iloc[:-1])
+        self.last_closed_ts = int(df['timestamp'].iloc[-2])
+        return True
+
+    def sync(self, last_closed=False):
+        # Đưa các nến mới đóng vào bộ tính feature (O(1) mỗi nến). Trả về số nến mới.
+        if self.engine is None:
+            return len(self.candles) - 1 if self.reseed() else 0
+
+        new_closed = self.candles.closed_since(self.last_closed_ts, last_closed=last_closed)
+        if len(new_closed) and new_closed[0, 0] - self.last_closed_ts > self.candles.interval_ms:
+            # Thiếu nến giữa feature và buffer (mất kết nối lâu hơn dung lượng buffer) -> seed lại
+            self.reseed()
+            return len(new_closed)
+
+        for ts, _, high, low, close, _ in new_closed:
+            self.last_features = self.engine.update(high, low, close)
+            self.last_closed_ts = int(ts)
+        return len(new_closed)
+
+    def peek_forming(self):
+        # Nến cuối đang chạy: tính tạm, không thay đổi trạng thái
+        _, _, high, low, close, _ = self.candles.forming()
+        return self.engine.peek(high, low, close)
+
+
+def construct_observation(last_row, executor, account=None):
+    # 1. Lấy dữ liệu thị trường mới nhất (dict feature của nến hiện tại)
 
     market_state = np.array([
         last_row['Norm_Close'],
@@ -78,9 +109,13 @@ def construct_observation(df_features, executor):
         last_row['I_trend']
     ])
 
-    # 2. Lấy dữ liệu tài khoản
-    current_pos_amt, current_price = executor.get_current_state()
-    max_qty = executor.get_max_qty(current_price)
+    # 2. Lấy dữ liệu tài khoản (từ user-data stream nếu có, không thì gọi REST)
+    if account is not None:
+        current_pos_amt = account.position_amt
+        max_qty = executor.get_max_qty(last_row['close'], usdt_balance=account.wallet_balance)
+    else:
+        current_pos_amt, current_price = executor.get_current_state()
+        max_qty = executor.get_max_qty(current_price)
 
     if max_qty > 0:
         current_pos_pct = current_pos_amt / max_qty
@@ -90,8 +125,11 @@ def construct_observation(df_features, executor):
     # Chuẩn hóa về [-1, 1]
     current_pos_pct = np.clip(current_pos_pct, -1.0, 1.0)
 
-    # Giả lập PnL
-    account_pnl_pct = 0.0
+    # Lợi nhuận tích lũy từ ledger (hoặc từ user-data stream)
+    if account is not None:
+        account_pnl_pct = account.pnl_pct(last_row['close'])
+    else:
+        account_pnl_pct = executor.account_pnl_pct(current_price)
 
     account_state = np.array([current_pos_pct, account_pnl_pct])
 
@@ -100,70 +138,198 @@ def construct_observation(df_features, executor):
     return obs, last_row['close']
 
 
-def main():
-    print(f"STARTING LIVE BOT [{MODEL_TYPE}] - {SYMBOL} ({TIMEFRAME})")
-    print(f"Model Path: {MODEL_PATH}")
-
-    final_model_path = MODEL_PATH
+def load_model(model_path=MODEL_PATH, model_type=MODEL_TYPE):
+    final_model_path = model_path
     if not os.path.exists(final_model_path):
         if os.path.exists(final_model_path + ".zip"):
             final_model_path += ".zip"
         else:
-            print(f"Error: Model not found at {MODEL_PATH}")
-            return
+            print(f"Error: Model not found at {model_path}")
+            return None
+
+    if POLICY_RUNTIME == "numpy":
+        # Policy đã export (policy_runtime.py export): chỉ cần NumPy, không import torch/SB3
+        npz_path = os.path.splitext(final_model_path)[0] + ".npz"
+        if not os.path.exists(npz_path):
+            print(f"Error: Chưa export policy NumPy: {npz_path} (python policy_runtime.py export --model {final_model_path})")
+            return None
+        print(f"Loading NumPy policy: {npz_path}")
+        model = NumpyPolicy.load(npz_path)
+        if model.model_type != model_type:
+            print(f"Error: {npz_path} là policy {model.model_type}, config là {model_type}")
+            return None
+        print("Model loaded successfully!")
+        return model
 
-    executor = BinanceExecutor(symbol=SYMBOL)
+    from stable_baselines3 import PPO, DQN
 
     print(f"Loading model: {final_model_path}")
-    if MODEL_TYPE == "PPO":
+    if model_type == "PPO":
         model = PPO.load(final_model_path)
     else:
         model = DQN.load(final_model_path)
-        print("Model loaded successfully!")
+    print("Model loaded successfully!")
+    return model
 
 
-    print("Waiting for next candle check...")
+def execute_action(executor, action, model_type=MODEL_TYPE, dry_run=False):
+    # Action của policy -> lệnh (dry_run: chỉ in tín hiệu)
+    if model_type == "DQN":
+        act_int = int(action)
+        print(f"DQN Signal: {act_int}")
+        if not dry_run:
+            executor.execute_dqn(act_int)
 
-    while True:
-        try:
-            # 1. Lấy dữ liệu
-            df = get_live_klines(executor.client, SYMBOL, TIMEFRAME, limit=WINDOW_SIZE)
+    elif model_type == "PPO":
+        target_pct = action[0]
+        logger.info(f"PPO Target: {target_pct:.2f} ({(target_pct * 100 * MAX_CAPITAL_USAGE):.1f}% Vốn)")
+        if not dry_run:
+            executor.execute_ppo(target_pct)
 
-            if df is not None and not df.empty:
-                # 2. Tính Feature
-                df_processed = add_technical_indicators(df)
-                # 3. Tạo State
-                obs, current_price = construct_observation(df_processed, executor)
 
-                # Log
-                print(f"\n{datetime.now().strftime('%H:%M:%S')} | Price: {current_price:.2f}")
-                print(f"State: RSI={obs[1]:.2f} | Trend={obs[5]:.0f} | Pos={obs[6]:.2f}")
+def decide_and_execute(model, executor, features, account=None, dry_run=False, timer=None):
+    # Snapshot tài khoản của tick (executor.begin_tick do phía gọi) dùng chung cho construct_observation và execute_*
+    timer = timer or StageTimer()
 
-                # 4. Dự đoán
-                action, _ = model.predict(obs, deterministic=True)     # deterministic true là dùng mean của gaus
+    # 3. Tạo State (chờ snapshot đang tải nền nếu chưa xong)
+    with timer.stage("snapshot"):
+        obs, current_price = construct_observation(features, executor, account=account)
 
-                # 5. Thực thi
-                if MODEL_TYPE == "DQN":
-                    act_int = int(action)
-                    print(f"DQN Signal: {act_int}")
-                    executor.execute_dqn(act_int)
+    # Log
+    print(f"\n{datetime.now().strftime('%H:%M:%S')} | Price: {current_price:.2f}")
+    print(f"State: RSI={obs[1]:.2f} | Trend={obs[5]:.0f} | Pos={obs[6]:.2f}")
 
-                elif MODEL_TYPE == "PPO":
-                    target_pct = action[0]
-                    logger.info(f"PPO Target: {target_pct:.2f} ({(target_pct * 100 * MAX_CAPITAL_USAGE):.1f}% Vốn)")
-                    executor.execute_ppo(target_pct)
+    # 4. Dự đoán
+    with timer.stage("predict"):
+        action, _ = model.predict(obs, deterministic=True)     # deterministic true là dùng mean của gaus
 
+    # 5. Thực thi: mọi input đã có sẵn trong snapshot -> gửi lệnh ngay (1 round trip)
+    with timer.stage("decision_to_order"):
+        execute_action(executor, action, dry_run=dry_run)
 
-            print(" Sleeping 60s...")
-            time.sleep(60)
+    logger.info(f"Tick timings: {timer.summary()} | {shared_scheduler().summary()}")
+    return action
+
+
+def decision_expected(candles, last_decided_ts, mode):
+    # Tick này sẽ ra quyết định: chế độ nến đang chạy, hoặc buffer đã có nến đóng mới hơn nến đã quyết định
+    if mode != "close":
+        return True
+    return len(candles) >= 2 and candles.last_open_time - candles.interval_ms > last_decided_ts
+
+
+def main(rest_url=BASE_URL, replay=False):
+    print(f"STARTING LIVE BOT [{MODEL_TYPE}] - {SYMBOL} ({TIMEFRAME})")
+    print(f"Model Path: {MODEL_PATH}")
+
+    model = load_model()
+    if model is None:
+        return
+
+    executor = BinanceExecutor(symbol=SYMBOL, base_url=rest_url)
+
+    candles = CandleBuffer(executor.client, SYMBOL, TIMEFRAME, capacity=SEED_SIZE)
+    candles.backfill()
+    feats = FeatureSync(candles)
+    if feats.engine is None:
+        print("Error: Không tải được lịch sử nến để seed feature")
+        return
+    print(f"Seeded features with {feats.engine.n_candles} closed candles")
+
+    clock = {}
+    if replay:
+        # Chạy với mock_exchange.py: lịch đóng nến theo đồng hồ mô phỏng (nhanh hơn thời gian thực)
+        from mock_exchange import ReplayClock
+        replay_clock = ReplayClock(rest_url)
+        clock = {"clock": replay_clock.clock, "sleep": replay_clock.sleep}
+
+    scheduler = CandleScheduler(
+        TIMEFRAME,
+        mode=LIVE_CFG.get("schedule", "close"),
+        offset_seconds=LIVE_CFG.get("close_offset_seconds", 2),
+        poll_seconds=LIVE_CFG.get("poll_seconds", 60),
+        **clock
+    )
+    # Histogram độ trễ + counter mỗi tick -> /metrics, file Prometheus, trace JSON (live.metrics_*)
+    live_metrics = LiveMetrics.from_config(LIVE_CFG, clock=scheduler.clock)
+    last_decided_ts = feats.last_closed_ts  # Nến đóng cuối cùng đã ra quyết định (không trade lại nến lúc seed)
+
+    print("Waiting for next candle check...")
+
+    errors = 0  # Số tick lỗi liên tiếp -> backoff có jitter
+    while True:
+        trace, outcome = None, None
+        try:
+            boundary, missed = scheduler.wait()
+            trace = live_metrics.start_tick(SYMBOL, boundary)
+            if missed > 0:
+                logger.info(f"Missed {missed} candle closes -> catching up")
+                live_metrics.skipped("missed_close", SYMBOL, missed)
+
+            executor.begin_tick(boundary=boundary)
+
+            # 1. Lấy dữ liệu: chỉ tải nến mới + vá nến đang chạy
+            with trace.stage("klines"):
+                candles.refresh()
+                if scheduler.mode == "close":
+                    # Sàn có thể trả nến vừa đóng trễ một chút sau mốc
+                    for _ in range(CLOSE_RETRIES):
+                        if candles.last_open_time >= boundary:
+                            break
+                        time.sleep(0.5)
+                        candles.refresh()
+            if decision_expected(candles, last_decided_ts, scheduler.mode):
+                # Giá/vị thế/số dư của tick tải nền, song song với tính feature + dựng obs
+                executor.prefetch()
+
+            outcome = "not_enough_candles"
+            if len(candles) >= 2:
+                # 2. Cập nhật Feature: chỉ đưa vào các nến mới đóng (O(1) mỗi nến)
+                with trace.stage("features"):
+                    feats.sync()
+
+                if scheduler.mode == "close":
+                    # Chỉ quyết định 1 lần cho mỗi nến mới đóng
+                    if feats.last_closed_ts <= last_decided_ts:
+                        print("No new closed candle yet")
+                        outcome = "no_new_candle"
+                        continue
+                    features = feats.last_features
+                else:
+                    features = feats.peek_forming()
+
+                if features is None:
+                    print("Not enough history for features yet")
+                    outcome = "no_features"
+                    continue
+
+                last_decided_ts = feats.last_closed_ts
+                decide_and_execute(model, executor, features, timer=trace)
+                outcome = "decided"
+            errors = 0
 
         except KeyboardInterrupt:
             print("\nBot stopped by user.")
+            trace = None
             break
         except Exception as e:
-            print(f"Critical Error: {e}")
-            time.sleep(10)
+            errors += 1
+            if trace is not None:
+                # Ghi tick lỗi trước khi backoff (thời gian chờ không tính vào tick)
+                live_metrics.finish(trace, "error", orders=executor.tick_orders, error=repr(e))
+                trace = None
+            delay = shared_scheduler().backoff(errors)
+            print(f"Critical Error: {e} -> retry in {delay:.1f}s")
+            scheduler.sleep(delay)
+            scheduler.retry()
+        finally:
+            if trace is not None:
+                live_metrics.finish(trace, outcome, orders=executor.tick_orders)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Live bot chạy theo lịch đóng nến (REST)")
+    parser.add_argument("--rest-url", default=BASE_URL, help="VD: http://127.0.0.1:8766 khi chạy với mock_exchange.py")
+    parser.add_argument("--replay", action="store_true", help="Dùng đồng hồ mô phỏng của mock_exchange.py")
+    args = parser.parse_args()
+    main(rest_url=args.rest_url, replay=args.replay)
@@ -0,0 +1,65 @@
+import math
+import time
+
+from candle_buffer import INTERVAL_MS
+
+
+class CandleScheduler:
+    """
+    Lịch chạy bám theo thời điểm đóng nến.
+
+    mode="close": thức dậy `offset_seconds` sau mỗi mốc timeframe (00:00, 01:00, ... với 1h),
+                  mỗi nến đóng chỉ được xử lý đúng 1 lần. Nếu bot bị treo qua nhiều mốc, lần
+                  wait() kế tiếp trả về ngay cùng số mốc bị lỡ để vòng lặp bắt kịp.
+    mode="poll":  chạy mỗi `poll_seconds` trên nến đang chạy (hành vi cũ).
+    """
+
+    def __init__(self, interval, mode="close", offset_seconds=2.0, poll_seconds=60,
+                 clock=time.time, sleep=time.sleep):
+        if mode not in ("close", "poll"):
+            raise ValueError(f"Unknown schedule mode: {mode}")
+        self.interval_s = INTERVAL_MS[interval] / 1000.0
+        self.mode = mode
+        self.offset_seconds = offset_seconds
+        self.poll_seconds = poll_seconds
+        self.clock = clock
+        self.sleep = sleep
+
+        # Mốc (giây, epoch) của nến mở gần nhất đã được xử lý
+        self.last_boundary = None
+
+    def _boundary(self, t):
+        return math.floor(t / self.interval_s) * self.interval_s
+
+    def start(self):
+        # Bỏ qua mốc hiện tại: lần xử lý đầu tiên là ở lần đóng nến kế tiếp
+        self.last_boundary = self._boundary(self.clock() - self.offset_seconds)
+
+    def wait(self):
+        """
+        Ngủ tới lần chạy kế tiếp.
+        Trả về (boundary, missed): boundary là open time (ms) của nến đang chạy,
+        nến vừa đóng có open time = boundary - interval; missed là số mốc bị lỡ trước đó.
+        """
+        if self.mode == "poll":
+            self.sleep(self.poll_seconds)
+            return int(self._boundary(self.clock()) * 1000), 0
+
+        if self.last_boundary is None:
+            self.start()
+
+        while True:
+            boundary = self._boundary(self.clock() - self.offset_seconds)
+            if boundary > self.last_boundary:
+                break
+            wake_at = self.last_boundary + self.interval_s + self.offset_seconds
+            self.sleep(max(wake_at - self.clock(), 0.0))
+
+        missed = int(round((boundary - self.last_boundary) / self.interval_s)) - 1
+        self.last_boundary = boundary
+        return int(boundary * 1000), missed
+
+    def retry(self):
+        # Tick lỗi -> lần wait() kế tiếp chạy lại ngay mốc hiện tại thay vì đợi nến sau
+        if self.mode == "close" and self.last_boundary is not None:
+            self.last_boundary -= self.interval_s
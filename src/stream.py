@@ -0,0 +1,164 @@
+import asyncio
+import json
+import time
+from abc import ABC, abstractmethod
+
+import websockets
+
+# MAINNET:
+# WS_URL = "wss://fstream.binance.com"
+# TESTNET (khuyến nghị):
+WS_URL = "wss://stream.binancefuture.com"
+
+LISTEN_KEY_KEEPALIVE = 30 * 60  # listenKey hết hạn sau 60 phút nếu không gia hạn
+
+
+def parse_kline_event(evt):
+    # Sự kiện kline của Binance -> ([open_time, open, high, low, close, volume], nến đã đóng?)
+    k = evt["k"]
+    row = [k["t"], float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"]), float(k["v"])]
+    return row, k["x"]
+
+
+class AccountSnapshot:
+    # Trạng thái tài khoản cục bộ, cập nhật từ ACCOUNT_UPDATE của user-data stream
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.position_amt = 0.0
+        self.entry_price = 0.0
+        self.wallet_balance = 0.0
+        self.start_balance = None
+        self.updated_at = 0
+
+    def load_rest(self, client):
+        # Đồng bộ lại từ REST (lúc khởi động / sau khi kết nối lại)
+        for p in client.get_position_risk(symbol=self.symbol):
+            if p['symbol'] == self.symbol:
+                self.position_amt = float(p['positionAmt'])
+                self.entry_price = float(p['entryPrice'])
+                break
+        account = client.account()
+        usdt = next((item for item in account['assets'] if item['asset'] == 'USDT'), None)
+        if usdt is not None:
+            self.wallet_balance = float(usdt['walletBalance'])
+            if self.start_balance is None:
+                self.start_balance = self.wallet_balance
+        self.updated_at = int(time.time() * 1000)
+
+    def pnl_pct(self, price):
+        # Lợi nhuận tích lũy (%) so với số dư lúc bắt đầu (giống obs của env)
+        if not self.start_balance:
+            return 0.0
+        equity = self.wallet_balance + self.position_amt * (price - self.entry_price)
+        return (equity - self.start_balance) / self.start_balance
+
+    def apply_event(self, evt):
+        if evt.get("e") != "ACCOUNT_UPDATE":
+            return False
+        data = evt["a"]
+        for b in data.get("B", []):
+            if b["a"] == "USDT":
+                self.wallet_balance = float(b["wb"])
+        for p in data.get("P", []):
+            if p["s"] == self.symbol:
+                self.position_amt = float(p["pa"])
+                self.entry_price = float(p["ep"])
+        self.updated_at = evt.get("E", int(time.time() * 1000))
+        return True
+
+
+class _ReconnectingStream(ABC):
+    # Vòng kết nối WebSocket: tự kết nối lại với backoff, gọi on_connect (backfill) sau mỗi lần nối.
+    # Lớp con phải có _url và _handle (thiếu -> lỗi ngay khi tạo, không phải trong vòng kết nối lại)
+    def __init__(self, on_connect=None, max_backoff=60):
+        self.on_connect = on_connect
+        self.max_backoff = max_backoff
+        self.connects = 0
+        self.messages = 0
+
+    @abstractmethod
+    async def _url(self):
+        ...
+
+    @abstractmethod
+    async def _handle(self, evt):
+        ...
+
+    async def _session(self, ws):
+        async for msg in ws:
+            self.messages += 1
+            await self._handle(json.loads(msg))
+
+    async def run(self):
+        backoff = 1
+        while True:
+            try:
+                url = await self._url()
+                async with websockets.connect(url, ping_interval=20) as ws:
+                    backoff = 1
+                    self.connects += 1
+                    if self.on_connect is not None:
+                        await self.on_connect()
+                    await self._session(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"{type(self).__name__} disconnected: {e} -> reconnect in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+
+class KlineStream(_ReconnectingStream):
+    # <symbol>@kline_<interval>: gọi on_kline(row, closed) cho mỗi cập nhật nến
+    def __init__(self, symbol, interval, on_kline, on_connect=None, ws_url=WS_URL):
+        super().__init__(on_connect=on_connect)
+        self.url = f"{ws_url}/ws/{symbol.lower()}@kline_{interval}"
+        self.on_kline = on_kline
+
+    async def _url(self):
+        return self.url
+
+    async def _handle(self, evt):
+        if evt.get("e") != "kline":
+            return
+        row, closed = parse_kline_event(evt)
+        await self.on_kline(row, closed)
+
+
+class UserDataStream(_ReconnectingStream):
+    # User-data stream (ACCOUNT_UPDATE / ORDER_TRADE_UPDATE), listenKey gia hạn định kỳ
+    def __init__(self, client, account, on_event=None, ws_url=WS_URL):
+        super().__init__(on_connect=self._backfill)
+        self.client = client
+        self.account = account
+        self.on_event = on_event
+        self.ws_url = ws_url
+        self.listen_key = None
+
+    async def _url(self):
+        resp = await asyncio.to_thread(self.client.new_listen_key)
+        self.listen_key = resp["listenKey"]
+        return f"{self.ws_url}/ws/{self.listen_key}"
+
+    async def _backfill(self):
+        # Các cập nhật bị lỡ lúc mất kết nối -> lấy lại snapshot qua REST
+        await asyncio.to_thread(self.account.load_rest, self.client)
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(LISTEN_KEY_KEEPALIVE)
+            await asyncio.to_thread(self.client.renew_listen_key, self.listen_key)
+
+    async def _session(self, ws):
+        keepalive = asyncio.create_task(self._keepalive())
+        try:
+            await super()._session(ws)
+        finally:
+            keepalive.cancel()
+
+    async def _handle(self, evt):
+        if evt.get("e") == "listenKeyExpired":
+            raise ConnectionError("listenKey expired")
+        self.account.apply_event(evt)
+        if self.on_event is not None:
+            await self.on_event(evt)
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+
+from binance_api import BinanceExecutor, BASE_URL, API_KEY
+from candle_buffer import CandleBuffer
+from metrics import LiveMetrics
+from run_agent import (MODEL_TYPE, SYMBOL, TIMEFRAME, SEED_SIZE, LIVE_CFG, logger,
+                       FeatureSync, load_model, decide_and_execute)
+from stream import WS_URL, AccountSnapshot, KlineStream, UserDataStream
+
+
+class StreamAgent:
+    """
+    Live bot chạy theo sự kiện WebSocket thay vì poll REST:
+    - kline stream: ra quyết định ngay khi nhận sự kiện nến đóng (x=true)
+    - user-data stream: vị thế/số dư cập nhật qua ACCOUNT_UPDATE, không cần gọi REST mỗi tick
+    - mỗi lần kết nối lại: backfill nến bị lỡ qua REST (CandleBuffer.refresh) rồi bắt kịp feature
+    """
+
+    def __init__(self, model, executor, ws_url=WS_URL, user_stream=True, dry_run=False, metrics=None):
+        self.model = model
+        self.executor = executor
+        self.dry_run = dry_run
+        self.metrics = metrics or LiveMetrics()
+
+        self.candles = CandleBuffer(executor.client, SYMBOL, TIMEFRAME, capacity=SEED_SIZE)
+        self.feats = None
+        self.last_decided_ts = None
+        self.account = AccountSnapshot(SYMBOL)
+        self._decide_lock = asyncio.Lock()
+
+        self.kline_stream = KlineStream(SYMBOL, TIMEFRAME, self.on_kline, on_connect=self.on_connect, ws_url=ws_url)
+        self.user_stream = UserDataStream(executor.client, self.account, ws_url=ws_url) if user_stream else None
+
+    async def setup(self):
+        await asyncio.to_thread(self.candles.backfill)
+        self.feats = FeatureSync(self.candles)
+        self.last_decided_ts = self.feats.last_closed_ts  # Không trade lại nến lúc seed
+        print(f"Seeded features with {self.feats.engine.n_candles} closed candles")
+
+    async def on_connect(self):
+        # Backfill nến bị lỡ trong lúc mất kết nối; nếu có nến mới đóng thì quyết định trên nến mới nhất
+        await asyncio.to_thread(self.candles.refresh)
+        if self.feats.sync():
+            await self.maybe_decide()
+
+    async def on_kline(self, row, closed):
+        self.candles.push(row)
+        if closed:
+            self.feats.sync(last_closed=True)
+            await self.maybe_decide()
+
+    async def maybe_decide(self):
+        async with self._decide_lock:
+            if self.feats.last_closed_ts <= self.last_decided_ts:
+                return
+            features = self.feats.last_features
+            if features is None:
+                print("Not enough history for features yet")
+                return
+            self.last_decided_ts = self.feats.last_closed_ts
+            close_ms = self.last_decided_ts + self.candles.interval_ms  # Thời điểm đóng của nến vừa đóng
+            trace = self.metrics.start_tick(SYMBOL, close_ms)
+
+            # Dry-run không có user-data stream: coi như tài khoản trống
+            account = self.account if (self.user_stream is not None or self.dry_run) else None
+            try:
+                # Giá/vị thế cho lệnh tải nền trong lúc tạo obs + predict (dry-run không đặt lệnh)
+                self.executor.begin_tick(prefetch=not self.dry_run, boundary=close_ms)
+                await asyncio.to_thread(decide_and_execute, self.model, self.executor, features,
+                                        account, self.dry_run, trace)
+                self.metrics.finish(trace, "decided", orders=self.executor.tick_orders)
+            except Exception as e:
+                print(f"Critical Error: {e}")
+                self.metrics.finish(trace, "error", orders=self.executor.tick_orders, error=repr(e))
+
+    async def run(self):
+        await self.setup()
+        tasks = [self.kline_stream.run()]
+        if self.user_stream is not None:
+            tasks.append(self.user_stream.run())
+        await asyncio.gather(*tasks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live bot chạy bằng WebSocket stream")
+    parser.add_argument("--ws-url", default=WS_URL, help="VD: ws://127.0.0.1:8765 khi chạy với replay_server.py")
+    parser.add_argument("--rest-url", default=BASE_URL, help="VD: http://127.0.0.1:8765 (replay_server.py) hoặc http://127.0.0.1:8766 (REST của mock_exchange.py)")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ in tín hiệu, không đặt lệnh")
+    parser.add_argument("--no-user-stream", action="store_true", help="Không dùng user-data stream (không cần API key)")
+    args = parser.parse_args()
+
+    print(f"STARTING STREAM BOT [{MODEL_TYPE}] - {SYMBOL} ({TIMEFRAME}) | {args.ws_url}")
+    model = load_model()
+    if model is not None:
+        agent = StreamAgent(
+            model,
+            BinanceExecutor(symbol=SYMBOL, base_url=args.rest_url),
+            ws_url=args.ws_url,
+            user_stream=not args.no_user_stream and API_KEY is not None,
+            dry_run=args.dry_run,
+            metrics=LiveMetrics.from_config(LIVE_CFG)
+        )
+        try:
+            asyncio.run(agent.run())
+        except KeyboardInterrupt:
+            logger.info("Stream bot stopped by user.")
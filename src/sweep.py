@@ -0,0 +1,319 @@
+import argparse
+import copy
+import glob
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from stable_baselines3 import PPO, DQN
+from stable_baselines3.common.save_util import load_from_pkl
+
+from backtest import Backtester, load_env
+from cpu_budget import parse_cpus, apply_budget, worker_thread_env, format_cpus
+from evaluate import find_checkpoints, rollout, save_horizon
+from train import load_config, load_data, build_env, build_model, make_callbacks
+from vec_env import BatchedTradingVecEnv
+
+# Bảng kết quả: mỗi dòng là 1 run (trial) tại 1 mốc successive halving
+RESULT_COLUMNS = {
+    "sweep": "TEXT", "trial": "INTEGER", "rung": "INTEGER", "timesteps": "INTEGER", "status": "TEXT",
+    "metric": "REAL", "params": "TEXT",
+    "steps": "INTEGER", "final_net_worth": "REAL", "total_return": "REAL", "sharpe": "REAL",
+    "max_drawdown": "REAL", "turnover": "REAL", "n_trades": "INTEGER", "fee_drag": "REAL",
+    "total_reward": "REAL", "blown": "INTEGER",
+    "train_seconds": "REAL", "checkpoint": "TEXT", "error": "TEXT", "finished_at": "TEXT",
+}
+
+
+def set_path(cfg, key, value):
+    # "ppo_params.learning_rate" -> cfg['ppo_params']['learning_rate'] = value
+    *parents, leaf = key.split(".")
+    node = cfg
+    for part in parents:
+        node = node.setdefault(part, {})
+    node[leaf] = value
+
+
+def sample_value(spec, rng):
+    # [a, b, c] -> chọn 1 giá trị | {low, high, log, int} -> đều (hoặc log-đều) trong [low, high]
+    if isinstance(spec, list):
+        return spec[rng.integers(len(spec))]
+    low, high = float(spec["low"]), float(spec["high"])
+    value = math.exp(rng.uniform(math.log(low), math.log(high))) if spec.get("log") else rng.uniform(low, high)
+    return int(round(value)) if spec.get("int") else float(value)
+
+
+def expand_params(sweep_cfg, seed=0):
+    # sweep.params -> danh sách bộ tham số của các run (grid: mọi tổ hợp, random: n_trials mẫu)
+    params = sweep_cfg.get("params") or {}
+    if not params:
+        raise ValueError("sweep.params trống: cần ít nhất 1 tham số để sweep")
+    method = sweep_cfg.get("method", "grid")
+    if method == "grid":
+        bad = [key for key, spec in params.items() if not isinstance(spec, list)]
+        if bad:
+            raise ValueError(f"Grid cần danh sách giá trị cho {bad} (khoảng low/high chỉ dùng với method: random)")
+        return [dict(zip(params, combo)) for combo in itertools.product(*params.values())]
+    if method == "random":
+        rng = np.random.default_rng(seed)
+        return [{key: sample_value(spec, rng) for key, spec in params.items()}
+                for _ in range(sweep_cfg.get("n_trials", 16))]
+    raise ValueError(f"sweep.method '{method}' không hợp lệ (grid | random)")
+
+
+def rung_schedule(min_timesteps, max_timesteps, eta):
+    # Các mốc train: min, min x eta, min x eta^2, ... < max, rồi max
+    rungs, t = [], int(min_timesteps)
+    while t < max_timesteps:
+        rungs.append(t)
+        t *= eta
+    return rungs + [int(max_timesteps)]
+
+
+def plan_slots(cfg, workers, threads=None):
+    # Chia tập core system.cpus cho các process của pool: mỗi run giữ `threads` core riêng, không tranh core nhau
+    cpus = parse_cpus(cfg["system"].get("cpus"))
+    threads = threads or max(1, len(cpus) // workers)
+    workers = max(1, min(workers, len(cpus) // threads))
+    pin = cfg["system"].get("pin_cpus", True)
+    return [{"threads": threads, "cpus": cpus[i * threads:(i + 1) * threads] if pin else None}
+            for i in range(workers)]
+
+
+def trial_config(cfg, params, logs_dir):
+    trial_cfg = copy.deepcopy(cfg)
+    system = trial_cfg["system"]
+    # Mỗi run đã là 1 process của pool (có ngân sách core riêng) -> env chạy trong process đó
+    if system.get("vec_env", "subproc") == "subproc":
+        system["vec_env"] = "dummy"
+    system["usage_report_seconds"] = 0
+    trial_cfg.setdefault("profiling", {})["enabled"] = False
+    for algo in ("ppo_params", "dqn_params"):
+        if algo in trial_cfg:
+            trial_cfg[algo]["verbose"] = 0  # Log của nhiều run song song sẽ lẫn vào nhau
+    trial_cfg["paths"]["logs_dir"] = logs_dir
+    for key, value in params.items():
+        set_path(trial_cfg, key, value)
+    return trial_cfg
+
+
+_worker = {}
+
+
+def _init_worker(slots):
+    # Mỗi process của pool lấy 1 phần ngân sách core, giữ cho mọi run nó chạy
+    budget = slots.get()
+    apply_budget(budget)
+    _worker["budget"] = budget
+
+
+def run_rung(trial, cfg, timesteps, trial_dir, eval_bars):
+    """
+    Train 1 run tới `timesteps` bước (tiếp từ checkpoint của mốc trước nếu có) trên các nến trước đoạn
+    validation, lưu checkpoint cùng kiểu tên với CheckpointCallback, rồi rollout deterministic trên đoạn
+    validation và tính thống kê bằng Backtester. Đoạn validation là `eval_bars` nến ngay trước
+    `training.holdout_bars` nến cuối: đoạn holdout của evaluate.py không tham gia chọn siêu tham số.
+    """
+    t0 = time.perf_counter()
+    model_type = cfg["model_type"].upper()
+    model_cls = PPO if model_type == "PPO" else DQN
+    device = cfg["system"].get("device", "auto")
+    prefix = os.path.join(trial_dir, f"{model_type}_model")
+
+    dataset, df_full, df_state = load_data(cfg)
+    data = {"dataset": dataset} if dataset else {"df_full": df_full, "df_state": df_state}
+    n_steps = load_env(cfg, data=data)._last_step
+    holdout_bars = cfg["training"].get("holdout_bars", 0)
+    val_end = n_steps - holdout_bars
+    val_start = val_end - eval_bars
+    if val_start <= 0:
+        raise ValueError(f"Dữ liệu ({n_steps} nến) không đủ cho đoạn validation {eval_bars} nến "
+                         f"+ holdout {holdout_bars} nến")
+
+    env = build_env(cfg, dataset, df_full, df_state, end_step=val_start)
+    save_horizon(trial_dir, val_start, n_steps)
+    checkpoints = find_checkpoints(trial_dir)
+    if checkpoints:
+        model = model_cls.load(checkpoints[-1], env=env, device=device)
+        buffer_path = f"{prefix}_replay_buffer_{model.num_timesteps}_steps.pkl"
+        if os.path.exists(buffer_path):
+            # Như model.load_replay_buffer nhưng nhận cả CompactReplayBuffer (không kế thừa ReplayBuffer)
+            model.replay_buffer = load_from_pkl(buffer_path)
+            model.replay_buffer.device = model.device
+            os.remove(buffer_path)  # Chỉ giữ buffer của mốc mới nhất
+    else:
+        model = build_model(cfg, env, dataset, device)
+
+    model.learn(
+        total_timesteps=max(timesteps - model.num_timesteps, 0),
+        callback=make_callbacks(cfg, env, trial_dir),
+        tb_log_name=f"trial_{trial:03d}",
+        reset_num_timesteps=not checkpoints
+    )
+    checkpoint = f"{prefix}_{model.num_timesteps}_steps.zip"
+    model.save(checkpoint)
+    if getattr(model, "replay_buffer", None) is not None:
+        # Off-policy: mốc sau train tiếp với đúng replay buffer đang có
+        model.save_replay_buffer(f"{prefix}_replay_buffer_{model.num_timesteps}_steps.pkl")
+    env.close()
+    train_seconds = time.perf_counter() - t0
+
+    validation = BatchedTradingVecEnv(
+        n_envs=1,
+        model_type=model_type,
+        initial_balance=cfg["env"]["initial_balance"],
+        fee_rate=cfg["env"]["fee_rate"],
+        lean_info=True,
+        start_steps=[val_start],
+        end_steps=[val_end],
+        **data
+    )
+    actions = rollout(model, validation, eval_bars)
+    stats = Backtester.from_env(validation).run(actions[0], start=val_start)["stats"].iloc[0].to_dict()
+    return {
+        "timesteps": model.num_timesteps,
+        "checkpoint": checkpoint,
+        "train_seconds": train_seconds,
+        **{key: value.item() if hasattr(value, "item") else value for key, value in stats.items()},
+    }
+
+
+def open_results(db_path):
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    columns = ", ".join(f"{name} {kind}" for name, kind in RESULT_COLUMNS.items())
+    conn.execute(f"CREATE TABLE IF NOT EXISTS results ({columns})")
+    return conn
+
+
+def save_results(conn, rows):
+    names = list(RESULT_COLUMNS)
+    conn.executemany(f"INSERT INTO results ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                     [[row.get(name) for name in names] for row in rows])
+    conn.commit()
+
+
+def leaderboard(conn, sweep):
+    # Mốc cao nhất mỗi run đạt được (run bị dừng sớm xếp sau, run lỗi xếp cuối), xếp theo metric
+    return pd.read_sql_query(
+        "SELECT trial, MAX(rung) AS rung, timesteps, status, metric, sharpe, total_return, max_drawdown, "
+        "n_trades, params FROM results WHERE sweep = ? GROUP BY trial "
+        "ORDER BY status = 'failed', rung DESC, metric DESC",
+        conn, params=(sweep,))
+
+
+def run_sweep(cfg, name, workers, threads=None):
+    """
+    Successive halving: mọi run train tới mốc đầu song song trên pool process (mỗi process 1 phần core),
+    đánh giá trên đoạn validation; chỉ 1/eta run tốt nhất train tiếp tới mốc sau, các run còn lại dừng.
+    Mỗi mốc của mỗi run ghi 1 dòng vào bảng `results` (SQLite).
+    """
+    sweep_cfg = cfg["sweep"]
+    trials = expand_params(sweep_cfg, seed=cfg["seed"])
+    eta = sweep_cfg.get("eta", 3)
+    rungs = rung_schedule(sweep_cfg.get("min_timesteps", cfg["training"]["total_timesteps"]),
+                          sweep_cfg.get("max_timesteps") or cfg["training"]["total_timesteps"], eta)
+    eval_bars = sweep_cfg.get("eval_bars", 2160)
+    metric = sweep_cfg.get("metric", "sharpe")
+    sign = -1.0 if metric.startswith("-") else 1.0  # "-max_drawdown": nhỏ hơn = tốt hơn
+    metric = metric.lstrip("-")
+
+    out_dir = os.path.join(cfg["paths"]["models_dir"], "sweeps", name)
+    logs_dir = os.path.join(cfg["paths"]["logs_dir"], "sweeps", name) if cfg["paths"].get("logs_dir") else None
+    slots = plan_slots(cfg, min(workers, len(trials)), threads)
+    print(f"Sweep '{name}': {len(trials)} run ({sweep_cfg.get('method', 'grid')}), mốc {rungs}, eta {eta}, "
+          f"validation {eval_bars} nến trước holdout {cfg['training'].get('holdout_bars', 0)} nến, metric {'-' if sign < 0 else ''}{metric}")
+    print(f"Pool: {len(slots)} process x {slots[0]['threads']} thread | "
+          + ", ".join(f"cpu {format_cpus(s['cpus'])}" for s in slots))
+
+    conn = open_results(sweep_cfg.get("results") or os.path.join(cfg["paths"]["models_dir"], "sweeps", "results.sqlite"))
+    # spawn: process con import torch/numpy với số thread của run (không kế thừa trạng thái của process chính)
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    for slot in slots:
+        queue.put(slot)
+
+    alive = list(range(len(trials)))
+    t_sweep = time.perf_counter()
+    with worker_thread_env(slots[0]["threads"]), \
+            ProcessPoolExecutor(max_workers=len(slots), mp_context=ctx, initializer=_init_worker,
+                                initargs=(queue,)) as pool:
+        for rung, timesteps in enumerate(rungs):
+            t0 = time.perf_counter()
+            futures = {
+                pool.submit(run_rung, i, trial_config(cfg, trials[i], logs_dir), timesteps,
+                            os.path.join(out_dir, f"trial_{i:03d}"), eval_bars): i
+                for i in alive
+            }
+            results = {}
+            for fut in as_completed(futures):
+                i = futures[fut]
+                try:
+                    results[i] = fut.result()
+                    results[i]["metric"] = sign * results[i][metric]  # Cột metric: luôn cao = tốt
+                    print(f"   -> trial {i:03d} @ {results[i]['timesteps']}: {metric} {results[i][metric]:.3f} "
+                          f"({results[i]['train_seconds']:.0f}s) {trials[i]}")
+                except Exception as e:
+                    results[i] = {"error": repr(e)}
+                    print(f"   -> trial {i:03d} FAILED: {e!r}")
+
+            # Giữ ceil(n / eta) run tốt nhất cho mốc sau; mốc cuối: mọi run còn lại hoàn thành
+            ranked = sorted((i for i in alive if "error" not in results[i]),
+                            key=lambda i: results[i]["metric"], reverse=True)
+            last = rung == len(rungs) - 1
+            keep = ranked if last else ranked[:max(1, math.ceil(len(alive) / eta))]
+            rows = []
+            for i in alive:
+                status = "failed" if "error" in results[i] else "completed" if last \
+                    else "promoted" if i in keep else "stopped"
+                if status in ("stopped", "failed"):
+                    # Run không train tiếp: bỏ replay buffer (chỉ cần để resume), giữ checkpoint để xem lại
+                    for path in glob.glob(os.path.join(out_dir, f"trial_{i:03d}", "*_replay_buffer_*.pkl")):
+                        os.remove(path)
+                rows.append({"sweep": name, "trial": i, "rung": rung, "timesteps": timesteps, "status": status,
+                             "params": json.dumps(trials[i]), "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                             **results[i]})
+            save_results(conn, rows)
+            print(f"Rung {rung} ({timesteps} steps): {len(alive)} run trong {time.perf_counter() - t0:.0f}s "
+                  f"-> giữ {len(keep) if not last else 0}, dừng {len(alive) - len(keep)}")
+            alive = keep
+            if not alive:
+                break
+
+    print(f"Sweep xong trong {time.perf_counter() - t_sweep:.0f}s")
+    board = leaderboard(conn, name)
+    conn.close()
+    return board
+
+
+if __name__ == "__main__":
+    cfg = load_config()
+    sweep_cfg = cfg.setdefault("sweep", {})
+
+    parser = argparse.ArgumentParser(description="Sweep siêu tham số (grid/random) với successive halving")
+    parser.add_argument("--name", default=None, help="Tên sweep (thư mục model + cột `sweep` trong bảng kết quả)")
+    parser.add_argument("--method", choices=["grid", "random"], default=None, help="Ghi đè sweep.method")
+    parser.add_argument("--n-trials", type=int, default=None, help="Ghi đè sweep.n_trials (random)")
+    parser.add_argument("--workers", type=int, default=sweep_cfg.get("workers", 4), help="Số run song song")
+    parser.add_argument("--threads", type=int, default=sweep_cfg.get("threads_per_run"), help="Số thread/core mỗi run")
+    parser.add_argument("--cpus", default=None, help="Tập core dùng cho cả sweep, VD 0-31 (ghi đè system.cpus)")
+    parser.add_argument("--min-timesteps", type=int, default=None, help="Ghi đè sweep.min_timesteps")
+    parser.add_argument("--max-timesteps", type=int, default=None, help="Ghi đè sweep.max_timesteps")
+    args = parser.parse_args()
+
+    for key in ("method", "n_trials", "min_timesteps", "max_timesteps"):
+        if getattr(args, key) is not None:
+            sweep_cfg[key] = getattr(args, key)
+    if args.cpus is not None:
+        cfg["system"]["cpus"] = args.cpus
+
+    name = args.name or time.strftime("%Y%m%d_%H%M%S")
+    board = run_sweep(cfg, name, args.workers, args.threads)
+    print(board.to_string(index=False))
@@ -1,100 +1,232 @@
+import argparse
+import os
+
 import yaml
+
+from cpu_budget import plan_budget, apply_budget, worker_thread_env, format_cpus
+
+
+def load_config():
+    with open('../config.yaml', 'r', encoding='utf-8') as f: # Thêm encoding='utf-8'
+        return yaml.safe_load(f)
+
+
+def subproc_workers(cfg):
+    # Số process env worker (chỉ SubprocVecEnv tạo process riêng)
+    n_envs = cfg['system'].get('n_envs', 1)
+    return n_envs if n_envs > 1 and cfg['system'].get('vec_env', 'subproc') == 'subproc' else 0
+
+
+if __name__ == "__main__":
+    # Ngân sách thread/core của learner phải áp dụng TRƯỚC khi import numpy/torch/SB3 bên dưới
+    parser = argparse.ArgumentParser(description="Train PPO/DQN")
+    parser.add_argument("--cpus", default=None, help="Tập core của lần chạy này, VD 0-7 (ghi đè system.cpus)")
+    parser.add_argument("--seed", type=int, default=None, help="Ghi đè seed, model lưu vào thư mục riêng _seed<N>")
+    parser.add_argument("--holdout-bars", type=int, default=None,
+                        help="Giữ N nến cuối ngoài dữ liệu train cho evaluate.py (ghi đè training.holdout_bars)")
+    ARGS = parser.parse_args()
+    CFG = load_config()
+    if ARGS.cpus is not None:
+        CFG['system']['cpus'] = ARGS.cpus
+    if ARGS.holdout_bars is not None:
+        CFG['training']['holdout_bars'] = ARGS.holdout_bars
+    if ARGS.seed is not None:
+        CFG['seed'] = ARGS.seed
+        CFG['project_name'] = f"{CFG['project_name']}_seed{ARGS.seed}"
+    BUDGET = plan_budget(CFG['system'], subproc_workers(CFG))
+    apply_budget(BUDGET['learner'])
+
 import pandas as pd
-import os
 import torch
 from stable_baselines3 import PPO, DQN
 from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
 from stable_baselines3.common.utils import set_random_seed
-from stable_baselines3.common.callbacks import CheckpointCallback
+from stable_baselines3.common.callbacks import CallbackList, CheckpointCallback
 import gymnasium as gym
 
 # Import môi trường
 from env import BitcoinTradingEnv
+from vec_env import BatchedTradingVecEnv
+from data.columnar import is_dataset
+from policy_runtime import export_policy
+from replay_buffer import CompactReplayBuffer
+from callbacks import CpuUsageCallback, ThroughputCallback
+from backtest import load_env
+from evaluate import save_horizon
+from profiling import ProfiledEnv, TimedVecEnv
 
 
-def load_config():
-    with open('../config.yaml', 'r', encoding='utf-8') as f: # Thêm encoding='utf-8'
-        return yaml.safe_load(f)
-
 # Hàm tạo môi trường (Bắt buộc phải tách ra hàm riêng để chạy song song)
-def make_env(rank, df_full, df_state, cfg, seed=0):
+def make_env(rank, df_full, df_state, cfg, seed=0, dataset=None, budget=None, end_step=None):
+    # dataset là đường dẫn (chuỗi) -> mỗi worker tự memmap, không pickle DataFrame sang worker
+    # budget: số thread + core của worker (áp dụng trong chính process worker)
     def _init():
+        if budget is not None:
+            apply_budget(budget)
         env = BitcoinTradingEnv(
             df_full=df_full,
             df_state=df_state,
+            dataset=dataset,
             model_type=cfg['model_type'],
             initial_balance=cfg['env']['initial_balance'],
-            fee_rate=cfg['env']['fee_rate']
+            fee_rate=cfg['env']['fee_rate'],
+            lean_info=cfg['env'].get('lean_info', False),
+            end_step=end_step
         )
+        if cfg.get('profiling', {}).get('enabled'):
+            env = ProfiledEnv(env)  # Đo thời gian step / reward / obs ngay trong process worker
         env.reset(seed=seed + rank)
         return env
 
     return _init
 
 
-def main():
-    # 1. Load Config
-    cfg = load_config()
-    device = cfg['system'].get('device', 'auto')
-    print(f"Training on DEVICE: {device.upper()}")
+def load_data(cfg):
+    # -> (dataset, df_full, df_state): dataset dạng cột thì chỉ truyền đường dẫn, không thì 2 DataFrame CSV
+    dataset = cfg['paths'].get('dataset')
+    if dataset and is_dataset(dataset):
+        # Dataset dạng cột: không parse CSV, các env đọc qua memmap
+        print(f"Loading data (columnar, memmap): {dataset}")
+        return dataset, None, None
 
-    # 2. Load Dữ liệu
     print("Loading data...")
     df_full = pd.read_csv(cfg['paths']['data_full'])
     df_state = pd.read_csv(cfg['paths']['data_state'])
 
     min_len = min(len(df_full), len(df_state))
-    df_full = df_full.iloc[:min_len]
-    df_state = df_state.iloc[:min_len]
+    return None, df_full.iloc[:min_len], df_state.iloc[:min_len]
 
+
+def build_env(cfg, dataset, df_full, df_state, budget=None, end_step=None):
+    # end_step: chỉ train trên các nến trước bước này (sweep.py giữ phần sau làm đoạn held-out)
     n_envs = cfg['system'].get('n_envs', 1)
-    print(f"Creating {n_envs} parallel environments...")
+    vec_env_type = cfg['system'].get('vec_env', 'subproc')
+    print(f"Creating {n_envs} parallel environments ({vec_env_type})...")
 
-    if n_envs > 1:
+    if vec_env_type == 'batched':
+        # BatchedTradingVecEnv: N env trong 1 process, mỗi step là 1 lượt NumPy (không IPC)
+        env = BatchedTradingVecEnv(
+            df_full=df_full,
+            df_state=df_state,
+            n_envs=n_envs,
+            model_type=cfg['model_type'],
+            initial_balance=cfg['env']['initial_balance'],
+            fee_rate=cfg['env']['fee_rate'],
+            lean_info=cfg['env'].get('lean_info', False),
+            dataset=dataset,
+            end_steps=None if end_step is None else [end_step] * n_envs
+        )
+    elif n_envs > 1 and vec_env_type == 'subproc':
         # SubprocVecEnv: Chạy trên nhiều core CPU (Đa luồng thực sự)
-        env = SubprocVecEnv([make_env(i, df_full, df_state, cfg) for i in range(n_envs)])
+        # Worker khởi động với biến môi trường số thread của worker (không kế thừa số thread của learner)
+        with worker_thread_env(cfg['system'].get('env_threads', 1)):
+            env = SubprocVecEnv([make_env(i, df_full, df_state, cfg, dataset=dataset, budget=budget['workers'][i],
+                                          end_step=end_step) for i in range(n_envs)])
     else:
         # DummyVecEnv: Chạy trên 1 luồng (Dành cho debug hoặc máy yếu)
-        env = DummyVecEnv([make_env(0, df_full, df_state, cfg)])
+        env = DummyVecEnv([make_env(i, df_full, df_state, cfg, dataset=dataset, end_step=end_step)
+                           for i in range(n_envs)])
+
+    if cfg.get('profiling', {}).get('enabled'):
+        env = TimedVecEnv(env)  # Thời gian learner chờ env step (gồm IPC) cho ThroughputCallback
+    return env
 
-    # 4. Khởi tạo Model với tham số 'device'
-    model_type = cfg['model_type'].upper()
-    save_dir = os.path.join(cfg['paths']['models_dir'], f"{model_type}_{cfg['project_name']}")
 
+def build_model(cfg, env, dataset, device):
+    model_type = cfg['model_type'].upper()
     if model_type == "PPO":
-        model = PPO(
+        return PPO(
             env=env,
             device=device,
             tensorboard_log=cfg['paths']['logs_dir'],
             seed=cfg['seed'],
             **cfg['ppo_params']
         )
-    elif model_type == "DQN":
-        model = DQN(
-            env=env,
-            device=device,
-            tensorboard_log=cfg['paths']['logs_dir'],
-            seed=cfg['seed'],
-            **cfg['dqn_params']
+
+    buffer_cfg = cfg.get('replay_buffer', {})
+    buffer_kwargs = {}
+    if buffer_cfg.get('type', 'sb3') == 'compact':
+        # Không lưu obs: chỉ hàng dataset + vị thế/PnL mỗi transition, obs dựng lại lúc sample
+        buffer_kwargs = dict(
+            replay_buffer_class=CompactReplayBuffer,
+            replay_buffer_kwargs={'dataset': dataset or cfg['paths']['data_state'],
+                                  'storage_dir': buffer_cfg.get('storage_dir')}
         )
+    return DQN(
+        env=env,
+        device=device,
+        tensorboard_log=cfg['paths']['logs_dir'],
+        seed=cfg['seed'],
+        **buffer_kwargs,
+        **cfg['dqn_params']
+    )
 
-    # 5. Callback & Train
+
+def make_callbacks(cfg, env, save_dir):
+    # Checkpoint định kỳ (evaluate.py / sweep.py đọc lại theo tên <MODEL>_model_<bước>_steps.zip) + báo cáo CPU
+    n_envs = env.num_envs
     checkpoint_callback = CheckpointCallback(
-        save_freq=cfg['training']['save_interval'] // n_envs,  # Điều chỉnh freq theo số env
+        save_freq=max(cfg['training']['save_interval'] // n_envs, 1),  # Điều chỉnh freq theo số env
         save_path=save_dir,
-        name_prefix=f"{model_type}_model"
+        name_prefix=f"{cfg['model_type'].upper()}_model"
     )
 
+    callbacks = [checkpoint_callback]
+    report_seconds = cfg['system'].get('usage_report_seconds', 60)
+    if report_seconds:
+        pids = {'learner': os.getpid()}
+        pids.update({f"env{i}": p.pid for i, p in enumerate(getattr(env, 'processes', []))})
+        callbacks.append(CpuUsageCallback(pids, interval=report_seconds))
+    profiling = cfg.get('profiling', {})
+    if profiling.get('enabled'):
+        callbacks.append(ThroughputCallback(interval=profiling.get('report_seconds', 30),
+                                            sample_seconds=profiling.get('sample_seconds', 10),
+                                            sample_interval=profiling.get('sample_interval_ms', 5) / 1000,
+                                            out_dir=save_dir))
+    return CallbackList(callbacks)
+
+
+def main(cfg, budget):
+    # 1. Config + ngân sách CPU (learner đã áp dụng lúc khởi động)
+    learner = budget['learner']
+    print(f"Learner: {learner['threads']} thread, cpu {format_cpus(learner['cpus'])} | "
+          f"{len(budget['workers'])} env worker x {cfg['system'].get('env_threads', 1)} thread")
+    device = cfg['system'].get('device', 'auto')
+    print(f"Training on DEVICE: {device.upper()}")
+
+    # 2. Load Dữ liệu + môi trường
+    dataset, df_full, df_state = load_data(cfg)
+    # holdout_bars > 0 (chỉ khi cần đánh giá): giữ N nến cuối ngoài dữ liệu train cho evaluate.py.
+    # Mặc định 0: model chạy live train trên toàn bộ dữ liệu
+    data = {'dataset': dataset} if dataset else {'df_full': df_full, 'df_state': df_state}
+    n_steps = load_env(cfg, data=data)._last_step
+    holdout_bars = cfg['training'].get('holdout_bars', 0)
+    end_step = n_steps - holdout_bars if holdout_bars else None
+    if end_step is not None and end_step <= 0:
+        raise ValueError(f"Dữ liệu ({n_steps} nến) không đủ để giữ lại {holdout_bars} nến held-out")
+    print(f"Train trên {end_step or n_steps}/{n_steps} nến" + (f", giữ {holdout_bars} nến cuối" if end_step else ""))
+    env = build_env(cfg, dataset, df_full, df_state, budget, end_step=end_step)
+
+    # 4. Khởi tạo Model với tham số 'device'
+    model_type = cfg['model_type'].upper()
+    save_dir = os.path.join(cfg['paths']['models_dir'], f"{model_type}_{cfg['project_name']}")
+    # Luôn ghi mốc (train toàn bộ -> end_step = n_steps): mốc cũ của lần train có holdout không được ở lại
+    save_horizon(save_dir, end_step or n_steps, n_steps)
+    model = build_model(cfg, env, dataset, device)
+
+    # 5. Callback & Train
     print(f"Start training...")
     model.learn(
         total_timesteps=cfg['training']['total_timesteps'],
-        callback=checkpoint_callback,
+        callback=make_callbacks(cfg, env, save_dir),
         tb_log_name=model_type
     )
 
     model.save(os.path.join(save_dir, "final_model"))
+    # Bản NumPy của policy cho bot live (live.policy_runtime: "numpy")
+    export_policy(os.path.join(save_dir, "final_model.zip"), model_type=model_type)
     print("Training finished & Saved.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(CFG, BUDGET)
\ No newline at end of file
@@ -0,0 +1,168 @@
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+
+from env import BitcoinTradingEnv
+
+
+class BatchedTradingVecEnv(VecEnv):
+    """
+    VecEnv chạy N bản BitcoinTradingEnv trong cùng 1 process.
+
+    Thay vì N object env (SubprocVecEnv: pickle DataFrame sang từng worker + IPC mỗi bước),
+    toàn bộ trạng thái tài khoản được giữ dưới dạng mảng (N,) và mỗi step là 1 lượt NumPy:
+    ActionPPO/ActionDQN.step_batch -> phí + PnL -> RewardHandler.calculate_batch.
+    Env nào kết thúc sẽ tự reset (giống DummyVecEnv/SubprocVecEnv).
+    """
+
+    def __init__(self, df_full=None, df_state=None, n_envs=1, model_type='DQN', initial_balance=10000,
+                 fee_rate=0.0004, lean_info=False, dataset=None, start_steps=None, end_steps=None):
+        # Env mẫu: dùng chung mảng giá/state, action handler, reward handler và space
+        self.template = BitcoinTradingEnv(df_full, df_state, model_type=model_type,
+                                          initial_balance=initial_balance, fee_rate=fee_rate, dataset=dataset)
+        self.model_type = model_type
+        self.initial_balance = initial_balance
+        self.fee_rate = fee_rate
+        self.lean_info = lean_info
+        self.render_mode = None
+
+        self._close = self.template._close
+        self._state = self.template._state
+        self._trend = self.template._trend
+        self._n_market = self.template._n_market
+        self._last_step = self.template._last_step
+        self.action_handler = self.template.action_handler
+        self.reward_handler = self.template.reward_handler
+
+        # Trạng thái tài khoản của N env
+        self.net_worth = np.full(n_envs, float(initial_balance))
+        self.max_net_worth = np.full(n_envs, float(initial_balance))
+        self.pos_tracker = np.zeros(n_envs)
+        self.current_step = np.zeros(n_envs, dtype=np.int64)
+
+        # Đoạn dữ liệu của từng env (mặc định cả chuỗi): reset về start_steps, kết thúc tại end_steps.
+        # Dùng cho đánh giá out-of-sample (evaluate.py): mỗi env là 1 fold test.
+        self.start_steps = np.zeros(n_envs, dtype=np.int64) if start_steps is None \
+            else np.asarray(start_steps, dtype=np.int64)
+        self.end_steps = np.full(n_envs, self._last_step, dtype=np.int64) if end_steps is None \
+            else np.minimum(np.asarray(end_steps, dtype=np.int64), self._last_step)
+
+        self._obs_buf = np.zeros((n_envs,) + self.template.obs_shape, dtype=np.float32)
+        self._actions = None
+
+        super().__init__(n_envs, self.template.observation_space, self.template.action_space)
+
+    def _reset_envs(self, idx):
+        self.net_worth[idx] = self.initial_balance
+        self.max_net_worth[idx] = self.initial_balance
+        self.pos_tracker[idx] = 0.0
+        self.current_step[idx] = self.start_steps[idx]
+
+    def _fill_observation(self, idx=slice(None)):
+        obs = self._obs_buf
+        obs[idx, :self._n_market] = self._state[self.current_step[idx]]
+        obs[idx, self._n_market] = self.pos_tracker[idx]
+        obs[idx, self._n_market + 1] = (self.net_worth[idx] - self.initial_balance) / self.initial_balance
+
+    def reset(self):
+        self._reset_envs(slice(None))
+        self._fill_observation()
+        self._reset_seeds()
+        self._reset_options()
+        return self._obs_buf.copy()
+
+    def step_async(self, actions):
+        self._actions = actions
+
+    def step_wait(self):
+        t = self.current_step
+
+        # 1. Dữ liệu thị trường của từng env
+        current_price = self._close[t]
+        prev_price = self._close[np.maximum(t - 1, 0)]
+        trend_flag = self._trend[t]
+
+        # 2. Action Handler (vector hóa)
+        if self.model_type == 'DQN':
+            action_ids = np.asarray(self._actions).reshape(self.num_envs).astype(np.int64)
+            new_pos, fee_rate, _ = self.action_handler.step_batch(action_ids, self.pos_tracker)
+        else:  # PPO
+            action_vals = np.asarray(self._actions, dtype=np.float32).reshape(self.num_envs, -1)[:, 0]
+            new_pos, fee_rate, trade_type = self.action_handler.step_batch(action_vals, self.pos_tracker)
+
+        # 3. Phí + PnL
+        self.net_worth -= self.net_worth * fee_rate
+        price_change_pct = (current_price - prev_price) / prev_price
+        self.net_worth += self.net_worth * self.pos_tracker * price_change_pct
+
+        self.pos_tracker = new_pos.astype(np.float64)
+
+        # 4. Reward
+        rewards = self.reward_handler.calculate_batch(
+            net_worth=self.net_worth,
+            max_net_worth=self.max_net_worth,
+            current_price=current_price,
+            past_price=prev_price,
+            position=self.pos_tracker,
+            trend_flag=trend_flag
+        )
+
+        # 5. Bước tiếp theo + điều kiện dừng
+        self.current_step += 1
+        dones = self.current_step >= self.end_steps
+
+        blown = self.net_worth < self.initial_balance * 0.5  # Cháy tài khoản
+        dones |= blown
+        rewards = np.where(blown, -100.0, rewards)
+
+        # step: hàng dataset của obs vừa tới (trước khi auto-reset), CompactReplayBuffer dựng lại obs từ đây
+        steps = self.current_step.tolist()
+        if self.lean_info:
+            infos = [{'step': steps[i]} for i in range(self.num_envs)]
+        else:
+            if self.model_type == 'DQN':
+                names = [self.action_handler.get_action_name(a) for a in action_ids]
+            else:
+                names = [('HOLD', 'BUY', 'SELL')[k] for k in trade_type]
+            infos = [{
+                'step': steps[i],
+                'net_worth': self.net_worth[i],
+                'step_reward': rewards[i],
+                'action': names[i],
+                'position': self.pos_tracker[i]
+            } for i in range(self.num_envs)]
+
+        # Env kết thúc: lưu terminal_observation rồi reset (auto-reset như DummyVecEnv)
+        self._fill_observation()
+        done_idx = np.flatnonzero(dones)
+        if len(done_idx):
+            for i in done_idx:
+                infos[i]['terminal_observation'] = self._obs_buf[i].copy()
+                infos[i]['TimeLimit.truncated'] = False
+            self._reset_envs(done_idx)
+            self._fill_observation(done_idx)
+
+        return self._obs_buf.copy(), rewards.astype(np.float32), dones, infos
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        indices = self._get_indices(indices)
+        value = getattr(self, attr_name) if hasattr(self, attr_name) else getattr(self.template, attr_name)
+        if isinstance(value, np.ndarray) and value.shape[:1] == (self.num_envs,):
+            return [value[i] for i in indices]
+        return [value for _ in indices]
+
+    def set_attr(self, attr_name, value, indices=None):
+        current = getattr(self, attr_name, None)
+        if isinstance(current, np.ndarray) and current.shape[:1] == (self.num_envs,):
+            current[list(self._get_indices(indices))] = value
+        else:
+            setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        method = getattr(self.template, method_name)
+        return [method(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]